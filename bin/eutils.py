@@ -0,0 +1,587 @@
+"""Shared NCBI E-utilities client for the Staphit search and metadata tools.
+
+One client owns a pooled keep-alive session, a token-bucket limiter sized to
+NCBI's quota (3 requests/s, or 10 with NCBI_API_KEY), a thread pool that keeps
+up to that many requests in flight, and retries 429/5xx responses with
+exponential backoff. With a ResponseCache (ncbi_cache.py) attached, records
+are looked up per ID before anything is downloaded.
+"""
+import csv
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import requests
+from requests.adapters import HTTPAdapter
+
+EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+
+# NCBI quota in requests per second
+RATE_WITHOUT_KEY = 3
+RATE_WITH_KEY = 10
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Above this many IDs the request is POSTed to keep the URL short
+POST_ID_THRESHOLD = 200
+
+# ESearch returns at most 10,000 UIDs per request; larger result sets are paged
+ESEARCH_PAGE_SIZE = 10000
+
+# IDs uploaded per EPost call; each call yields one WebEnv/query_key result set
+EPOST_MAX_IDS = 10000
+
+# Streamed response bodies stay in memory up to this size, then spill to disk
+SPOOL_MAX_BYTES = 1024 * 1024
+
+# Stable mappings (SRA UID -> experiment accession) are cached for a year
+MAPPING_TTL = 365 * 86400
+
+_EXPXML_ACC_RE = re.compile(r'<Experiment\s+acc="([^"]+)"')
+
+
+class EUtilsError(requests.exceptions.RequestException):
+    """Raised when an E-utilities request still fails after all retries."""
+
+
+class OfflineError(EUtilsError):
+    """Raised when a request would need the network but the client is offline."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    The default capacity of one token never lets requests through faster than
+    `rate`, even after the bucket has been idle, since NCBI counts requests
+    per second.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class EUtilsClient:
+    """Rate-limited, retrying, concurrent E-utilities client.
+
+    `api_key` defaults to the NCBI_API_KEY environment variable and selects
+    the request rate; `max_workers` defaults to that rate so the pool never
+    queues more in-flight requests than the quota allows.
+    """
+
+    def __init__(self, api_key=None, rate=None, max_workers=None, max_retries=5,
+                 backoff=0.5, timeout=120, session=None, base_url=EUTILS_BASE,
+                 sleep=time.sleep, cache=None, offline=False):
+        self.api_key = api_key if api_key is not None else os.environ.get("NCBI_API_KEY")
+        if rate is None:
+            rate = RATE_WITH_KEY if self.api_key else RATE_WITHOUT_KEY
+        self.max_workers = max_workers or int(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.base_url = base_url
+        self.limiter = TokenBucket(rate, sleep=sleep)
+        self._sleep = sleep
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self.cache = cache
+        self.offline = offline
+
+    # -- transport ---------------------------------------------------------
+
+    def request(self, endpoint, params, post=False, stream=False):
+        """Send one E-utilities request, retrying 429/5xx and connection errors.
+
+        Returns the `requests.Response`; with `stream` the body is instead
+        copied in chunks to a spooled temporary file (rewound, binary), so
+        large responses never sit in memory as one string. Raises EUtilsError
+        once retries are exhausted or for any other HTTP error.
+        """
+        if self.offline:
+            raise OfflineError(f"{endpoint}: offline mode, not contacting NCBI")
+        params = dict(params)
+        if self.api_key:
+            params["api_key"] = self.api_key
+        url = f"{self.base_url}{endpoint}"
+
+        error = None
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                if post:
+                    response = self.session.post(url, data=params, timeout=self.timeout, stream=stream)
+                else:
+                    response = self.session.get(url, params=params, timeout=self.timeout, stream=stream)
+                if response.status_code not in RETRY_STATUS:
+                    try:
+                        response.raise_for_status()
+                    except requests.exceptions.HTTPError as e:
+                        raise EUtilsError(f"{endpoint}: {e}") from e
+                    return _spool(response) if stream else response
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+                retry_after = None
+
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            self._sleep(delay)
+
+        raise EUtilsError(f"{endpoint} failed after {self.max_retries + 1} attempts: {error}")
+
+    def map(self, func, items):
+        """Apply `func` to each item concurrently (bounded by the rate limit).
+
+        Results are returned in input order; the first exception is re-raised.
+        """
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(func, items))
+
+    def imap(self, func, items):
+        """Lazy, ordered `map`: at most max_workers calls run ahead of the consumer."""
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = deque()
+            for item in items:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= self.max_workers:
+                    break
+            while pending:
+                result = pending.popleft().result()
+                for item in items:
+                    pending.append(pool.submit(func, item))
+                    break
+                yield result
+
+    # -- E-utilities -------------------------------------------------------
+
+    def esearch(self, db, term, retmax=20, retstart=0, usehistory=False, **extra):
+        """Run ESearch and return the parsed `esearchresult` dict.
+
+        `count` is converted to int; with `usehistory` the result also carries
+        `webenv` and `querykey` for later EFetch calls.
+        Online, results are always fetched fresh but recorded in the cache;
+        offline, the recorded result is replayed.
+        """
+        params = {"db": db, "term": term, "retmode": "json",
+                  "retmax": retmax, "retstart": retstart}
+        if usehistory:
+            params["usehistory"] = "y"
+        params.update(extra)
+        cache_key = "|".join(f"{k}={params[k]}" for k in sorted(params) if k != "db")
+
+        if self.offline and self.cache is not None:
+            text = self.cache.get(db, cache_key, "esearch")
+            if text is None:
+                raise OfflineError(f"esearch.fcgi: no cached result for '{term}'")
+        else:
+            text = self.request("esearch.fcgi", params, post=len(term) > 2000).text
+        try:
+            result = json.loads(text).get("esearchresult", {})
+        except ValueError as e:
+            raise EUtilsError(f"esearch.fcgi returned invalid JSON: {e}") from e
+        if "ERROR" in result:
+            raise EUtilsError(f"esearch.fcgi: {result['ERROR']}")
+        if self.cache is not None and not self.offline:
+            self.cache.put(db, cache_key, "esearch", text)
+        result["count"] = int(result.get("count", 0))
+        return result
+
+    def esearch_pages(self, db, term, page_size=ESEARCH_PAGE_SIZE, limit=None, **extra):
+        """Page through every UID matching `term`, past ESearch's 10,000 cap.
+
+        Returns (count, pages): the total hit count reported by the first
+        request, and a generator yielding one UID list per ESearch call. Later
+        pages are requested via `retstart` only as the consumer advances, so
+        a sweep can feed EFetch without holding the full UID list. `limit`
+        caps the number of UIDs yielded.
+        """
+        first = self.esearch(db, term, retmax=min(page_size, limit or page_size), **extra)
+        count = first["count"]
+        total = count if limit is None else min(count, limit)
+
+        def pages():
+            result, retstart = first, 0
+            while retstart < total:
+                idlist = result.get("idlist", [])[:total - retstart]
+                if not idlist:
+                    return
+                yield idlist
+                retstart += len(idlist)
+                if retstart < total:
+                    result = self.esearch(db, term, retmax=min(page_size, total - retstart),
+                                          retstart=retstart, **extra)
+
+        return count, pages()
+
+    def efetch(self, db, ids=None, webenv=None, query_key=None, retstart=None,
+               retmax=None, rettype="full", retmode="xml", stream=False):
+        """Run EFetch by explicit ID list or by history server result set.
+
+        Returns the response body as text, or with `stream` as a binary
+        file object to hand to iter_xml_elements.
+        """
+        params = {"db": db, "rettype": rettype, "retmode": retmode}
+        if ids is not None:
+            params["id"] = ",".join(ids)
+        if webenv:
+            params["WebEnv"] = webenv
+            params["query_key"] = query_key
+        if retstart is not None:
+            params["retstart"] = retstart
+        if retmax is not None:
+            params["retmax"] = retmax
+        post = ids is not None and len(ids) > POST_ID_THRESHOLD
+        if stream:
+            return self.request("efetch.fcgi", params, post=post, stream=True)
+        return self.request("efetch.fcgi", params, post=post).text
+
+    def esummary(self, db, ids):
+        """Run ESummary for an ID list; returns the JSON `result` dict."""
+        params = {"db": db, "id": ",".join(ids), "retmode": "json"}
+        response = self.request("esummary.fcgi", params, post=len(ids) > POST_ID_THRESHOLD)
+        try:
+            return response.json().get("result", {})
+        except ValueError as e:
+            raise EUtilsError(f"esummary.fcgi returned invalid JSON: {e}") from e
+
+    def epost(self, db, ids):
+        """Upload an ID list to the history server; returns (webenv, query_key)."""
+        response = self.request("epost.fcgi", {"db": db, "id": ",".join(ids)}, post=True)
+        try:
+            root = ET.fromstring(response.content)
+        except ET.ParseError as e:
+            raise EUtilsError(f"epost.fcgi returned invalid XML: {e}") from e
+        webenv = root.findtext("WebEnv")
+        query_key = root.findtext("QueryKey")
+        if not webenv or not query_key:
+            message = root.findtext("ERROR") or "no WebEnv in response"
+            raise EUtilsError(f"epost.fcgi: {message}")
+        return webenv, query_key
+
+    def efetch_history(self, db, ids, page_size=500, stream=False, **params):
+        """EFetch `ids` through the history server in concurrent pages.
+
+        The IDs (UIDs or accessions) are uploaded with one EPost per
+        EPOST_MAX_IDS, then fetched with retstart/retmax pages over that
+        single WebEnv, several pages in flight at once. Yields each page's
+        body in order (text, or a binary file with `stream`); failed pages
+        are reported and yielded as None.
+        """
+        def pages():
+            for group in chunks(ids, EPOST_MAX_IDS):
+                try:
+                    webenv, query_key = self.epost(db, group)
+                except EUtilsError as e:
+                    print(f"Error posting {len(group)} {db} IDs: {e}", file=sys.stderr)
+                    continue
+                for retstart in range(0, len(group), page_size):
+                    yield webenv, query_key, retstart
+
+        def fetch(page):
+            webenv, query_key, retstart = page
+            try:
+                return self.efetch(db, webenv=webenv, query_key=query_key, retstart=retstart,
+                                   retmax=page_size, stream=stream, **params)
+            except EUtilsError as e:
+                print(f"Error fetching {db} records {retstart}-{retstart + page_size}: {e}",
+                      file=sys.stderr)
+                return None
+
+        return self.imap(fetch, pages())
+
+    # -- cached record access ---------------------------------------------
+
+    def cached_records(self, db, rettype, ids, fetch_batch, split, batch_size=200, ttl=None,
+                       retmode="xml"):
+        """Resolve records by ID, downloading only those missing from the cache.
+
+        `fetch_batch(id_list)` returns a raw response for a batch of missing
+        IDs and `split(response)` yields (id, record_text) pairs from it. Batches
+        are fetched concurrently and failed batches are reported and skipped.
+        With `fetch_batch=None` the missing IDs are fetched via efetch_history
+        (`rettype`/`retmode` pages of `batch_size`) instead.
+        Returns a dict of id -> record text (in first-seen order).
+        """
+        records = {}
+        missing = []
+        for record_id in dict.fromkeys(ids):
+            text = self.cache.get(db, record_id, rettype) if self.cache is not None else None
+            if text is None:
+                missing.append(record_id)
+            else:
+                records[record_id] = text
+
+        if missing and self.offline:
+            print(f"Warning: {len(missing)} {db} {rettype} records not in cache (offline); skipping.",
+                  file=sys.stderr)
+            return records
+
+        def fetch(batch):
+            try:
+                return list(split(fetch_batch(batch)))
+            except (EUtilsError, ET.ParseError, ValueError) as e:
+                print(f"Error fetching {len(batch)} {db} records: {e}", file=sys.stderr)
+                return []
+
+        def split_page(text):
+            try:
+                return list(split(text)) if text is not None else []
+            except (ET.ParseError, ValueError) as e:
+                print(f"Error parsing {db} response: {e}", file=sys.stderr)
+                return []
+
+        if fetch_batch is None:
+            results = map(split_page, self.efetch_history(db, missing, page_size=batch_size,
+                                                          rettype=rettype, retmode=retmode))
+        else:
+            results = self.map(fetch, list(chunks(missing, batch_size)))
+        for pairs in results:
+            if self.cache is not None:
+                self.cache.put_many(db, rettype, pairs, ttl=ttl)
+            records.update(pairs)
+        return records
+
+    def sra_experiment_accessions(self, uids, batch_size=500):
+        """Map SRA UIDs to experiment accessions (SRX/ERX/DRX) via cached ESummary."""
+        def split(result):
+            for uid in result.get("uids", []):
+                match = _EXPXML_ACC_RE.search(result.get(uid, {}).get("expxml", ""))
+                if match:
+                    yield uid, match.group(1)
+
+        return self.cached_records("sra", "experiment_acc", uids,
+                                   lambda batch: self.esummary("sra", batch),
+                                   split, batch_size=batch_size, ttl=MAPPING_TTL)
+
+    def iter_xml_records(self, db, rettype, ids, fetch_batch, tag, key_fn,
+                         batch_size=200, ttl=None):
+        """Stream (id, element) pairs for `ids`, downloading only cache misses.
+
+        Cached records are parsed one at a time; misses are fetched in
+        concurrent batches (`fetch_batch(id_list)` must return a streamed
+        EFetch body, or None to page them through efetch_history) and parsed
+        with iterparse. Each element is cleared once the consumer moves on,
+        so memory stays flat however large the batch. Newly fetched records
+        are stored under `key_fn(element)`.
+        """
+        missing = []
+        for record_id in dict.fromkeys(ids):
+            text = self.cache.get(db, record_id, rettype) if self.cache is not None else None
+            if text is None:
+                missing.append(record_id)
+            else:
+                yield record_id, ET.fromstring(text)
+
+        if missing and self.offline:
+            print(f"Warning: {len(missing)} {db} {rettype} records not in cache (offline); skipping.",
+                  file=sys.stderr)
+            return
+
+        def fetch(batch):
+            try:
+                return fetch_batch(batch)
+            except EUtilsError as e:
+                print(f"Error fetching {len(batch)} {db} records: {e}", file=sys.stderr)
+                return None
+
+        if fetch_batch is None:
+            sources = self.efetch_history(db, missing, page_size=batch_size, stream=True,
+                                          rettype=rettype)
+        else:
+            sources = self.imap(fetch, chunks(missing, batch_size))
+        for source in sources:
+            if source is None:
+                continue
+            fetched = []
+            try:
+                for elem in iter_xml_elements(source, tag):
+                    key = key_fn(elem)
+                    if self.cache is not None and key:
+                        elem.tail = None
+                        fetched.append((key, ET.tostring(elem, encoding="unicode")))
+                    yield key, elem
+            except ET.ParseError as e:
+                print(f"Error parsing {db} response: {e}", file=sys.stderr)
+            finally:
+                source.close()
+                if fetched:
+                    self.cache.put_many(db, rettype, fetched, ttl=ttl)
+
+    def iter_sra_packages(self, uids, batch_size=200):
+        """Stream SRA EXPERIMENT_PACKAGE elements covering `uids`.
+
+        Without a cache this is one streamed EFetch per batch. With a cache,
+        UIDs are first mapped to experiment accessions so that each package
+        is stored and reused individually. `uids` may be any iterable (e.g. a
+        paged ESearch); it is consumed lazily, a few batches at a time.
+        """
+        if self.cache is None:
+            def fetch(batch):
+                try:
+                    return self.efetch("sra", ids=batch, stream=True)
+                except EUtilsError as e:
+                    print(f"Error fetching {len(batch)} sra records: {e}", file=sys.stderr)
+                    return None
+            for source in self.imap(fetch, chunks(uids, batch_size)):
+                if source is None:
+                    continue
+                try:
+                    yield from iter_xml_elements(source, "EXPERIMENT_PACKAGE")
+                except ET.ParseError as e:
+                    print(f"Error parsing sra response: {e}", file=sys.stderr)
+                finally:
+                    source.close()
+            return
+
+        # Map and fetch one pool's worth of batches at a time
+        for group in chunks(uids, batch_size * self.max_workers):
+            uid_to_acc = self.sra_experiment_accessions(group)
+            acc_to_uid = {acc: uid for uid, acc in uid_to_acc.items()}
+            records = self.iter_xml_records(
+                "sra", "full", list(acc_to_uid),
+                lambda accs: self.efetch("sra", ids=[acc_to_uid[a] for a in accs], stream=True),
+                "EXPERIMENT_PACKAGE", sra_package_accession, batch_size=batch_size)
+            for _, package in records:
+                yield package
+
+
+def _spool(response):
+    """Copy a streamed response body into a rewound binary temporary file."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        for block in response.iter_content(64 * 1024):
+            spool.write(block)
+    except BaseException:
+        spool.close()
+        raise
+    finally:
+        response.close()
+    spool.seek(0)
+    return spool
+
+
+def iter_xml_elements(source, tag):
+    """Stream every `tag` element of an XML document with iterparse.
+
+    `source` may be text, bytes or a binary file object. Each element is
+    yielded once complete and cleared (and detached from the document root)
+    when the consumer asks for the next one, so peak memory is one record.
+    """
+    if isinstance(source, str):
+        source = io.BytesIO(source.encode("utf-8"))
+    elif isinstance(source, bytes):
+        source = io.BytesIO(source)
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if root is None:
+            root = elem
+        if event == "end" and elem.tag == tag:
+            yield elem
+            elem.clear()
+            if elem is not root:
+                root.clear()
+
+
+def sra_package_accession(package):
+    """Experiment accession (SRX/ERX/DRX) of an EXPERIMENT_PACKAGE element."""
+    experiment = package.find("EXPERIMENT")
+    return experiment.get("accession") if experiment is not None else None
+
+
+def biosample_accession(sample):
+    """Accession (SAMN/SAMEA/SAMD) of a BioSample element."""
+    return sample.get("accession")
+
+
+def split_xml_records(text, record_tag, key_fn):
+    """Yield (key, serialized element) for every `record_tag` element in `text`."""
+    for elem in iter_xml_elements(text, record_tag):
+        key = key_fn(elem)
+        if key:
+            elem.tail = None
+            yield key, ET.tostring(elem, encoding="unicode")
+
+
+def split_sra_packages(text):
+    """Split an SRA EFetch response into EXPERIMENT_PACKAGEs keyed by experiment accession."""
+    return split_xml_records(text, "EXPERIMENT_PACKAGE", sra_package_accession)
+
+
+def split_runinfo(text):
+    """Split an SRA RunInfo CSV into per-run records (header line + row) keyed by Run."""
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    if not lines:
+        return
+    header = lines[0]
+    columns = next(csv.reader([header]))
+    if "Run" not in columns:
+        return
+    run_idx = columns.index("Run")
+    for line in lines[1:]:
+        if line == header:
+            continue
+        row = next(csv.reader([line]))
+        if len(row) > run_idx and row[run_idx]:
+            yield row[run_idx], f"{header}\n{line}"
+
+
+def join_runinfo(records):
+    """Rebuild a RunInfo CSV document from records produced by split_runinfo."""
+    header = None
+    lines = []
+    for record in records:
+        record_header, line = record.split("\n", 1)
+        header = header or record_header
+        lines.append(line)
+    return "\n".join([header] + lines) if header else ""
+
+
+def chunks(items, size):
+    """Split any iterable into consecutive lists of at most `size` items, lazily."""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,180 @@
+"""Shared FASTQ directory scanner used by mrsa-prepare and prepare_samplesheet.py.
+
+Directories are listed with os.scandir, several at a time in a thread pool,
+and every file name is classified by a single compiled regex. With a
+manifest file, the listing of each directory is cached with its mtime and
+the size of each FASTQ: directories whose mtime has not changed are not
+listed or matched again (their known FASTQs are only re-stat'ed to pick up
+files still being written), so rescanning a large share only lists new or
+changed directories.
+"""
+import fnmatch
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+MANIFEST_VERSION = 1
+
+# <sample>[_R1|_R2[_001]|_1|_2[_001]].fastq|fq[.gz]; the read group is
+# optional so unpaired FASTQs are recognised (read=None) by the same match
+FASTQ_RE = re.compile(
+    r'^(?P<sample>.+?)'
+    r'(?:_(?:R(?P<illumina_read>[12])(?:_\d+)?|(?P<read>[12])(?:_001)?))?'
+    r'\.(?:fastq|fq)(?:\.gz)?$',
+    re.IGNORECASE,
+)
+
+FastqFile = namedtuple("FastqFile", ["path", "sample", "read", "size", "mtime_ns"])
+
+
+def classify(name):
+    """Return (sample, read) for a FASTQ file name, read being '1', '2' or None.
+
+    Returns None when the name is not a FASTQ file.
+    """
+    match = FASTQ_RE.match(name)
+    if not match:
+        return None
+    return match.group("sample"), match.group("illumina_read") or match.group("read")
+
+
+def _scan_dir(path, cached):
+    """List one directory, or reuse the cached listing when its mtime is unchanged."""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError as e:
+        print(f"Warning: cannot access '{path}': {e}", file=sys.stderr)
+        return path, None
+    if cached is not None and cached.get("mtime_ns") == mtime_ns:
+        files = []
+        for name, sample, read, _, _ in cached["files"]:
+            try:
+                st = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            files.append([name, sample, read, st.st_size, st.st_mtime_ns])
+        return path, {**cached, "files": files}
+
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    continue
+                found = classify(entry.name)
+                if found is None or not entry.is_file():
+                    continue
+                st = entry.stat()
+                files.append([entry.name, found[0], found[1], st.st_size, st.st_mtime_ns])
+    except OSError as e:
+        print(f"Warning: cannot list '{path}': {e}", file=sys.stderr)
+        return path, None
+    return path, {"mtime_ns": mtime_ns, "files": files, "subdirs": subdirs}
+
+
+def load_manifest(path):
+    """Read a manifest written by save_manifest; unreadable files count as empty."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("dirs", {})
+
+
+def save_manifest(path, dirs):
+    """Write the per-directory listings atomically (temp file + rename)."""
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=parent, prefix=".fastq_manifest.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "dirs": dirs}, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def scan_fastqs(root, recursive=True, manifest=None, pattern=None, workers=None):
+    """Find every FASTQ file under `root`.
+
+    Directories are scanned concurrently by `workers` threads (default:
+    8 x CPUs, since the work is I/O bound). `manifest` is an optional JSON
+    file caching each directory's listing by mtime; it is updated in place.
+    `pattern` is an optional glob the file name must also match.
+    Returns a list of FastqFile sorted by path.
+    """
+    root = os.path.abspath(root)
+    cached = load_manifest(manifest) if manifest else {}
+    workers = workers or min(32, (os.cpu_count() or 1) * 8)
+
+    dirs = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, root, cached.get(root))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, listing = future.result()
+                if listing is None:
+                    continue
+                dirs[path] = listing
+                if recursive:
+                    for name in listing["subdirs"]:
+                        sub = os.path.join(path, name)
+                        pending.add(pool.submit(_scan_dir, sub, cached.get(sub)))
+
+    if manifest:
+        # Directories not reached this time (deleted, or outside root) are dropped
+        save_manifest(manifest, {**{k: v for k, v in cached.items()
+                                    if not k.startswith(root + os.sep) and k != root}, **dirs})
+
+    found = []
+    for path, listing in dirs.items():
+        for name, sample, read, size, mtime_ns in listing["files"]:
+            if pattern and not fnmatch.fnmatch(name, pattern):
+                continue
+            found.append(FastqFile(os.path.join(path, name), sample, read, size, mtime_ns))
+    found.sort(key=lambda f: f.path)
+    return found
+
+
+def pair_fastqs(files):
+    """Group FastqFiles into R1/R2 pairs by directory and sample name.
+
+    Mates are only paired within one directory, so same-named samples in
+    sibling run directories stay separate pairs. Returns (pairs, incomplete):
+    `pairs` is a list of dicts with sample, fastq_1 and fastq_2, sorted by
+    sample and then directory; `incomplete` lists (sample, path) for each
+    file that lacks a mate.
+    """
+    samples = {}
+    for f in files:
+        if f.read is None:
+            continue
+        samples.setdefault((f.sample, os.path.dirname(f.path)), {})[f.read] = f.path
+
+    pairs = []
+    incomplete = []
+    for sample, _ in sorted(samples):
+        reads = samples[sample, _]
+        if "1" in reads and "2" in reads:
+            pairs.append({"sample": sample, "fastq_1": reads["1"], "fastq_2": reads["2"]})
+        else:
+            incomplete.append((sample, reads.get("1") or reads.get("2")))
+    return pairs, incomplete
+
+
+def add_scan_arguments(parser):
+    """Add the shared --scan-cache option to an argparse parser."""
+    parser.add_argument("--scan-cache", default=os.environ.get("STAPHIT_SCAN_CACHE"),
+                        help="JSON manifest caching directory listings between scans "
+                             "(default: $STAPHIT_SCAN_CACHE, disabled if unset)")
@@ -0,0 +1,137 @@
+"""Pre-flight validation of paired FASTQ files before they reach the pipeline.
+
+Each R1/R2 pair is streamed in lockstep (gzip is decompressed in memory,
+never to disk) and checked for gzip integrity, FASTQ record structure,
+equal read counts and matching read names. Pairs are spread over a process
+pool so a large batch uses every core.
+"""
+import gzip
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+READ_BUFFER = 1024 * 1024
+
+
+class FastqError(Exception):
+    """A FASTQ file is unreadable or malformed."""
+
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb", buffering=READ_BUFFER)
+
+
+def _read_name(header):
+    """Read name without the '@', comment and any /1 or /2 mate suffix."""
+    parts = header[1:].split(None, 1)
+    if not parts:
+        raise FastqError("empty read name")
+    name = parts[0]
+    if name[-2:] in (b"/1", b"/2"):
+        name = name[:-2]
+    return name
+
+
+def _records(handle, path):
+    """Yield (header, sequence, quality) per record, checking the 4-line structure."""
+    record = 0
+    readline = handle.readline
+    while True:
+        header = readline()
+        if not header:
+            return
+        record += 1
+        seq = readline().rstrip(b"\r\n")
+        plus = readline()
+        qual = readline().rstrip(b"\r\n")
+        if header[:1] != b"@":
+            raise FastqError(f"{path}: record {record} does not start with '@'")
+        if plus[:1] != b"+":
+            raise FastqError(f"{path}: record {record} has no '+' separator (truncated file?)")
+        if len(seq) != len(qual):
+            raise FastqError(f"{path}: record {record} sequence and quality lengths differ")
+        yield header, seq, qual
+
+
+def validate_pair(pair):
+    """Validate one (fastq_1, fastq_2) pair.
+
+    Returns a dict with fastq_1, fastq_2, reads (pairs read, the read count
+    for the samplesheet) and error (None when the pair is valid).
+    """
+    r1, r2 = pair
+    result = {"fastq_1": r1, "fastq_2": r2, "reads": 0, "error": None}
+    try:
+        with _open(r1) as f1, _open(r2) as f2:
+            records1 = _records(f1, r1)
+            records2 = _records(f2, r2)
+            for rec1 in records1:
+                rec2 = next(records2, None)
+                if rec2 is None:
+                    raise FastqError(f"{r2} has fewer reads than {r1} ({result['reads']})")
+                if _read_name(rec1[0]) != _read_name(rec2[0]):
+                    raise FastqError(
+                        f"read {result['reads'] + 1} names differ: "
+                        f"{rec1[0].decode(errors='replace').strip()} / "
+                        f"{rec2[0].decode(errors='replace').strip()}")
+                result["reads"] += 1
+            if next(records2, None) is not None:
+                raise FastqError(f"{r2} has more reads than {r1} ({result['reads']})")
+        if result["reads"] == 0:
+            raise FastqError(f"{r1} contains no reads")
+    except FastqError as e:
+        result["error"] = str(e)
+    except (EOFError, zlib.error, OSError) as e:
+        # EOFError: truncated gzip stream; OSError covers BadGzipFile and CRC errors
+        result["error"] = f"unreadable: {e}"
+    return result
+
+
+def validate_pairs(pairs, workers=None):
+    """Validate (fastq_1, fastq_2) pairs across a process pool.
+
+    Yields validate_pair results in input order as they complete.
+    """
+    pairs = list(pairs)
+    workers = min(workers or os.cpu_count() or 1, len(pairs))
+    if workers <= 1:
+        yield from map(validate_pair, pairs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(validate_pair, pairs)
+
+
+def validate_samples(samples, workers=None):
+    """Validate samplesheet rows (dicts with fastq_1/fastq_2) in parallel.
+
+    Returns the rows that pass with read_count_raw filled in; failures are
+    reported on stderr and dropped.
+    """
+    samples = list(samples)
+    print(f"Validating {len(samples)} FastQ pairs...")
+    valid = []
+    results = validate_pairs(((s["fastq_1"], s["fastq_2"]) for s in samples), workers)
+    for sample, result in zip(samples, results):
+        if result["error"]:
+            print(f"Error: Sample '{sample['sample']}' failed validation: {result['error']}",
+                  file=sys.stderr)
+            continue
+        valid.append({**sample, "read_count_raw": result["reads"]})
+    failed = len(samples) - len(valid)
+    if failed:
+        print(f"Warning: {failed} of {len(samples)} samples failed validation and were skipped.")
+    return valid
+
+
+def add_validate_arguments(parser):
+    """Add the shared --validate/--threads options to an argparse parser."""
+    group = parser.add_argument_group("FASTQ validation")
+    group.add_argument("--validate", action="store_true",
+                       help="Check gzip integrity, record structure and R1/R2 read counts and "
+                            "names before writing the samplesheet; fills read_count_raw")
+    group.add_argument("--threads", type=int, default=None,
+                       help="Worker processes for --validate (default: all CPUs)")
+    return group
@@ -0,0 +1,91 @@
+"""Indexed per-sample metadata store for the Staphit aggregation step.
+
+The cohort metadata (a JSON list of records, as written by
+`staphit-metadata normalize` or FETCH_METADATA) is stored in a single SQLite
+file keyed by both run_id and sample_id, so each per-sample task reads only
+its own record instead of parsing the whole cohort file.
+"""
+import gzip
+import json
+import os
+import pathlib
+import sqlite3
+
+INDEX_SUFFIXES = ('.sqlite', '.db')
+
+
+class MetadataIndex:
+    """Write-once index: add() records, then close() to commit.
+
+    When two records share a key, the first one added wins, matching the
+    first-match scan over the JSON list that the index replaces.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE records (key TEXT PRIMARY KEY, body TEXT NOT NULL)")
+        self.count = 0
+
+    def add(self, record):
+        body = json.dumps(record)
+        keys = {record.get('run_id'), record.get('sample_id')} - {None, ''}
+        self._conn.executemany("INSERT OR IGNORE INTO records VALUES (?, ?)",
+                               [(key, body) for key in keys])
+        self.count += 1
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+
+def build_index(records, path):
+    """Write an index for an iterable of metadata records; returns the record count."""
+    index = MetadataIndex(path)
+    try:
+        for record in records:
+            index.add(record)
+    finally:
+        index.close()
+    return index.count
+
+
+def read_records(path):
+    """Yield the records of a metadata JSON list or NDJSON file (gzipped if it ends in .gz).
+
+    NDJSON is read one line at a time; a JSON list is parsed whole. Raises
+    ValueError when the document is not a list of records.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first == '[':
+            records = json.loads(first + f.read())
+            yield from records
+        elif first == '{':
+            yield json.loads(first + f.readline())
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError("Metadata JSON must be a list of records")
+
+
+def is_index(path):
+    """True if `path` names a metadata index rather than a JSON list."""
+    return path.endswith(INDEX_SUFFIXES)
+
+
+def lookup(path, sample_id):
+    """Return the metadata record for `sample_id` (run_id or sample_id), or {}."""
+    uri = pathlib.Path(path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        row = conn.execute("SELECT body FROM records WHERE key = ?", (sample_id,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else {}
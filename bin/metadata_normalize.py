@@ -0,0 +1,222 @@
+"""Streaming join of the metadata and antibiogram CSVs into metadata records.
+
+Both CSVs are read in sample_id order and merge-joined, so only one
+sample's antibiogram rows are in memory at a time. Inputs that are not
+already sorted (checked with a quick pass over the sample_id column) are
+first sorted on disk in runs of SORT_CHUNK_ROWS rows merged with
+heapq.merge; `sorted_input=True` skips both passes and fails on the
+first out-of-order row instead. Records are written as they
+are produced to any mix of sinks: a JSON list, NDJSON (either optionally
+gzipped by a `.gz` suffix), one file per sample with a manifest, and the
+SQLite index.
+"""
+import csv
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import re
+import tempfile
+from itertools import groupby
+
+# Rows held in memory per sorted run when an input has to be sorted on disk
+SORT_CHUNK_ROWS = 50000
+
+ANTIBIOGRAM_FIELDS = [
+    ('antibiotic', 'antibiotic'),
+    ('sir', 'resistance_phenotype'),
+    ('mic', 'measurement'),
+    ('mic_sign', 'measurement_sign'),
+    ('units', 'measurement_units'),
+    ('method', 'laboratory_typing_method'),
+    ('standard', 'testing_standard'),
+]
+
+
+class UnsortedInputError(ValueError):
+    """A CSV passed as sorted has a sample_id smaller than the row before it."""
+
+
+def _sample_id(row):
+    return (row.get('sample_id') or '').strip()
+
+
+def open_output(path, mode='w'):
+    """Open a text output, gzip-compressed when the path ends in .gz."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+def _sorted_runs(path, tmpdir, chunk_rows):
+    """Split path into CSV runs sorted by sample_id; returns (fieldnames, run paths)."""
+    runs = []
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        fieldnames = reader.fieldnames or []
+        while True:
+            chunk = [row for _, row in zip(range(chunk_rows), reader)]
+            if not chunk:
+                break
+            # list.sort is stable, so rows of one sample keep their file order
+            chunk.sort(key=_sample_id)
+            run = os.path.join(tmpdir, f'run{len(runs)}.csv')
+            with open(run, 'w', newline='') as out:
+                writer = csv.DictWriter(out, fieldnames=fieldnames, restval='', extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(chunk)
+            runs.append(run)
+    return fieldnames, runs
+
+
+def _iter_runs(runs):
+    files = [open(run, newline='') for run in runs]
+    try:
+        # heapq.merge breaks ties by run order, which keeps the sort stable
+        yield from heapq.merge(*(csv.DictReader(f) for f in files), key=_sample_id)
+    finally:
+        for f in files:
+            f.close()
+
+
+def _iter_checked(path):
+    with open(path, newline='') as f:
+        previous = ''
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            sid = _sample_id(row)
+            if sid < previous:
+                raise UnsortedInputError(
+                    f"{path} is not sorted by sample_id: row {line} ('{sid}') follows '{previous}'")
+            previous = sid
+            yield row
+
+
+def is_sorted(path):
+    """True if the CSV's rows are already in sample_id order (one cheap pass over the column)."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if 'sample_id' not in header:
+            return True
+        col = header.index('sample_id')
+        previous = ''
+        for values in reader:
+            sid = values[col].strip() if col < len(values) else ''
+            if sid < previous:
+                return False
+            previous = sid
+    return True
+
+
+def iter_sorted(path, sorted_input=False, tmpdir=None, chunk_rows=SORT_CHUNK_ROWS):
+    """Yield the rows of a CSV as dicts in sample_id order, sorting on disk if needed."""
+    if sorted_input:
+        yield from _iter_checked(path)
+        return
+    if is_sorted(path):
+        with open(path, newline='') as f:
+            yield from csv.DictReader(f)
+        return
+    with tempfile.TemporaryDirectory(dir=tmpdir) as d:
+        _, runs = _sorted_runs(path, d, chunk_rows)
+        yield from _iter_runs(runs)
+
+
+def antibiogram_entry(row):
+    return {key: (row.get(column) or '').strip() for key, column in ANTIBIOGRAM_FIELDS}
+
+
+def join_records(meta_rows, abg_rows):
+    """Merge-join metadata and antibiogram rows, both in sample_id order, into records.
+
+    Each metadata row becomes one record with the non-empty metadata fields,
+    run_id set to its sample_id and the sample's antibiogram entries.
+    Antibiogram rows without a sample_id or a matching metadata row are dropped.
+    """
+    groups = groupby((row for row in abg_rows if _sample_id(row)), key=_sample_id)
+    current_sid, current_rows = next(groups, (None, None))
+    for sid, rows in groupby(meta_rows, key=_sample_id):
+        while current_sid is not None and current_sid < sid:
+            current_sid, current_rows = next(groups, (None, None))
+        entries = []
+        if current_sid == sid:
+            entries = [antibiogram_entry(row) for row in current_rows]
+            current_sid, current_rows = next(groups, (None, None))
+        for row in rows:
+            record = {k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()}
+            record['run_id'] = sid
+            record['antibiogram'] = entries
+            yield record
+
+
+class JsonListSink:
+    """Stream records into a JSON list laid out like json.dump(records, indent=2)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open_output(path)
+        self._first = True
+
+    def add(self, record):
+        text = json.dumps(record, indent=2).replace('\n', '\n  ')
+        self._f.write(('[\n  ' if self._first else ',\n  ') + text)
+        self._first = False
+
+    def close(self):
+        self._f.write('[]' if self._first else '\n]')
+        self._f.close()
+
+
+class NdjsonSink:
+    """One JSON record per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open_output(path)
+
+    def add(self, record):
+        self._f.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self._f.close()
+
+
+class ShardSink:
+    """One <sample>.json file per record under a directory, listed in manifest.tsv."""
+
+    MANIFEST = 'manifest.tsv'
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._manifest = open(os.path.join(directory, self.MANIFEST), 'w', newline='')
+        self._writer = csv.writer(self._manifest, delimiter='\t')
+        self._writer.writerow(['sample_id', 'path', 'antibiogram_rows'])
+        self._used = set()
+
+    def _name(self, sid):
+        # Sanitizing can map distinct IDs (A/B, A_B) to one name, and a repeated
+        # sample must not take the name of a real one (x.2), so a clash gets a
+        # short hash of the raw ID and then a sequence number
+        base = re.sub(r'[^A-Za-z0-9._-]', '_', sid) or '_'
+        name = base
+        if name in self._used:
+            base = name = f"{base}.{hashlib.sha1(sid.encode('utf-8')).hexdigest()[:8]}"
+        seq = 1
+        while name in self._used:
+            seq += 1
+            name = f'{base}.{seq}'
+        self._used.add(name)
+        return name
+
+    def add(self, record):
+        sid = record['run_id']
+        name = self._name(sid)
+        path = f'{name}.json'
+        with open(os.path.join(self.directory, path), 'w') as f:
+            json.dump(record, f, indent=2)
+        self._writer.writerow([sid, path, len(record['antibiogram'])])
+
+    def close(self):
+        self._manifest.close()
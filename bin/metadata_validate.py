@@ -0,0 +1,217 @@
+"""Streaming validation of the metadata and antibiogram CSVs.
+
+Each CSV is parsed once, in a single csv.reader pass, and checked in
+chunks of rows as it is read. Lines are checked for null bytes on the way
+in. The checks are cheap next to the parse, and record boundaries (quoted
+newlines, stray quotes in unquoted fields) are only known by parsing, so
+the file is not split across processes. Issues come back in file order as
+dicts with the fields file, row, sample, field, rule, value, severity and
+message, so callers can stop early and print them as text or JSON.
+"""
+import csv
+import re
+from itertools import islice
+
+REQUIRED_METADATA = [
+    'sample_id', 'organism', 'collection_date', 'geo_loc_country',
+    'geo_loc_region', 'host', 'isolation_source'
+]
+
+REQUIRED_ANTIBIOGRAM = [
+    'sample_id', 'antibiotic', 'resistance_phenotype', 'measurement',
+    'measurement_sign', 'measurement_units', 'laboratory_typing_method',
+    'testing_standard'
+]
+
+VALID_SEX = {'male', 'female', 'unknown', ''}
+VALID_SIR = {'R', 'I', 'S', 'NS', 'SDD', ''}
+VALID_SIGN = {'<', '<=', '=', '>', '>=', ''}
+DATE_PATTERN = re.compile(r'^\d{4}(-\d{2}(-\d{2})?)?$')
+
+# Rows checked per chunk
+CHUNK_ROWS = 20000
+
+
+class FatalValidationError(Exception):
+    """The file cannot be validated at all (unreadable, null bytes, malformed CSV)."""
+
+    def __init__(self, issue):
+        super().__init__(issue)
+        self.issue = issue
+
+    def __str__(self):
+        return self.issue['message']
+
+
+def issue(file, rule, message, row=None, sample=None, field=None, value=None, severity='warning'):
+    return {'file': file, 'row': row, 'sample': sample, 'field': field, 'rule': rule,
+            'value': value, 'severity': severity, 'message': message}
+
+
+def _fatal(file, rule, message):
+    return FatalValidationError(issue(file, rule, message, severity='fatal'))
+
+
+def _lines(f, label):
+    """Yield the lines of f, refusing null bytes."""
+    for line in f:
+        if '\x00' in line:
+            raise _fatal(label, 'null_byte', f"{label.capitalize()} file contains null bytes")
+        yield line
+
+
+def _rows(path, label):
+    """Parse path; returns its header with a generator of (row number, values).
+
+    Blank lines are skipped without consuming a row number, as csv.DictReader does,
+    so row 2 is always the first data record.
+    """
+    try:
+        f = open(path, newline='')
+    except OSError as e:
+        raise _fatal(label, 'unreadable', f"Could not parse {label} CSV: {e}")
+    reader = csv.reader(_lines(f, label))
+    try:
+        header = next((values for values in reader if values), [])
+    except (csv.Error, UnicodeDecodeError) as e:
+        f.close()
+        raise _fatal(label, 'malformed_csv', f"Could not parse {label} CSV: {e}")
+    except FatalValidationError:
+        f.close()
+        raise
+
+    def rows():
+        try:
+            yield from enumerate((values for values in reader if values), start=2)
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise _fatal(label, 'malformed_csv', f"Could not parse {label} CSV: {e}")
+        finally:
+            f.close()
+
+    return header, rows()
+
+
+def _check_metadata_rows(header, rows, context):
+    col = {name: i for i, name in enumerate(header)}
+    required = [(name, col[name]) for name in REQUIRED_METADATA if name in col]
+    vocab = context.get('specimen_vocab')
+    issues = []
+    ids = []
+
+    def get(values, name):
+        i = col.get(name)
+        return values[i] if i is not None and i < len(values) else ''
+
+    for i, values in rows:
+        sid = get(values, 'sample_id')
+        ids.append(sid)
+
+        for name, j in required:
+            if j < len(values) and values[j].strip() == '':
+                issues.append(issue('metadata', 'required', f"Row {i}, sample '{sid}': required field '{name}' is empty",
+                                    row=i, sample=sid, field=name, value=''))
+
+        # ISO 8601: YYYY, YYYY-MM, YYYY-MM-DD
+        date_val = get(values, 'collection_date').strip()
+        if date_val and not DATE_PATTERN.match(date_val):
+            issues.append(issue('metadata', 'date_format', f"Row {i}, sample '{sid}': collection_date '{date_val}' is not valid ISO 8601 date format (expected YYYY, YYYY-MM, or YYYY-MM-DD)",
+                                row=i, sample=sid, field='collection_date', value=date_val))
+
+        sex_val = get(values, 'host_sex').strip()
+        if 'host_sex' in col and sex_val.lower() not in VALID_SEX:
+            issues.append(issue('metadata', 'host_sex', f"Row {i}, sample '{sid}': host_sex '{sex_val}' is not valid (expected: male, female, unknown, or empty)",
+                                row=i, sample=sid, field='host_sex', value=sex_val))
+
+        source_val = get(values, 'isolation_source').strip()
+        if source_val and vocab and source_val.lower() not in vocab:
+            issues.append(issue('metadata', 'vocabulary', f"Row {i}, sample '{sid}': isolation_source '{source_val}' not found in controlled vocabulary",
+                                row=i, sample=sid, field='isolation_source', value=source_val))
+    return issues, ids
+
+
+def _check_antibiogram_rows(header, rows, context):
+    col = {name: i for i, name in enumerate(header)}
+    required = [(name, col[name]) for name in REQUIRED_ANTIBIOGRAM if name in col]
+    sample_ids = context.get('sample_ids', set())
+    issues = []
+
+    def get(values, name):
+        i = col.get(name)
+        return values[i] if i is not None and i < len(values) else ''
+
+    for i, values in rows:
+        sid = get(values, 'sample_id')
+
+        for name, j in required:
+            if j < len(values) and values[j].strip() == '':
+                issues.append(issue('antibiogram', 'required', f"Antibiogram row {i}, sample '{sid}': required field '{name}' is empty",
+                                    row=i, sample=sid, field=name, value=''))
+
+        sir_val = get(values, 'resistance_phenotype').strip()
+        if sir_val and sir_val not in VALID_SIR:
+            issues.append(issue('antibiogram', 'resistance_phenotype', f"Antibiogram row {i}, sample '{sid}': resistance_phenotype '{sir_val}' is not valid (expected: R, I, S, NS, SDD, or empty)",
+                                row=i, sample=sid, field='resistance_phenotype', value=sir_val))
+
+        sign_val = get(values, 'measurement_sign').strip()
+        if sign_val and sign_val not in VALID_SIGN:
+            issues.append(issue('antibiogram', 'measurement_sign', f"Antibiogram row {i}, sample '{sid}': measurement_sign '{sign_val}' is not valid",
+                                row=i, sample=sid, field='measurement_sign', value=sign_val))
+
+        # Orphan sample_ids (in antibiogram but not in metadata)
+        if sid and sid not in sample_ids:
+            issues.append(issue('antibiogram', 'orphan_sample', f"Antibiogram sample '{sid}' not found in metadata",
+                                row=i, sample=sid, field='sample_id', value=sid))
+    return issues, []
+
+
+_CHECKS = {'metadata': _check_metadata_rows, 'antibiogram': _check_antibiogram_rows}
+
+
+def _check_file(path, label, required, context, chunk_rows, sample_ids=None):
+    """Yield the issues of one CSV; sample IDs are appended to sample_ids if given."""
+    header, rows = _rows(path, label)
+    try:
+        for col in required:
+            if col not in header:
+                yield issue(label, 'missing_column', f"Required column '{col}' missing from {label} header",
+                            field=col)
+
+        check = _CHECKS[label]
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            issues, ids = check(header, chunk, context)
+            if sample_ids is not None:
+                sample_ids.extend(ids)
+            yield from issues
+    finally:
+        rows.close()
+
+
+def validate(metadata, antibiogram=None, samplesheet=None, specimen_vocab=None, chunk_rows=CHUNK_ROWS):
+    """Yield every issue found in metadata, then the samplesheet cross-check, then antibiogram.
+
+    Raises FatalValidationError for a file that cannot be parsed. Closing the
+    generator early stops reading.
+    """
+    meta_ids = []
+    yield from _check_file(metadata, 'metadata', REQUIRED_METADATA,
+                           {'specimen_vocab': specimen_vocab or set()}, chunk_rows, meta_ids)
+    meta_ids = dict.fromkeys(meta_ids)
+
+    if samplesheet:
+        try:
+            with open(samplesheet, newline='') as f:
+                sheet_ids = {row['sample'] for row in csv.DictReader(f)}
+        except Exception as e:
+            yield issue('samplesheet', 'unreadable', f"Could not read samplesheet: {e}")
+        else:
+            for sid in meta_ids:
+                if sid and sid not in sheet_ids:
+                    yield issue('samplesheet', 'not_in_samplesheet', f"Metadata sample '{sid}' not found in samplesheet",
+                                sample=sid, field='sample_id', value=sid)
+
+    if antibiogram:
+        yield from _check_file(antibiogram, 'antibiogram', REQUIRED_ANTIBIOGRAM,
+                               {'sample_ids': set(meta_ids)}, chunk_rows)
@@ -0,0 +1,181 @@
+"""Persistent on-disk cache of NCBI E-utilities records.
+
+Records are stored in a single SQLite file keyed by (database, ID, rettype),
+zlib-compressed, each with its own expiry time. The file is bounded in size by
+least-recently-used eviction, and hit/miss counters are kept both for the
+current process and cumulatively in the file. In offline mode the client
+serves only from the cache and never touches the network.
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_SIZE_MB = 2048
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    db          TEXT NOT NULL,
+    id          TEXT NOT NULL,
+    rettype     TEXT NOT NULL,
+    body        BLOB NOT NULL,
+    size        INTEGER NOT NULL,
+    fetched_at  REAL NOT NULL,
+    expires_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (db, id, rettype)
+);
+CREATE INDEX IF NOT EXISTS records_lru ON records (accessed_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_COUNTERS = ('hits', 'misses', 'expired', 'stores', 'evictions')
+
+
+class ResponseCache:
+    """SQLite-backed record cache with per-record TTLs and LRU size bound.
+
+    Safe to share between the client's worker threads.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_SIZE_MB * 1024 * 1024,
+                 default_ttl=DEFAULT_TTL_DAYS * 86400, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM records").fetchone()[0]
+        self.stats = dict.fromkeys(_COUNTERS, 0)
+
+    def get(self, db, record_id, rettype):
+        """Return the cached record text, or None when absent or expired."""
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, expires_at FROM records WHERE db = ? AND id = ? AND rettype = ?",
+                (db, record_id, rettype)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            body, expires_at = row
+            if expires_at < now:
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute(
+                "UPDATE records SET accessed_at = ? WHERE db = ? AND id = ? AND rettype = ?",
+                (now, db, record_id, rettype))
+            self.stats['hits'] += 1
+        return zlib.decompress(body).decode('utf-8')
+
+    def put(self, db, record_id, rettype, text, ttl=None):
+        """Store one record, replacing any previous copy, then enforce the size bound."""
+        self.put_many(db, rettype, [(record_id, text)], ttl=ttl)
+
+    def put_many(self, db, rettype, records, ttl=None):
+        """Store an iterable of (id, text) pairs in one transaction."""
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            for record_id, text in records:
+                now = self._clock()
+                body = zlib.compress(text.encode('utf-8'))
+                old = self._conn.execute(
+                    "SELECT size FROM records WHERE db = ? AND id = ? AND rettype = ?",
+                    (db, record_id, rettype)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (db, record_id, rettype, body, len(body), now, now + ttl, now))
+                self._total += len(body) - (old[0] if old else 0)
+                self.stats['stores'] += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least-recently-used records until the file fits in max_bytes."""
+        while self._total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT db, id, rettype, size FROM records ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                self._total = 0
+                return
+            for db, record_id, rettype, size in rows:
+                self._conn.execute(
+                    "DELETE FROM records WHERE db = ? AND id = ? AND rettype = ?",
+                    (db, record_id, rettype))
+                self._total -= size
+                self.stats['evictions'] += 1
+                if self._total <= self.max_bytes:
+                    break
+
+    def purge_expired(self):
+        """Delete every expired record; returns the number removed."""
+        with self._lock:
+            now = self._clock()
+            freed = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM records WHERE expires_at < ?",
+                (now,)).fetchone()
+            self._conn.execute("DELETE FROM records WHERE expires_at < ?", (now,))
+            self._total -= freed[1]
+            self._conn.commit()
+        return freed[0]
+
+    def cumulative_stats(self):
+        """Counters summed over every process that has used this cache file."""
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+        return {name: rows.get(name, 0) + self.stats[name] for name in _COUNTERS}
+
+    def summary(self):
+        """One-line hit/miss report for the current process."""
+        s = self.stats
+        lookups = s['hits'] + s['misses']
+        rate = (100.0 * s['hits'] / lookups) if lookups else 0.0
+        return (f"NCBI cache {self.path}: {s['hits']} hits, {s['misses']} misses "
+                f"({rate:.1f}% hit rate), {s['stores']} stored, {s['evictions']} evicted")
+
+    def close(self):
+        """Persist the counters, commit and close the database."""
+        with self._lock:
+            for name in _COUNTERS:
+                self._conn.execute(
+                    "INSERT INTO counters VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (name, self.stats[name]))
+            self._conn.commit()
+            self._conn.close()
+
+
+def add_cache_arguments(parser):
+    """Add the shared --cache/--offline options to an argparse parser."""
+    group = parser.add_argument_group('NCBI response cache')
+    group.add_argument('--cache', default=os.environ.get('STAPHIT_NCBI_CACHE'),
+                       help='SQLite file caching NCBI records between runs '
+                            '(default: $STAPHIT_NCBI_CACHE, disabled if unset)')
+    group.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL_DAYS,
+                       help='Days before a cached record is fetched again')
+    group.add_argument('--cache-max-size', type=float, default=DEFAULT_MAX_SIZE_MB,
+                       help='Cache size bound in MB; least-recently-used records are evicted')
+    group.add_argument('--offline', action='store_true',
+                       help='Serve only from --cache; never contact NCBI')
+    return group
+
+
+def cache_from_args(args):
+    """Open the ResponseCache configured by add_cache_arguments, or None."""
+    if not args.cache:
+        if args.offline:
+            raise SystemExit("ERROR: --offline requires --cache")
+        return None
+    return ResponseCache(args.cache, max_bytes=int(args.cache_max_size * 1024 * 1024),
+                         default_ttl=args.cache_ttl * 86400)
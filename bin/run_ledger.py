@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Persistent ledger of SRA runs already picked up by surveillance searches.
+
+The ledger is a plain CSV (accession, first_seen, status) so it can also be
+read and extended by the shell-only SEARCH_SRA process. `first_seen` is the
+ISO date of the sweep that first selected the run; the latest one bounds the
+publication-date window of the next incremental search. `status` starts as
+'selected' and is set to 'processed' or 'failed' once the run's outcome is
+known (`run_ledger.py LEDGER --status ...`); failed runs are selected again by the next
+incremental search. Ledgers written without the status column read as
+'selected'.
+"""
+import argparse
+import csv
+import datetime
+import os
+import sys
+import tempfile
+
+FIELDS = ["accession", "first_seen", "status"]
+STATUSES = ("selected", "processed", "failed")
+
+
+class RunLedger:
+    """In-memory view of a run ledger file; call save() to persist changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.runs = {}
+        if os.path.exists(path):
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    if row.get("accession"):
+                        row["status"] = row.get("status") or "selected"
+                        self.runs[row["accession"]] = row
+
+    def __contains__(self, accession):
+        return accession in self.runs
+
+    def __len__(self):
+        return len(self.runs)
+
+    def add(self, accession, status="selected", today=None):
+        """Record a run the first time it is seen, or select a failed run again.
+
+        Returns False if the run is already known and has not failed.
+        """
+        row = self.runs.get(accession)
+        if row is not None:
+            if row["status"] != "failed":
+                return False
+            row["status"] = status
+            return True
+        first_seen = (today or datetime.date.today()).isoformat()
+        self.runs[accession] = {"accession": accession, "first_seen": first_seen,
+                                "status": status}
+        return True
+
+    def mark(self, accession, status):
+        """Update the status of a known run to one of STATUSES."""
+        if status not in STATUSES:
+            raise ValueError(f"Unknown run status {status!r}; expected one of {', '.join(STATUSES)}")
+        self.runs[accession]["status"] = status
+
+    def excluded(self):
+        """Accessions an incremental search must not select again (all but failed runs)."""
+        return {acc for acc, row in self.runs.items() if row["status"] != "failed"}
+
+    def last_seen(self):
+        """Most recent first_seen date in the ledger, or None when empty."""
+        dates = [row["first_seen"] for row in self.runs.values() if row.get("first_seen")]
+        return datetime.date.fromisoformat(max(dates)) if dates else None
+
+    def save(self):
+        """Write the ledger atomically (temp file + rename)."""
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=parent, prefix=".run_ledger.")
+        try:
+            with os.fdopen(fd, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore", lineterminator="\n")
+                writer.writeheader()
+                writer.writerows(self.runs.values())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def pdat_window(since):
+    """Entrez publication-date range from `since` (a date) to the present."""
+    return f"{since:%Y/%m/%d}:3000[PDAT]"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Set the status of runs already in a run ledger.")
+    parser.add_argument("ledger", help="Run ledger CSV")
+    parser.add_argument("--status", required=True, choices=STATUSES[1:], help="New status")
+    parser.add_argument("accessions", nargs="*", help="Run accessions")
+    parser.add_argument("-f", "--from-file", help="File listing run accessions, one per line")
+
+    args = parser.parse_intermixed_args()
+    accessions = list(args.accessions)
+    if args.from_file:
+        try:
+            with open(args.from_file) as f:
+                accessions.extend(line.strip() for line in f if line.strip())
+        except OSError as e:
+            print(f"ERROR: Cannot read {args.from_file}: {e}", file=sys.stderr)
+            sys.exit(1)
+    ledger = RunLedger(args.ledger)
+    unknown = [acc for acc in accessions if acc not in ledger]
+    if unknown:
+        print(f"ERROR: Not in the ledger: {', '.join(unknown)}", file=sys.stderr)
+        sys.exit(1)
+    for acc in accessions:
+        ledger.mark(acc, args.status)
+    ledger.save()
+    print(f"Marked {len(accessions)} runs {args.status} in {args.ledger}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Per-sample result aggregation for the Staphit pipeline.
+
+Each tool's output is read by a small parser function; aggregate_sample()
+combines them into the `<sample>_report.json` and Bactopia-style
+`<sample>_summary.csv` written by the AGGREGATOR process. The command-line
+entry point aggregates a whole batch of samples from a JSON-lines manifest
+across a process pool, so one task handles many samples.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from metadata_index import is_index, lookup, read_records
+from staphit_readqc import fastq_stats, parse_fastqc_zip
+from staphit_trace import span
+
+_TRIM_RE = re.compile(r'Input Read Pairs: (\d+).*Both Surviving: (\d+)')
+
+SUMMARY_HEADERS = [
+    "sample_id",
+    "total_reads", "trimmed_reads", "survival_rate", "q30_rate", "mean_quality",  # QC
+    "assembly_length", "contigs", "n50", "gc_percent",  # Assembly
+    "mlst_scheme", "mlst_st",  # Typing
+    "spa_type", "sccmec_type", "agr_group",  # MRSA Typing
+    "amrfinder_genes", "abricate_genes", "kma_genes",  # AMR
+    "virulence_genes", "plasmids",  # Other
+    "infection_origin", "ast_profile",  # Metadata
+]
+
+
+def _exists(path):
+    return bool(path) and os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def parse_metadata(path, sample_id):
+    """Metadata record for a sample from an index or a metadata JSON/NDJSON file."""
+    if not path:
+        return {}
+    if is_index(path):
+        return lookup(path, sample_id)
+    if _exists(path):
+        for m in read_records(path):
+            if m.get("run_id") == sample_id or m.get("sample_id") == sample_id:
+                return m
+    return {}
+
+
+def parse_trimmomatic_log(path):
+    """Raw/surviving read pairs and survival rate from a Trimmomatic log."""
+    qc = {}
+    with open(path) as f:
+        # Example: Input Read Pairs: 100 Both Surviving: 90 (90.00%) ...
+        match = _TRIM_RE.search(f.read())
+    if match:
+        raw_reads = int(match.group(1))
+        surviving_reads = int(match.group(2))
+        qc["raw_reads"] = raw_reads
+        qc["trimmed_reads"] = surviving_reads
+        qc["survival_rate"] = (surviving_reads / raw_reads) * 100 if raw_reads > 0 else 0
+    return qc
+
+
+def parse_fastqc(paths):
+    """Metrics from each FastQC zip, keyed by file name."""
+    return {os.path.basename(p): parse_fastqc_zip(p) for p in paths if p.endswith(".zip")}
+
+
+def parse_read_qc(paths):
+    """Exact Q30 rate and mean quality (plus full read stats) from the trimmed reads."""
+    stats = fastq_stats(paths)
+    return {"q30_rate": stats["q30_rate"], "mean_quality": stats["mean_quality"],
+            "read_stats": stats}
+
+
+def parse_quast(quast_dir):
+    """N50, contig count, length and GC from QUAST's transposed_report.tsv."""
+    report_path = os.path.join(quast_dir, "transposed_report.tsv")
+    if not os.path.exists(report_path):
+        return {}
+    with open(report_path) as f:
+        row = next(csv.DictReader(f, delimiter='\t'))
+    return {
+        "n50": int(row.get("N50", 0)),
+        "contigs": int(row.get("# contigs", 0)),
+        "length": int(row.get("Total length", 0)),
+        "gc": float(row.get("GC (%)", 0)),
+    }
+
+
+def parse_mlst(path):
+    """Scheme, ST and alleles from mlst output (tab or comma separated)."""
+    mlst = {}
+    with open(path) as f:
+        line = f.readline()
+        f.seek(0)
+        delim = ',' if ',' in line else '\t'
+        for row in csv.reader(f, delimiter=delim):
+            if len(row) >= 3:
+                mlst = {"scheme": row[1], "st": row[2], "alleles": row[3:]}
+    return mlst
+
+
+def parse_spatyper(path):
+    """spa type and repeats from SpaTyper output (with or without a header)."""
+    with open(path) as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = next(reader, None)
+        row = None
+        if header:
+            if "Repeats" in header or "Type" in header:
+                row = next(reader, None)
+            else:
+                row = header
+    if row and len(row) >= 3:
+        return {"type": row[2], "repeats": row[1]}
+    return {}
+
+
+def parse_sccmec(path):
+    """SCCmec type (and the full result row) from sccmec output."""
+    with open(path) as f:
+        row = next(csv.DictReader(f, delimiter='\t'), None)
+    if row:
+        return {"type": row.get("SCCmec_Type") or row.get("type") or "ND", "full_row": row}
+    return {}
+
+
+def parse_agr(path):
+    """agr group and confidence from the staph agr typer JSON."""
+    if not _exists(path):
+        return {}
+    with open(path) as f:
+        agr_data = json.load(f)
+    return {"group": agr_data.get("agr_group", "ND"),
+            "confidence": agr_data.get("confidence", 0.0)}
+
+
+def abricate_database(path):
+    """abricate database name from the report file name."""
+    name = os.path.basename(path)
+    for db_name in ("resfinder", "vfdb", "plasmidfinder"):
+        if db_name in name:
+            return db_name
+    return "unknown"
+
+
+def parse_abricate(path):
+    """Hits from one abricate report, tagged with their database."""
+    db_name = abricate_database(path)
+    with open(path) as f:
+        return [{
+            "gene": row.get("GENE"),
+            "coverage": float(row.get("%COVERAGE", 0)),
+            "identity": float(row.get("%IDENTITY", 0)),
+            "accession": row.get("ACCESSION"),
+            "product": row.get("PRODUCT"),
+            "database": db_name,
+        } for row in csv.DictReader(f, delimiter='\t')]
+
+
+def parse_amrfinder(path):
+    """Hits from an AMRFinderPlus report."""
+    with open(path) as f:
+        return [{
+            "gene": row.get("Gene symbol"),
+            "coverage": float(row.get("% Coverage", 0)),
+            "identity": float(row.get("% Identity", 0)),
+            "accession": row.get("Accession of closest sequence"),
+            "product": row.get("Sequence name"),
+            "element_type": row.get("Element type"),
+            "element_subtype": row.get("Element subtype"),
+            "class": row.get("Class"),
+            "subclass": row.get("Subclass"),
+        } for row in csv.DictReader(f, delimiter='\t')]
+
+
+def parse_kma(path):
+    """Template hits from a KMA .res file (ResFinder)."""
+    if not os.path.exists(path):
+        return []
+    hits = []
+    with open(path) as f:
+        # KMA output format: Template, Score, Expected, Template_length, Template_Identity, ...
+        # The column header is a '#Template' comment line, so every other row is a hit
+        for row in csv.reader(f, delimiter='\t'):
+            if row and not row[0].startswith('#'):
+                hits.append({"gene": row[0], "score": row[1], "identity": row[4]})
+    return hits
+
+
+def _warn(sample_id, what, error):
+    print(f"Warning: [{sample_id}] {what} parse error: {error}")
+
+
+def aggregate_sample(inputs):
+    """Combine one sample's tool outputs into the report dict.
+
+    `inputs` maps sample_id, metadata, trim_log, quast_dir, mlst, spa,
+    sccmec, agr, amrfinder, kma, and the lists abricate, fastqc and reads
+    (trimmed FASTQs) to paths; missing keys are skipped. A parser failure is reported and leaves its section
+    empty, as in the original per-sample script.
+    """
+    sample_id = inputs["sample_id"]
+    data = {
+        "sample_id": sample_id,
+        "metadata": {},
+        "qc": {"q30_rate": 0},
+        "assembly": {},
+        "typing": {"mlst": {}, "spa": {}, "sccmec": {}, "agr": {}},
+        "resistance": {"abricate": [], "amrfinder": [], "kma": []},
+        "virulence": [],
+        "plasmids": [],
+    }
+
+    sections = [
+        ("Metadata", "metadata", lambda p: data.update(metadata=parse_metadata(p, sample_id))),
+        ("QC", "trim_log", lambda p: data["qc"].update(parse_trimmomatic_log(p))),
+        ("FastQC", "fastqc", lambda p: data["qc"].update(fastqc=parse_fastqc(p))),
+        ("Read QC", "reads", lambda p: data["qc"].update(parse_read_qc(p))),
+        ("QUAST", "quast_dir", lambda p: data["assembly"].update(parse_quast(p))),
+        ("MLST", "mlst", lambda p: data["typing"].update(mlst=parse_mlst(p))),
+        ("SpaTyper", "spa", lambda p: data["typing"].update(spa=parse_spatyper(p))),
+        ("SCCmec", "sccmec", lambda p: data["typing"].update(sccmec=parse_sccmec(p))),
+        ("AgrVATE", "agr", lambda p: data["typing"].update(agr=parse_agr(p))),
+        ("AMRFinderPlus", "amrfinder", lambda p: data["resistance"].update(amrfinder=parse_amrfinder(p))),
+        ("KMA", "kma", lambda p: data["resistance"].update(kma=parse_kma(p))),
+    ]
+    for what, key, parse in sections:
+        if not inputs.get(key):
+            continue
+        try:
+            parse(inputs[key])
+        except Exception as e:
+            _warn(sample_id, what, e)
+
+    # Without the reads, fall back to FastQC's per-read mean quality
+    weighted = [(m["mean_quality"], m["total_sequences"])
+                for m in data["qc"].get("fastqc", {}).values() if "mean_quality" in m]
+    total = sum(n for _, n in weighted)
+    if "mean_quality" not in data["qc"] and total:
+        data["qc"]["mean_quality"] = sum(q * n for q, n in weighted) / total
+
+    targets = {"resfinder": data["resistance"]["abricate"], "vfdb": data["virulence"],
+               "plasmidfinder": data["plasmids"]}
+    for tab_file in inputs.get("abricate") or []:
+        if not tab_file.endswith('.tab') or 'abricate' not in os.path.basename(tab_file):
+            continue
+        try:
+            hits = parse_abricate(tab_file)
+        except Exception as e:
+            _warn(sample_id, f"Abricate {tab_file}", e)
+            continue
+        target = targets.get(abricate_database(tab_file))
+        if target is not None:
+            target.extend(hits)
+
+    return data
+
+
+def _genes(items):
+    return ";".join(sorted({item["gene"] for item in items if item["gene"]}))
+
+
+def summary_row(data):
+    """One Bactopia-style summary row (matching SUMMARY_HEADERS) for a report."""
+    qc = data["qc"]
+    assembly = data["assembly"]
+    typing = data["typing"]
+
+    # Metadata-derived fields
+    metadata = data.get("metadata", {})
+    ast_parts = []
+    for entry in metadata.get("antibiogram", []):
+        ab = entry.get("antibiotic", "")
+        sir = entry.get("sir", "")
+        if ab and sir:
+            ast_parts.append(f"{ab[:3].upper()}:{sir}")
+
+    return [
+        data["sample_id"],
+        qc.get("raw_reads", 0), qc.get("trimmed_reads", 0),
+        f"{qc.get('survival_rate', 0):.2f}", f"{qc.get('q30_rate', 0):.2f}",
+        f"{qc.get('mean_quality', 0):.2f}",
+        assembly.get("length", 0), assembly.get("contigs", 0), assembly.get("n50", 0),
+        f"{assembly.get('gc', 0):.2f}",
+        typing.get("mlst", {}).get("scheme", "-"), typing.get("mlst", {}).get("st", "-"),
+        typing.get("spa", {}).get("type", "-"), typing.get("sccmec", {}).get("type", "-"),
+        typing.get("agr", {}).get("group", "-"),
+        _genes(data["resistance"]["amrfinder"]), _genes(data["resistance"]["abricate"]),
+        _genes(data["resistance"]["kma"]),
+        _genes(data["virulence"]), _genes(data["plasmids"]),
+        metadata.get("infection_origin", ""), ";".join(ast_parts),
+    ]
+
+
+def write_outputs(data, outdir="."):
+    """Write <sample>_report.json and <sample>_summary.csv (tab-separated)."""
+    sample_id = data["sample_id"]
+    with open(os.path.join(outdir, f"{sample_id}_report.json"), 'w') as f:
+        json.dump(data, f, indent=2)
+    with open(os.path.join(outdir, f"{sample_id}_summary.csv"), 'w') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(SUMMARY_HEADERS)
+        writer.writerow(summary_row(data))
+
+
+def _run_one(job):
+    inputs, outdir = job
+    with span("aggregate.sample", sample_id=inputs["sample_id"]):
+        write_outputs(aggregate_sample(inputs), outdir)
+    return inputs["sample_id"]
+
+
+def read_manifest(path):
+    """Read a JSON-lines manifest: one object of input paths per sample."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def aggregate_batch(samples, outdir=".", workers=None):
+    """Aggregate many samples across a process pool; returns sample IDs in order."""
+    os.makedirs(outdir, exist_ok=True)
+    jobs = [(inputs, outdir) for inputs in samples]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        return [_run_one(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run_one, jobs, chunksize=8))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Aggregate per-sample tool outputs into report JSON and summary tables.")
+    parser.add_argument("-m", "--manifest", required=True,
+                        help="JSON-lines manifest, one object of input paths per sample")
+    parser.add_argument("-o", "--outdir", default=".", help="Output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Worker processes (default: all CPUs)")
+    args = parser.parse_args()
+
+    try:
+        samples = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: Cannot read manifest: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    with span("aggregate.batch", samples=len(samples)):
+        done = aggregate_batch(samples, args.outdir, args.workers)
+    print(f"Aggregation complete for {len(done)} samples")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Persistent cohort summary store, updated incrementally from each run.
+
+Each sample's summary row is kept in a SQLite table keyed by sample_id,
+together with the SHA-256 of its `<sample>_report.json`. Ingesting a run's
+reports only hashes that run's files and does one keyed lookup per sample:
+unchanged samples are skipped, changed ones replace the stored row and new
+ones are added, so a daily batch costs time proportional to the batch, not
+to the cohort history. The summary columns seen so far are kept in their own
+table, extended by each upsert, so writing the records of just the samples a
+run added or changed (`ingest --changes`) never scans the rest of the store.
+`export` writes the latest record of every sample as a TSV (and optionally
+Parquet) on demand.
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+from staphit_aggregate import SUMMARY_HEADERS
+from staphit_summary import ParquetSink
+from staphit_trace import span
+
+STORE_COLUMNS = ["report_hash", "first_seen", "updated"]
+HASH_BLOCK = 1024 * 1024
+# PRAGMA user_version of a store whose columns table is complete
+SCHEMA_VERSION = 1
+# Sample IDs per query when reading a subset of the store
+SELECT_BATCH = 500
+
+
+def report_hash(path):
+    """SHA-256 hex digest of a report file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def summary_path(report):
+    """The `<sample>_summary.csv` written next to a `<sample>_report.json`."""
+    return report[:-len("_report.json")] + "_summary.csv"
+
+
+def read_summary_row(path):
+    """The single data row of a per-sample summary file, as a dict."""
+    with open(path, newline='') as f:
+        return next(csv.DictReader(f, delimiter='\t'), None)
+
+
+class CohortStore:
+    """SQLite store of the latest summary row per sample."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            " sample_id TEXT PRIMARY KEY,"
+            " report_hash TEXT NOT NULL,"
+            " first_seen TEXT NOT NULL,"
+            " updated TEXT NOT NULL,"
+            " summary TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS columns ("
+            " position INTEGER PRIMARY KEY,"
+            " name TEXT UNIQUE NOT NULL)")
+        self._extra = [name for (name,) in self._conn.execute("SELECT name FROM columns ORDER BY position")]
+        self._known = set(SUMMARY_HEADERS) | set(self._extra)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # Store written before the columns table existed: fill it once
+            with self._conn:
+                for (summary,) in self._conn.execute("SELECT summary FROM samples ORDER BY rowid"):
+                    self._add_columns(json.loads(summary))
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _add_columns(self, summary):
+        for column in summary:
+            if column not in self._known:
+                self._known.add(column)
+                self._extra.append(column)
+                self._conn.execute("INSERT INTO columns (name) VALUES (?)", (column,))
+
+    def upsert(self, sample_id, digest, summary, today=None):
+        """Store a sample's summary; returns 'added', 'updated' or 'unchanged'."""
+        today = (today or datetime.date.today()).isoformat()
+        row = self._conn.execute("SELECT report_hash FROM samples WHERE sample_id = ?",
+                                 (sample_id,)).fetchone()
+        if row is not None and row[0] == digest:
+            return 'unchanged'
+        self._add_columns(summary)
+        if row is None:
+            self._conn.execute("INSERT INTO samples VALUES (?, ?, ?, ?, ?)",
+                               (sample_id, digest, today, today, json.dumps(summary)))
+            return 'added'
+        self._conn.execute(
+            "UPDATE samples SET report_hash = ?, updated = ?, summary = ? WHERE sample_id = ?",
+            (digest, today, json.dumps(summary), sample_id))
+        return 'updated'
+
+    def ingest(self, reports, today=None, changed=None):
+        """Upsert each `<sample>_report.json` with its summary row.
+
+        Returns a dict counting added, updated, unchanged and skipped samples.
+        The sample_id of each added or updated sample is appended to `changed`
+        when a list is given.
+        """
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        with self._conn:
+            for report in reports:
+                try:
+                    summary = read_summary_row(summary_path(report))
+                except OSError as e:
+                    print(f"Warning: No summary for {report}: {e}")
+                    summary = None
+                if not summary or not summary.get("sample_id"):
+                    counts['skipped'] += 1
+                    continue
+                outcome = self.upsert(summary["sample_id"], report_hash(report), summary, today)
+                counts[outcome] += 1
+                if changed is not None and outcome != 'unchanged':
+                    changed.append(summary["sample_id"])
+        return counts
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def latest(self, samples=None):
+        """Yield the latest record per sample (summary columns plus STORE_COLUMNS).
+
+        With `samples`, only those sample IDs are read, still in sample_id order.
+        """
+        query = "SELECT report_hash, first_seen, updated, summary FROM samples"
+        if samples is None:
+            batches = [self._conn.execute(query + " ORDER BY sample_id")]
+        else:
+            ids = sorted(set(samples))
+            batches = (self._conn.execute(
+                f"{query} WHERE sample_id IN ({', '.join('?' * len(batch))}) ORDER BY sample_id", batch)
+                for batch in (ids[i:i + SELECT_BATCH] for i in range(0, len(ids), SELECT_BATCH)))
+        for rows in batches:
+            for digest, first_seen, updated, summary in rows:
+                yield {**json.loads(summary), "report_hash": digest,
+                       "first_seen": first_seen, "updated": updated}
+
+    def columns(self):
+        """Summary columns present in the store, SUMMARY_HEADERS first."""
+        return SUMMARY_HEADERS + [c for c in self._extra if c not in SUMMARY_HEADERS] + STORE_COLUMNS
+
+    def export(self, output, parquet=None, samples=None):
+        """Write the latest record per sample to a TSV (and optional Parquet).
+
+        With `samples`, only those sample IDs are written.
+        """
+        header = self.columns()
+        sink = ParquetSink(parquet, header) if parquet else None
+        count = 0
+        try:
+            with open(output, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=header, delimiter='\t',
+                                        restval='', extrasaction='ignore')
+                writer.writeheader()
+                for record in self.latest(samples):
+                    writer.writerow(record)
+                    if sink:
+                        sink.add(record)
+                    count += 1
+        finally:
+            if sink:
+                sink.close()
+        return count
+
+    def close(self):
+        self._conn.close()
+
+
+def cmd_ingest(args):
+    try:
+        with open(args.manifest) as f:
+            reports = [line.strip() for line in f if line.strip()]
+    except OSError as e:
+        print(f"ERROR: Cannot read manifest: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    store = CohortStore(args.db)
+    changed = []
+    try:
+        with span("cohort.ingest", reports=len(reports)):
+            counts = store.ingest(reports, changed=changed)
+        total = len(store)
+        if args.changes:
+            with span("cohort.changes", samples=len(changed)):
+                store.export(args.changes, samples=changed)
+    finally:
+        store.close()
+    print(f"Cohort store {args.db}: {counts['added']} added, {counts['updated']} updated, "
+          f"{counts['unchanged']} unchanged, {counts['skipped']} skipped ({total} samples)")
+    if args.changes:
+        print(f"Wrote {len(changed)} added or updated samples to {args.changes}")
+
+
+def cmd_export(args):
+    if not os.path.exists(args.db):
+        print(f"ERROR: Cohort store not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+    store = CohortStore(args.db)
+    try:
+        with span("cohort.export"):
+            count = store.export(args.output, args.parquet)
+    finally:
+        store.close()
+    print(f"Exported {count} samples to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Incremental cohort summary store for the Staphit pipeline.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p_ingest = subparsers.add_parser('ingest', help='Upsert per-sample reports into the store')
+    p_ingest.add_argument('--db', required=True, help='Cohort SQLite store (created if missing)')
+    p_ingest.add_argument('-m', '--manifest', required=True,
+                          help='File listing <sample>_report.json paths, one per line; '
+                               'each <sample>_summary.csv is read from the same directory')
+    p_ingest.add_argument('--changes', default=None,
+                          help='Also write the latest record of each added or updated sample to this TSV')
+
+    p_export = subparsers.add_parser('export', help='Write the latest record per sample')
+    p_export.add_argument('--db', required=True, help='Cohort SQLite store')
+    p_export.add_argument('-o', '--output', default='cohort_summary.tsv', help='Output TSV')
+    p_export.add_argument('--parquet', default=None,
+                          help='Also write a typed Parquet table (requires pyarrow)')
+
+    args = parser.parse_args()
+    if args.command == 'ingest':
+        cmd_ingest(args)
+    elif args.command == 'export':
+        cmd_export(args)
+
+
+if __name__ == "__main__":
+    main()
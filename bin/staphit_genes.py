@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Sparse samples x genes presence/absence matrices for the cohort.
+
+The `;`-joined gene columns of the merged summary (AMRFinderPlus, abricate,
+KMA, virulence and plasmid genes) are stored per gene family as Parquet in
+long (COO) form: one (row, col) pair per gene present in a sample. Row and
+column numbers are kept in stable, append-only index files:
+
+    gene_matrix/
+        samples.tsv                     row, sample_id
+        <family>/genes.tsv              col, gene
+        <family>/part-<first row>.parquet
+
+Appending a newer summary only adds rows for samples not yet indexed (and
+columns for new genes) in a new part file, so existing rows and columns
+never change number. load_matrix() returns a scipy CSR matrix for
+vectorised cohort queries (prevalence by ST, co-occurrence, ...).
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+import tempfile
+
+from staphit_trace import span
+
+GENE_FAMILIES = ("amrfinder_genes", "abricate_genes", "kma_genes", "virulence_genes", "plasmids")
+SAMPLES_INDEX = "samples.tsv"
+GENES_INDEX = "genes.tsv"
+BATCH_ROWS = 10000
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        print("ERROR: pyarrow is required for gene matrices. Install with: pip install pyarrow",
+              file=sys.stderr)
+        sys.exit(1)
+    return pyarrow, pyarrow.parquet
+
+
+def read_index(path):
+    """Names in an index file, in row/column order; [] when it does not exist."""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as f:
+        return [row[1] for row in csv.reader(f, delimiter='\t')][1:]
+
+
+def write_index(path, names, label):
+    """Write an index file atomically (temp file + rename)."""
+    parent = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=parent, prefix=".index.")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            writer = csv.writer(f, delimiter='\t')
+            writer.writerow(["row" if label == "sample_id" else "col", label])
+            writer.writerows(enumerate(names))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class _FamilyWriter:
+    """Write one gene family's new (row, col) pairs to a part file in row groups."""
+
+    def __init__(self, directory, family, first_row, pa, pq):
+        self.family = family
+        self.dir = os.path.join(directory, family)
+        os.makedirs(self.dir, exist_ok=True)
+        self.genes = read_index(os.path.join(self.dir, GENES_INDEX))
+        self.cols = {gene: col for col, gene in enumerate(self.genes)}
+        self.path = os.path.join(self.dir, f"part-{first_row:09d}.parquet")
+        self.tmp = self.path + ".tmp"
+        self._pa = pa
+        self.schema = pa.schema([("row", pa.int32()), ("col", pa.int32())])
+        self.writer = pq.ParquetWriter(self.tmp, self.schema)
+        self.rows = []
+        self.col_ids = []
+
+    def add(self, row, value):
+        for gene in (value or "").split(";"):
+            gene = gene.strip()
+            if not gene:
+                continue
+            col = self.cols.get(gene)
+            if col is None:
+                col = self.cols[gene] = len(self.genes)
+                self.genes.append(gene)
+            self.rows.append(row)
+            self.col_ids.append(col)
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self._pa.table(
+                {"row": self.rows, "col": self.col_ids}, schema=self.schema))
+            self.rows = []
+            self.col_ids = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.tmp, self.path)
+        write_index(os.path.join(self.dir, GENES_INDEX), self.genes, "gene")
+
+
+def append_summary(summary, directory, families=GENE_FAMILIES, batch_rows=BATCH_ROWS):
+    """Append the samples of a merged summary TSV to the matrices in `directory`.
+
+    Samples already in the row index are skipped. Returns (added, skipped).
+    """
+    pa, pq = _require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    samples_path = os.path.join(directory, SAMPLES_INDEX)
+    samples = read_index(samples_path)
+    known = set(samples)
+    first_row = len(samples)
+
+    # Part files are written before the row index, and named by their first
+    # row, so an interrupted append is simply overwritten by the next one
+    writers = [_FamilyWriter(directory, family, first_row, pa, pq) for family in families]
+    skipped = 0
+    with open(summary, newline='') as f:
+        for record in csv.DictReader(f, delimiter='\t'):
+            sample_id = record.get("sample_id")
+            if not sample_id or sample_id in known:
+                skipped += 1
+                continue
+            known.add(sample_id)
+            row = len(samples)
+            samples.append(sample_id)
+            for writer in writers:
+                writer.add(row, record.get(writer.family))
+            if (row - first_row + 1) % batch_rows == 0:
+                for writer in writers:
+                    writer.flush()
+    for writer in writers:
+        writer.close()
+    write_index(samples_path, samples, "sample_id")
+    return len(samples) - first_row, skipped
+
+
+def load_coo(directory, family):
+    """(samples, genes, rows, cols) for one family; rows/cols are numpy arrays."""
+    _, pq = _require_pyarrow()
+    import numpy as np
+    samples = read_index(os.path.join(directory, SAMPLES_INDEX))
+    family_dir = os.path.join(directory, family)
+    genes = read_index(os.path.join(family_dir, GENES_INDEX))
+    parts = sorted(glob.glob(os.path.join(family_dir, "part-*.parquet")))
+    rows = [np.empty(0, dtype=np.int32)]
+    cols = [np.empty(0, dtype=np.int32)]
+    for part in parts:
+        table = pq.read_table(part)
+        rows.append(table.column("row").to_numpy())
+        cols.append(table.column("col").to_numpy())
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    # Ignore entries from an interrupted append that never reached the indexes
+    keep = (rows < len(samples)) & (cols < len(genes))
+    return samples, genes, rows[keep], cols[keep]
+
+
+def load_matrix(directory, family):
+    """(samples, genes, matrix): a scipy CSR presence/absence matrix for one family."""
+    try:
+        from scipy import sparse
+    except ImportError:
+        print("ERROR: scipy is required for load_matrix. Install with: pip install scipy",
+              file=sys.stderr)
+        sys.exit(1)
+    import numpy as np
+    samples, genes, rows, cols = load_coo(directory, family)
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                               shape=(len(samples), len(genes)))
+    # A gene listed twice for a sample still counts once
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return samples, genes, matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or append sparse gene presence/absence matrices from a merged summary.")
+    parser.add_argument("-s", "--summary", required=True, help="Merged summary TSV (final_summary.tsv)")
+    parser.add_argument("-o", "--outdir", default="gene_matrix",
+                        help="Matrix directory; appended to if it already exists")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.summary):
+        print(f"ERROR: Summary not found: {args.summary}", file=sys.stderr)
+        sys.exit(1)
+    with span("genes.append"):
+        added, skipped = append_summary(args.summary, args.outdir)
+    print(f"Gene matrix {args.outdir}: {added} samples added, {skipped} already indexed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Read-quality metrics for the per-sample report.
+
+Two sources are used:
+
+* FastQC `_fastqc.zip` archives, whose `fastqc_data.txt` is read from the
+  zip in memory (total sequences, length range, %GC, per-read mean quality).
+  FastQC does not record a per-base quality distribution, so it cannot give
+  the fraction of Q30 bases.
+* The trimmed FASTQ files themselves, in one chunked pass: each chunk's
+  sequence and quality lines are joined into one buffer and counted with
+  NumPy, giving the exact Q30 base fraction, mean quality, length
+  distribution and base composition.
+"""
+import argparse
+import gzip
+import json
+import sys
+import zipfile
+from itertools import islice
+
+PHRED_OFFSET = 33
+CHUNK_RECORDS = 100000
+BASES = "ACGTN"
+
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_fastqc_data(path):
+    """Modules of the fastqc_data.txt inside a FastQC zip, as {name: rows}."""
+    with zipfile.ZipFile(path) as archive:
+        member = next((n for n in archive.namelist() if n.endswith("fastqc_data.txt")), None)
+        if member is None:
+            raise ValueError(f"{path} has no fastqc_data.txt")
+        text = archive.read(member).decode()
+
+    modules = {}
+    rows = None
+    for line in text.splitlines():
+        if line.startswith(">>END_MODULE"):
+            rows = None
+        elif line.startswith(">>"):
+            rows = modules.setdefault(line[2:].split("\t")[0], [])
+        elif rows is not None and line and not line.startswith("#"):
+            rows.append(line.split("\t"))
+    return modules
+
+
+def _length(value):
+    """Midpoint of a FastQC length bin such as '36-39' or '151'."""
+    low, _, high = value.partition("-")
+    return (float(low) + float(high or low)) / 2
+
+
+def parse_fastqc_zip(path):
+    """Summary metrics from one FastQC zip, without extracting it."""
+    modules = read_fastqc_data(path)
+    basic = {row[0]: row[1] for row in modules.get("Basic Statistics", []) if len(row) > 1}
+    metrics = {
+        "total_sequences": int(basic.get("Total Sequences", 0)),
+        "sequence_length": basic.get("Sequence length", ""),
+        "gc_percent": float(basic.get("%GC", 0)),
+    }
+
+    scores = [(float(q), float(n)) for q, n in modules.get("Per sequence quality scores", [])]
+    reads = sum(n for _, n in scores)
+    if reads:
+        metrics["mean_quality"] = sum(q * n for q, n in scores) / reads
+        # Share of reads (not bases) whose mean quality is at least Q30
+        metrics["q30_read_rate"] = 100 * sum(n for q, n in scores if q >= 30) / reads
+
+    lengths = [(_length(b), float(n)) for b, n in modules.get("Sequence Length Distribution", [])]
+    total = sum(n for _, n in lengths)
+    if total:
+        metrics["mean_length"] = sum(length * n for length, n in lengths) / total
+    return metrics
+
+
+def fastq_stats(paths, chunk_records=CHUNK_RECORDS):
+    """Exact read-quality metrics from one pass over FASTQ files (gzip or plain).
+
+    Returns reads, bases, q30_rate (percent of bases >= Q30), mean_quality,
+    gc_percent, min/mean/max_length, composition (percent per base) and
+    length_distribution ({length: reads}).
+    """
+    import numpy as np
+
+    reads = 0
+    q30 = 0
+    quality_sum = 0
+    composition = np.zeros(256, dtype=np.int64)
+    lengths = np.zeros(1, dtype=np.int64)
+    for path in paths:
+        with _open(path) as f:
+            while True:
+                lines = list(islice(f, 4 * chunk_records))
+                if not lines:
+                    break
+                if not lines[-1].endswith(b"\n"):
+                    lines[-1] += b"\n"
+                seq = np.frombuffer(b"".join(lines[1::4]), dtype=np.uint8)
+                qual = np.frombuffer(b"".join(lines[3::4]), dtype=np.uint8)
+                # Read lengths from the newline positions of the joined quality lines
+                ends = np.flatnonzero(qual == 10)
+                chunk_lengths = np.diff(ends, prepend=-1) - 1
+                counts = np.bincount(chunk_lengths, minlength=len(lengths))
+                counts[:len(lengths)] += lengths
+                lengths = counts
+                qual = qual[qual >= PHRED_OFFSET]
+                q30 += int(np.count_nonzero(qual >= PHRED_OFFSET + 30))
+                quality_sum += int(qual.sum(dtype=np.int64)) - PHRED_OFFSET * len(qual)
+                composition += np.bincount(seq, minlength=256)
+                reads += len(chunk_lengths)
+
+    bases = int((np.arange(len(lengths)) * lengths).sum())
+    by_base = {b: int(composition[ord(b)] + composition[ord(b.lower())]) for b in BASES}
+    called = sum(by_base.values())
+    observed = np.flatnonzero(lengths)
+    return {
+        "reads": reads,
+        "bases": bases,
+        "q30_rate": 100 * q30 / bases if bases else 0,
+        "mean_quality": quality_sum / bases if bases else 0,
+        "gc_percent": 100 * (by_base["G"] + by_base["C"]) / called if called else 0,
+        "min_length": int(observed[0]) if len(observed) else 0,
+        "mean_length": bases / reads if reads else 0,
+        "max_length": int(observed[-1]) if len(observed) else 0,
+        "composition": {b: 100 * n / called if called else 0 for b, n in by_base.items()},
+        "length_distribution": {int(i): int(lengths[i]) for i in observed},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-quality metrics from FASTQ or FastQC zips.")
+    parser.add_argument("files", nargs="+", help="FASTQ(.gz) files, or FastQC _fastqc.zip files")
+    args = parser.parse_args()
+
+    try:
+        if all(f.endswith(".zip") for f in args.files):
+            result = {f: parse_fastqc_zip(f) for f in args.files}
+        else:
+            result = fastq_stats(args.files)
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Streaming merge of per-sample summary tables into the cohort summary.
+
+The per-sample `<sample>_summary.csv` files (tab-separated, written by
+staphit_aggregate.py) are listed in a manifest, one path per line. Their
+headers are read first and unioned in first-seen order, so files from older
+or newer aggregator versions keep their rows; columns a file lacks are left
+empty. Rows are then streamed to `final_summary.tsv` and, optionally, to a
+typed Parquet file written in row groups, so memory stays bounded by the
+batch size rather than the cohort size.
+"""
+import argparse
+import csv
+import sys
+
+from staphit_trace import span
+
+INT_COLUMNS = ("total_reads", "trimmed_reads", "assembly_length", "contigs", "n50")
+FLOAT_COLUMNS = ("survival_rate", "q30_rate", "mean_quality", "gc_percent")
+# Low-cardinality text columns stored dictionary-encoded in Parquet
+DICTIONARY_COLUMNS = (
+    "mlst_scheme", "mlst_st", "spa_type", "sccmec_type", "agr_group",
+    "amrfinder_genes", "abricate_genes", "kma_genes", "virulence_genes", "plasmids",
+    "infection_origin",
+)
+BATCH_ROWS = 10000
+
+
+def read_manifest(path):
+    """Summary file paths listed one per line in `path`."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _header(path):
+    with open(path, newline='') as f:
+        return next(csv.reader(f, delimiter='\t'), None)
+
+
+def union_header(paths):
+    """Union of the files' headers, in first-seen column order."""
+    header = []
+    seen = set()
+    for path in paths:
+        for column in _header(path) or []:
+            if column not in seen:
+                seen.add(column)
+                header.append(column)
+    return header
+
+
+def iter_rows(paths):
+    """Yield each data row of each file as a dict keyed by that file's header."""
+    for path in paths:
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f, delimiter='\t')
+            if reader.fieldnames is None:
+                print(f"Warning: Empty file {path}")
+                continue
+            yield from reader
+
+
+def _typed(value, kind):
+    if value in (None, ''):
+        return None
+    try:
+        return kind(value)
+    except ValueError:
+        return None
+
+
+class ParquetSink:
+    """Buffer rows and write them to a Parquet file one row group at a time."""
+
+    def __init__(self, path, header, batch_rows=BATCH_ROWS):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("ERROR: pyarrow is required for --parquet. Install with: pip install pyarrow",
+                  file=sys.stderr)
+            sys.exit(1)
+        self._pa = pa
+        self.header = header
+        self.batch_rows = batch_rows
+        self.converters = {}
+        fields = []
+        for column in header:
+            if column in INT_COLUMNS:
+                fields.append(pa.field(column, pa.int64()))
+                self.converters[column] = int
+            elif column in FLOAT_COLUMNS:
+                fields.append(pa.field(column, pa.float64()))
+                self.converters[column] = float
+            elif column in DICTIONARY_COLUMNS:
+                fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.columns = {column: [] for column in header}
+        self.pending = 0
+
+    def add(self, row):
+        for column in self.header:
+            value = row.get(column)
+            kind = self.converters.get(column)
+            self.columns[column].append(_typed(value, kind) if kind else value)
+        self.pending += 1
+        if self.pending >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        table = self._pa.Table.from_pydict(self.columns, schema=self.schema)
+        self.writer.write_table(table)
+        self.columns = {column: [] for column in self.header}
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def merge_summaries(paths, output, parquet=None, batch_rows=BATCH_ROWS):
+    """Merge summary files into `output` (TSV) and optionally `parquet`.
+
+    Returns the number of rows written.
+    """
+    header = union_header(paths)
+    sink = ParquetSink(parquet, header, batch_rows) if parquet else None
+    count = 0
+    try:
+        with open(output, 'w', newline='') as fout:
+            writer = csv.DictWriter(fout, fieldnames=header, delimiter='\t',
+                                    restval='', extrasaction='ignore')
+            writer.writeheader()
+            for row in iter_rows(paths):
+                writer.writerow(row)
+                if sink:
+                    sink.add(row)
+                count += 1
+    finally:
+        if sink:
+            sink.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge per-sample summary tables into one cohort summary.")
+    parser.add_argument("-m", "--manifest", required=True,
+                        help="File listing the per-sample summary files, one per line")
+    parser.add_argument("-o", "--output", default="final_summary.tsv", help="Merged TSV")
+    parser.add_argument("--parquet", default=None,
+                        help="Also write a typed Parquet table (requires pyarrow)")
+    args = parser.parse_args()
+
+    try:
+        paths = read_manifest(args.manifest)
+    except OSError as e:
+        print(f"ERROR: Cannot read manifest: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not paths:
+        print("No summary files to merge.")
+        sys.exit(0)
+
+    with span("summary.merge", files=len(paths)):
+        count = merge_summaries(paths, args.output, args.parquet)
+    print(f"Merged {count} samples from {len(paths)} summary files into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
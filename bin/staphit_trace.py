@@ -0,0 +1,64 @@
+"""Opt-in timing spans for the Python stages of the pipeline.
+
+Set STAPHIT_TRACE to a file path to record spans; each finished span is
+appended to it as one JSON line (name, start, wall and CPU seconds, peak
+RSS, pid and any attributes). A relative path is resolved in the current
+directory, which inside Nextflow is the task's work directory, so
+`staphit-bench --spans work/` can collect them afterwards. When the
+variable is unset, span() returns a shared no-op context manager.
+"""
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+ENV_VAR = "STAPHIT_TRACE"
+_NOOP = nullcontext()
+
+
+def enabled():
+    return bool(os.environ.get(ENV_VAR))
+
+
+def _peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _write(record):
+    line = json.dumps(record) + "\n"
+    # One O_APPEND write per span, so concurrent processes do not interleave lines
+    fd = os.open(os.environ[ENV_VAR], os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def _span(name, attrs):
+    start = time.time()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        _write({
+            "name": name,
+            "start": start,
+            "wall": time.perf_counter() - wall,
+            "cpu": time.process_time() - cpu,
+            "peak_rss_kb": _peak_rss_kb(),
+            "pid": os.getpid(),
+            "attrs": attrs,
+        })
+
+
+def span(name, **attrs):
+    """Context manager timing the enclosed block as span `name`."""
+    if not os.environ.get(ENV_VAR):
+        return _NOOP
+    return _span(name, attrs)
@@ -1,81 +1,126 @@
 #!/usr/bin/env python3
 
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import sys
+import argparse
 import os
 
-def generate_visualizations(summary_csv, output_dir):
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import seaborn as sns  # noqa: E402
+
+from staphit_trace import span  # noqa: E402
+
+# Only these columns of the merged summary are read
+COLUMNS = ['sample_id', 'mlst_st', 'spa_type', 'amrfinder_genes', 'virulence_genes']
+
+# Cohorts larger than this are plotted as per-group gene prevalence instead
+# of one heatmap row per sample
+MAX_SAMPLE_ROWS = 200
+MAX_GROUPS = 40
+MAX_GENES = 60
+
+
+def load_summary(summary_csv, columns=COLUMNS):
+    """Read only the plotted columns from a summary TSV/CSV or Parquet file."""
+    if summary_csv.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        available = pq.read_schema(summary_csv).names
+        return pd.read_parquet(summary_csv, columns=[c for c in columns if c in available])
+    sep = '\t' if summary_csv.endswith('.tsv') else ','
+    return pd.read_csv(summary_csv, sep=sep, usecols=lambda c: c in columns, dtype=str)
+
+
+def presence_matrix(df, column):
+    """Samples x genes 0/1 matrix from a ';'-joined gene column."""
+    matrix = df[column].astype('string').fillna('').str.get_dummies(sep=';').astype(np.uint8)
+    matrix.index = df['sample_id'] if 'sample_id' in df.columns else df.index
+    return matrix.loc[:, matrix.columns != '']
+
+
+def group_prevalence(matrix, groups, max_groups=MAX_GROUPS, max_genes=MAX_GENES):
+    """Fraction of samples carrying each gene, per group (e.g. ST), for the largest groups."""
+    groups = pd.Series(groups.fillna('-').astype(str).values, index=matrix.index)
+    top_groups = groups.value_counts().index[:max_groups]
+    top_genes = matrix.sum().sort_values(ascending=False).index[:max_genes]
+    keep = groups.isin(top_groups).values
+    prevalence = matrix.loc[keep, top_genes].groupby(groups[keep].values).mean()
+    counts = groups[keep].value_counts()
+    prevalence = prevalence.loc[top_groups]
+    prevalence.index = [f"{g} (n={counts[g]})" for g in prevalence.index]
+    return prevalence
+
+
+def plot_presence(df, column, title, cmap, path, group_by='mlst_st', max_rows=MAX_SAMPLE_ROWS):
+    matrix = presence_matrix(df, column)
+    if matrix.empty:
+        return
+    if len(matrix) <= max_rows:
+        data = matrix
+        cbar = False
+        height = max(4, min(len(matrix) * 0.2, 40))
+    elif group_by in df.columns:
+        data = group_prevalence(matrix, df[group_by])
+        title = f"{title} (prevalence by {group_by}, {len(matrix)} samples)"
+        cbar = True
+        height = max(4, len(data) * 0.3)
+    else:
+        # No grouping column: show the most common genes over the whole cohort
+        data = matrix.mean().sort_values(ascending=False)[:MAX_GENES].to_frame('all samples').T
+        title = f"{title} (prevalence, {len(matrix)} samples)"
+        cbar = True
+        height = 3
+
+    plt.figure(figsize=(12, height))
+    # Grid lines only help on small plots; large ones are rasterized
+    sns.heatmap(data, cmap=cmap, cbar=cbar, linewidths=.5 if data.size <= 2500 else 0,
+                rasterized=data.size > 2500, xticklabels=True, yticklabels=len(data) <= 100)
+    plt.title(title)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close()
+
+
+def generate_visualizations(summary_csv, output_dir, group_by='mlst_st', max_rows=MAX_SAMPLE_ROWS):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    if summary_csv.endswith('.tsv'):
-        df = pd.read_csv(summary_csv, sep='\t')
-    else:
-        df = pd.read_csv(summary_csv)
-    
+    df = load_summary(summary_csv)
+
     # 1. MLST Distribution
-    if 'mlst_scheme' in df.columns and 'mlst_sequence_type' in df.columns:
+    if 'mlst_st' in df.columns:
+        counts = df['mlst_st'].fillna('-').value_counts()[:MAX_GROUPS]
         plt.figure(figsize=(10, 6))
-        sns.countplot(x='mlst_sequence_type', data=df)
+        sns.barplot(x=counts.index.astype(str), y=counts.values, color='steelblue')
+        plt.xticks(rotation=90)
+        plt.xlabel('mlst_st')
+        plt.ylabel('samples')
         plt.title('MLST Sequence Type Distribution')
+        plt.tight_layout()
         plt.savefig(f"{output_dir}/mlst_distribution.png")
         plt.close()
 
     # 2. AMR Genes Heatmap (Binary)
-    # Assuming AMR genes are in columns or we need to parse them
-    # This depends on the aggregator output format. 
-    # For now, we'll look for columns that might represent AMR classes or genes
-    # Or if there's a column 'amr_genes' with comma-separated values
-    
     if 'amrfinder_genes' in df.columns:
-        # Expand the list
-        amr_series = df['amrfinder_genes'].fillna('').astype(str).str.split(';').apply(lambda x: x if isinstance(x, list) else [])
-        all_genes = sorted(list(set([item for sublist in amr_series for item in sublist])))
-        
-        if all_genes:
-            matrix = pd.DataFrame(0, index=df['sample_id'], columns=all_genes)
-            for idx, row in df.iterrows():
-                genes = row['amrfinder_genes'].split(';') if isinstance(row['amrfinder_genes'], str) else []
-                for gene in genes:
-                    if gene in all_genes:
-                        matrix.loc[row['sample_id'], gene] = 1
-            
-            plt.figure(figsize=(12, 8))
-            sns.heatmap(matrix, cmap="Blues", cbar=False, linewidths=.5)
-            plt.title('AMR Gene Presence/Absence')
-            plt.tight_layout()
-            plt.savefig(f"{output_dir}/amr_heatmap.png")
-            plt.close()
+        plot_presence(df, 'amrfinder_genes', 'AMR Gene Presence/Absence', 'Blues',
+                      f"{output_dir}/amr_heatmap.png", group_by, max_rows)
 
     # 3. Virulence Genes Heatmap
     if 'virulence_genes' in df.columns:
-         # Expand the list
-        vir_series = df['virulence_genes'].fillna('').astype(str).str.split(';').apply(lambda x: x if isinstance(x, list) else [])
-        all_vir = sorted(list(set([item for sublist in vir_series for item in sublist])))
-        
-        if all_vir:
-            matrix = pd.DataFrame(0, index=df['sample_id'], columns=all_vir)
-            for idx, row in df.iterrows():
-                genes = row['virulence_genes'].split(';') if isinstance(row['virulence_genes'], str) else []
-                for gene in genes:
-                    if gene in all_vir:
-                        matrix.loc[row['sample_id'], gene] = 1
-            
-            plt.figure(figsize=(12, 8))
-            sns.heatmap(matrix, cmap="Reds", cbar=False, linewidths=.5)
-            plt.title('Virulence Gene Presence/Absence')
-            plt.tight_layout()
-            plt.savefig(f"{output_dir}/virulence_heatmap.png")
-            plt.close()
+        plot_presence(df, 'virulence_genes', 'Virulence Gene Presence/Absence', 'Reds',
+                      f"{output_dir}/virulence_heatmap.png", group_by, max_rows)
+
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: visualize_results.py <summary.csv> <output_dir>")
-        sys.exit(1)
-    
-    summary_csv = sys.argv[1]
-    output_dir = sys.argv[2]
-    
-    generate_visualizations(summary_csv, output_dir)
+    parser = argparse.ArgumentParser(description="Plot cohort summary figures.")
+    parser.add_argument("summary_csv", help="Merged summary (.tsv, .csv or .parquet)")
+    parser.add_argument("output_dir", help="Directory for the PNG figures")
+    parser.add_argument("--group-by", default="mlst_st",
+                        help="Column to aggregate heatmap rows by for large cohorts")
+    parser.add_argument("--max-rows", type=int, default=MAX_SAMPLE_ROWS,
+                        help="Largest cohort plotted with one heatmap row per sample")
+    args = parser.parse_args()
+
+    with span("visualize"):
+        generate_visualizations(args.summary_csv, args.output_dir, args.group_by, args.max_rows)
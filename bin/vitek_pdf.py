@@ -0,0 +1,369 @@
+"""Vitek 2 AST-P580 PDF reports to long-format antibiogram rows.
+
+A report directory is indexed in one pass: each sample's PDFs are ranked by
+culture number, skipping the kw24533 duplicates. The lowest culture is
+parsed first, and the next one only if it yields no AST rows. Parsing runs
+in a process pool. What a report's text yields is cached in SQLite keyed by
+the file's SHA-256 and PARSER_VERSION, so a re-run only parses new or
+modified PDFs; the file name fallback for the sample ID is applied after
+the cache, so identical reports under different names stay distinct. Bump
+PARSER_VERSION whenever read_report changes its output.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+PARSER_VERSION = 3
+
+CACHE_NAME = '.vitek_pdf_cache.sqlite'
+
+_ISOLATE_FILE_RE = re.compile(r'Isolate_ID(\d+)-(\d+)')
+_ISOLATE_TEXT_RE = re.compile(r'Isolate:\s*ID(\d+)-(\d+)')
+_SIGN_RE = re.compile(r'^(>=|<=|>|<)\s*(.+)$')
+
+
+def parse_mic_interp(mic_raw, interp_raw):
+    """Parse raw MIC and interpretation from a Vitek 2 PDF into structured result."""
+    aes_modified = False
+    deduced = False
+
+    mic = mic_raw.strip()
+    interp = interp_raw.strip()
+
+    # AES flag on MIC (trailing *)
+    if mic.endswith('*'):
+        aes_modified = True
+        mic = mic[:-1]
+
+    # AES flag on interpretation (* prefix)
+    if interp.startswith('*'):
+        aes_modified = True
+        interp = interp[1:]
+
+    # Deduced flag (+ or -)
+    if interp in ('+', '-'):
+        deduced = True
+        sir = 'R' if mic == 'POS' else 'S' if mic == 'NEG' else ''
+    else:
+        sir = interp
+
+    # Parse sign from MIC
+    sign_match = _SIGN_RE.match(mic)
+    if sign_match:
+        sign = sign_match.group(1)
+        measurement = sign_match.group(2)
+    elif mic in ('POS', 'NEG'):
+        sign = '='
+        measurement = mic
+    else:
+        sign = '='
+        measurement = mic
+
+    return {
+        'sir': sir,
+        'measurement': measurement,
+        'sign': sign,
+        'aes_modified': aes_modified,
+        'deduced': deduced,
+    }
+
+
+# Regex components for PDF AST table parsing
+_PDF_MIC = r'((?:>=|<=)\s*\d+\.?\d*\*?|\d+\.?\d*\*?|POS|NEG)'
+_PDF_INTERP = r'(\*?[RIS]|\+|-)'
+
+AST_HEADER = 'Antimicrobial MIC Interpretation Antimicrobial MIC Interpretation'
+AST_FOOTER = '+= Deduced drug'
+
+# Report name -> antibiogram name, in output order
+_SIMPLE_DRUGS = {
+    'CefoxitinScreen': 'Cefoxitin',
+    'Benzylpenicillin': 'Benzylpenicillin',
+    'Oxacillin': 'Oxacillin',
+    'Gentamicin': 'Gentamicin',
+    'Tobramycin': 'Tobramycin',
+    'Levofloxacin': 'Levofloxacin',
+    'Moxifloxacin': 'Moxifloxacin',
+    'Erythromycin': 'Erythromycin',
+    'Linezolid': 'Linezolid',
+    'Teicoplanin': 'Teicoplanin',
+    'Vancomycin': 'Vancomycin',
+    'Tetracycline': 'Tetracycline',
+    'Tigecycline': 'Tigecycline',
+    'Nitrofurantoin': 'Nitrofurantoin',
+    'FusidicAcid': 'Fusidic Acid',
+    'Rifampicin': 'Rifampicin',
+}
+_ICR = 'Inducible Clindamycin Resistance'
+_CLINDAMYCIN = 'Clindamycin'
+_TMP_SMX = 'Trimethoprim/Sulfamethoxazole'
+_DRUG_ORDER = [*_SIMPLE_DRUGS.values(), _ICR, _CLINDAMYCIN, _TMP_SMX]
+
+# One alternation over every drug the table can hold. Only the name is
+# consumed and its values are read in a lookahead, so each name is matched
+# wherever it occurs, as a separate search per drug would. Whitespace between
+# a name and its values may be a line break, which covers names that wrap
+# (Trimethoprim/Sulfamethoxaz|ole) and the two-column layout, where a right
+# column result can share a line with Clindamycin: "Clindamycin MIC1 INTERP1
+# MIC2 INTERP2". The leading character class lets the scan skip positions
+# that cannot start a name without trying every branch.
+_DRUG_INITIALS = ''.join(sorted({name[0] for name in _SIMPLE_DRUGS} | set('ITC')))
+_AST_ROW = re.compile(
+    r'(?=[' + _DRUG_INITIALS + r'])(?:'
+    r'(' + '|'.join(_SIMPLE_DRUGS) + r')(?=\s+' + _PDF_MIC + r'\s+' + _PDF_INTERP + r')'
+    r'|Inducible(?=\s+Clindamycin\s+' + _PDF_MIC + r'\s+' + _PDF_INTERP + r')'
+    r'|Trimethoprim/Sulfamethoxaz(?=\w*\s+' + _PDF_MIC + r'\s+' + _PDF_INTERP + r')'
+    r'|Clindamycin(?=\s+' + _PDF_MIC + r'\s+' + _PDF_INTERP
+    + r'(?:\s+' + _PDF_MIC + r'\s+' + _PDF_INTERP + r')?))')
+
+
+def parse_ast_table(ast):
+    """Parse the text of an AST table in one scan; returns [(drug, raw MIC, raw interpretation)].
+
+    Drugs come out in a fixed order, each at most once (its first result).
+    Trimethoprim/Sulfamethoxazole falls back to the right column result that
+    shares a line with Clindamycin when its own name is not followed by values.
+    """
+    found = {}
+    tmp_beside_clinda = None
+    for m in _AST_ROW.finditer(ast):
+        name, mic, interp, icr_mic, icr_interp, tmp_mic, tmp_interp, mic1, interp1, mic2, interp2 = m.groups()
+        if name:
+            found.setdefault(_SIMPLE_DRUGS[name], (mic, interp))
+        elif icr_mic:
+            found.setdefault(_ICR, (icr_mic, icr_interp))
+        elif tmp_mic:
+            found.setdefault(_TMP_SMX, (tmp_mic, tmp_interp))
+        else:
+            prefix = ast[max(0, m.start() - 20):m.start()]
+            if 'nducible' not in prefix:
+                found.setdefault(_CLINDAMYCIN, (mic1, interp1))
+            if mic2 and tmp_beside_clinda is None and 'Inducible' not in prefix:
+                tmp_beside_clinda = (mic2, interp2)
+    if _TMP_SMX not in found and tmp_beside_clinda is not None:
+        found[_TMP_SMX] = tmp_beside_clinda
+    return [(drug, *found[drug]) for drug in _DRUG_ORDER if drug in found]
+
+
+def _report_text(pdf):
+    """Page text up to the page holding the AST table footer."""
+    text = ''
+    ast_start = -1
+    for page in pdf.pages:
+        t = page.extract_text()
+        if not t:
+            continue
+        text += t + '\n'
+        if ast_start == -1:
+            ast_start = text.find(AST_HEADER)
+        if ast_start != -1 and text.find(AST_FOOTER, ast_start) != -1:
+            break
+    return text
+
+
+def read_report(pdf_path):
+    """The parts of one Vitek 2 AST-P580 PDF that come from its text alone.
+
+    Returns (sample_id from the isolate line or None, AST rows without a
+    sample_id); rows is None when the PDF cannot be read. This is what the
+    cache stores, so a cached report never carries the name of the file it
+    was first parsed under.
+    """
+    import pdfplumber
+
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            text = _report_text(pdf)
+    except Exception:
+        return None, None
+
+    id_match = _ISOLATE_TEXT_RE.search(text)
+    sample_id = f'ID{int(id_match.group(1)):05d}' if id_match else None
+
+    # Find AST table block
+    ast_start = text.find(AST_HEADER)
+    if ast_start == -1:
+        return sample_id, []
+    ast_end = text.find(AST_FOOTER, ast_start)
+    if ast_end == -1:
+        ast_end = len(text)
+
+    # Convert raw tuples to structured dicts
+    parsed = []
+    for drug_name, mic_raw, interp_raw in parse_ast_table(text[ast_start:ast_end]):
+        p = parse_mic_interp(mic_raw, interp_raw)
+        is_screen = (p['measurement'] in ('POS', 'NEG'))
+        if is_screen:
+            method = 'Screen'
+            units = 'screen'
+        else:
+            method = 'MIC'
+            units = 'mg/L'
+
+        parsed.append({
+            'antibiotic': drug_name,
+            'resistance_phenotype': p['sir'],
+            'measurement': p['measurement'],
+            'measurement_sign': p['sign'],
+            'measurement_units': units,
+            'laboratory_typing_method': method,
+            'testing_standard': 'CLSI',
+            'testing_standard_version': '',
+            'platform': 'Vitek 2',
+            'aes_modified': 'true' if p['aes_modified'] else '',
+            'deduced': 'true' if p['deduced'] else '',
+        })
+
+    return sample_id, parsed
+
+
+def _with_sample_id(pdf_path, report):
+    """Complete a read_report result, taking the isolate ID from the file name if the text has none."""
+    sample_id, rows = report
+    if rows is None:
+        return None, []
+    if sample_id is None:
+        id_match = _ISOLATE_FILE_RE.search(os.path.basename(pdf_path))
+        if not id_match:
+            return None, []
+        sample_id = f'ID{int(id_match.group(1)):05d}'
+    return sample_id, [{'sample_id': sample_id, **row} for row in rows]
+
+
+def parse_vitek_pdf(pdf_path):
+    """Parse one Vitek 2 AST-P580 PDF. Returns (sample_id, list_of_result_dicts)."""
+    return _with_sample_id(pdf_path, read_report(pdf_path))
+
+
+def index_directory(input_dir):
+    """Scan input_dir once; returns (number of PDFs, {sample_id: PDF paths to try in order}).
+
+    Each sample's PDFs are ordered by culture number, lowest first.
+    """
+    candidates = {}
+    with os.scandir(input_dir) as entries:
+        names = sorted(e.name for e in entries
+                       if e.name.endswith('.pdf') and not e.name.startswith('.'))
+    for name in names:
+        # Skip kw24533 duplicates
+        if '-kw24533' in name:
+            continue
+        m = _ISOLATE_FILE_RE.search(name)
+        if not m:
+            continue
+        sample_id = f'ID{int(m.group(1)):05d}'
+        candidates.setdefault(sample_id, []).append((int(m.group(2)), os.path.join(input_dir, name)))
+    return len(names), {sid: [path for _, path in sorted(pdfs)] for sid, pdfs in candidates.items()}
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class ParseCache:
+    """read_report results keyed by (content SHA-256, parser version)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS parsed ("
+                           "digest TEXT NOT NULL, version INTEGER NOT NULL, "
+                           "sample_id TEXT, rows TEXT NOT NULL, PRIMARY KEY (digest, version))")
+        self._conn.execute("DELETE FROM parsed WHERE version != ?", (PARSER_VERSION,))
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest):
+        row = self._conn.execute("SELECT sample_id, rows FROM parsed WHERE digest = ? AND version = ?",
+                                 (digest, PARSER_VERSION)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], json.loads(row[1])
+
+    def put(self, digest, sample_id, rows):
+        self._conn.execute("INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)",
+                           (digest, PARSER_VERSION, sample_id, json.dumps(rows)))
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+
+def _parse_all(paths, cache, workers):
+    """parse_vitek_pdf for each path, from the cache where possible; returns {path: rows}.
+
+    Only read_report runs in the pool and goes through the cache; the file
+    name fallback for the sample ID is applied afterwards, on hits as well.
+    """
+    results = {}
+    digests = {}
+    todo = []
+    for path in paths:
+        if cache:
+            digests[path] = file_digest(path)
+            hit = cache.get(digests[path])
+            if hit is not None:
+                results[path] = _with_sample_id(path, hit)[1]
+                continue
+        todo.append(path)
+
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            parsed = list(pool.map(read_report, todo, chunksize=4))
+    else:
+        parsed = [read_report(path) for path in todo]
+
+    for path, report in zip(todo, parsed):
+        results[path] = _with_sample_id(path, report)[1]
+        if cache:
+            cache.put(digests[path], *report)
+    return results
+
+
+def convert_directory(input_dir, cache_path=None, workers=None):
+    """Parse every sample's reports in input_dir.
+
+    Returns (rows, samples, failed): AST rows in sample order, the number of
+    samples with a PDF, and the best PDF name of each sample where no culture
+    yielded AST data. Raises FileNotFoundError when the directory holds no PDFs.
+    """
+    n_pdfs, candidates = index_directory(input_dir)
+    if not n_pdfs:
+        raise FileNotFoundError(f"No PDF files found in {input_dir}")
+    workers = workers or os.cpu_count() or 1
+    cache = ParseCache(cache_path) if cache_path else None
+    resolved = {}
+    try:
+        # Round n parses the n-th culture of every sample still without AST rows
+        attempt = 0
+        while True:
+            paths = {sid: pdfs[attempt] for sid, pdfs in candidates.items()
+                     if sid not in resolved and attempt < len(pdfs)}
+            if not paths:
+                break
+            parsed = _parse_all(list(paths.values()), cache, workers)
+            for sid, path in paths.items():
+                if parsed[path]:
+                    resolved[sid] = parsed[path]
+            attempt += 1
+    finally:
+        if cache:
+            cache.close()
+
+    rows = []
+    failed = []
+    for sid in sorted(candidates):
+        if sid in resolved:
+            rows.extend(resolved[sid])
+        else:
+            failed.append(os.path.basename(candidates[sid][0]))
+    return rows, len(candidates), failed
@@ -1,59 +1,37 @@
-import requests
-import time
-import xml.etree.ElementTree as ET
+import os
+import sys
 
-EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin"))
+from eutils import EUtilsClient
 
 def find_mrsa_paired():
     # Search for MRSA WGS Paired Illumina
     term = '"Staphylococcus aureus"[Organism] AND "methicillin resistant"[All Fields] AND "paired"[Layout] AND "wgs"[Strategy] AND "illumina"[Platform]'
     
-    params = {
-        "db": "sra",
-        "term": term,
-        "retmode": "json",
-        "retmax": 20 
-    }
-    response = requests.get(f"{EUTILS_BASE}esearch.fcgi", params=params)
-    data = response.json()
-    id_list = data.get("esearchresult", {}).get("idlist", [])
+    # Shared client: pooled session, NCBI rate limit and retries
+    client = EUtilsClient()
+
+    id_list = client.esearch("sra", term, retmax=20).get("idlist", [])
     
     print(f"Found {len(id_list)} candidates. Checking details...")
     
     valid_srrs = []
-    for uid in id_list:
+    if not id_list:
+        print("Selected SRRs:", valid_srrs)
+        return valid_srrs
+
+    # Fetch all candidates in a single batched EFetch, parsed as it streams
+    for exp_pkg in client.iter_sra_packages(id_list, batch_size=len(id_list)):
+        # Double check layout per experiment, not across the whole batch
+        layout = exp_pkg.find(".//LIBRARY_LAYOUT/PAIRED")
+        if layout is None:
+            continue
+        for run in exp_pkg.findall(".//RUN"):
+            srr = run.get("accession")
+            if srr and len(valid_srrs) < 6:
+                valid_srrs.append(srr)
         if len(valid_srrs) >= 6:
             break
-            
-        # Fetch summary to get SRR accession
-        summary_params = {
-            "db": "sra",
-            "id": uid,
-            "rettype": "docsum",
-            "retmode": "json"
-        }
-        # Docsum doesn't always give SRR directly easily in JSON, let's use efetch xml for certainty or run summary
-        # Actually, let's just use efetch XML like the other script
-        fetch_params = {
-            "db": "sra",
-            "id": uid,
-            "rettype": "full",
-            "retmode": "xml"
-        }
-        r = requests.get(f"{EUTILS_BASE}efetch.fcgi", params=fetch_params)
-        if r.status_code != 200: continue
-        
-        try:
-            root = ET.fromstring(r.text)
-            for run in root.findall(".//RUN"):
-                srr = run.get("accession")
-                # Double check layout
-                layout = root.find(".//LIBRARY_LAYOUT/PAIRED")
-                if layout is not None and srr:
-                    valid_srrs.append(srr)
-        except:
-            pass
-        time.sleep(0.2)
 
     print("Selected SRRs:", valid_srrs)
     return valid_srrs
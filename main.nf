@@ -31,8 +31,9 @@ include { SNIPPY; SNIPPY_CORE } from './modules/snippy.nf'
 
 include { SEARCH_SRA } from './modules/search_sra.nf'
 include { FETCH_METADATA } from './modules/fetch_metadata.nf'
-include { AGGREGATOR } from './modules/aggregator.nf'
+include { AGGREGATOR; aggregatorBatch } from './modules/aggregator.nf'
 include { SUMMARY_MERGER } from './modules/summary_merger.nf'
+include { COHORT_STORE } from './modules/cohort_store.nf'
 
 // -- WORKFLOW --
 workflow {
@@ -62,17 +63,22 @@ workflow {
             log.info "Excluding ${exclude_ids.size()} samples"
         }
 
-        // Initialize metadata channel
-        ch_metadata_json = Channel.empty()
+        // Initialize metadata channel: a per-sample SQLite index where one is
+        // produced, otherwise a metadata.json list
+        ch_metadata_store = Channel.empty()
 
         if (params.species) {
             log.info "Running SRA Search for species: ${params.species}"
-            SEARCH_SRA(params.species, params.search_limit)
+            // The ledger is staged in read-only; SEARCH_SRA publishes the updated copy
+            def ledger = params.run_ledger && file(params.run_ledger).exists()
+                ? file(params.run_ledger)
+                : file('NO_LEDGER')
+            SEARCH_SRA(params.species, params.search_limit, ledger)
             input_csv = SEARCH_SRA.out.samplesheet
             
             // Fetch rich metadata using Python module
             FETCH_METADATA(input_csv)
-            ch_metadata_json = FETCH_METADATA.out.metadata_json
+            ch_metadata_store = FETCH_METADATA.out.metadata_index
         } else {
             log.info "Using provided samplesheet: ${params.input}"
             input_csv = Channel.fromPath(params.input, checkIfExists: true)
@@ -84,13 +90,13 @@ workflow {
                     ? Channel.fromPath(params.antibiogram, checkIfExists: true)
                     : Channel.of(file('NO_ANTIBIOGRAM'))
                 VALIDATE_METADATA(ch_meta_csv, ch_abg_csv, input_csv)
-                ch_metadata_json = VALIDATE_METADATA.out.json
+                ch_metadata_store = VALIDATE_METADATA.out.index
             } else if (file('metadata.json').exists()) {
-                ch_metadata_json = Channel.fromPath('metadata.json')
+                ch_metadata_store = Channel.fromPath('metadata.json')
             } else {
                 def dummy = file("${workDir}/metadata.json")
                 dummy.text = '[]'
-                ch_metadata_json = Channel.of(dummy)
+                ch_metadata_store = Channel.of(dummy)
             }
         }
 
@@ -183,10 +189,13 @@ workflow {
         // Trimmomatic log and FastQC output
         ch_trim_log = TRIMMOMATIC.out.log
         ch_fastqc_out = FASTQC.out.map { id, files -> [id, files] }
+        // Trimmed reads for the exact Q30/read-QC pass (empty when --read_qc false)
+        ch_qc_reads = TRIMMOMATIC.out.trimmed_reads.map { id, files -> [id, params.read_qc ? files : []] }
         
         // Join all outputs by sample_id
         ch_agg_in = ch_trim_log
             .join(ch_fastqc_out)
+            .join(ch_qc_reads)
             .join(QUAST.out)
             .join(MLST.out)
             .join(ABRICATE.out)
@@ -197,16 +206,32 @@ workflow {
             .join(AGR_TYPING.out.report)
             .join(KMA.out.results)
             
-        // Combine with metadata.json
-        ch_agg_final = ch_agg_in.combine(ch_metadata_json)
+        // Combine with the metadata store and aggregate many samples per task
+        ch_agg_final = ch_agg_in
+            .combine(ch_metadata_store)
+            .collate(params.aggregate_batch_size)
+            .map { batch -> aggregatorBatch(batch) }
         
         AGGREGATOR(ch_agg_final)
         
         // Collect all summary CSVs and merge them
-        SUMMARY_MERGER(AGGREGATOR.out[1].collect())
+        SUMMARY_MERGER(AGGREGATOR.out.summaries.flatten().collect())
+
+        // Upsert this run's samples into the persistent cohort store
+        if (params.cohort_db) {
+            // Staged in read-only; COHORT_STORE publishes the updated copy
+            def cohort_db = file(params.cohort_db).exists()
+                ? file(params.cohort_db)
+                : file('NO_COHORT_DB')
+            COHORT_STORE(
+                AGGREGATOR.out.reports.flatten().collect(),
+                AGGREGATOR.out.summaries.flatten().collect(),
+                cohort_db
+            )
+        }
 
         // --- Visualization ---
-        VISUALIZATION(SUMMARY_MERGER.out)
+        VISUALIZATION(SUMMARY_MERGER.out.summary)
 
         // Pangenome and Phylogeny
         ch_seed_tree = params.iqtree_seed
@@ -0,0 +1,40 @@
+nextflow.enable.dsl=2
+
+process COHORT_STORE {
+    publishDir "${params.outdir}/cohort", mode: 'copy', overwrite: true
+    container 'python:3.9-slim'
+
+    input:
+    path reports
+    path summaries
+    path cohort_db, stageAs: 'cohort_in/*'
+
+    output:
+    path "cohort.sqlite", emit: db
+    path "cohort_changes.tsv", emit: changes
+    path "cohort_summary.tsv", optional: true, emit: summary
+    path "cohort_summary.parquet", optional: true, emit: parquet
+
+    script:
+    // The previous store is staged in and only read; this run's samples are
+    // upserted into a copy, which is published for the next run
+    def previous = cohort_db.name != 'NO_COHORT_DB' ? cohort_db : ''
+    """
+    if [ -n "${previous}" ]; then
+        cp "${previous}" cohort.sqlite
+    fi
+
+    find . -maxdepth 1 -name '*_report.json' | sort > reports.txt
+
+    python ${projectDir}/bin/staphit_cohort.py ingest --db cohort.sqlite --manifest reports.txt \\
+        --changes cohort_changes.tsv
+
+    # A full export reads every sample in the store, so it only runs on request
+    if [ "${params.cohort_export}" = "true" ]; then
+        pip install pyarrow > /dev/null
+        python ${projectDir}/bin/staphit_cohort.py export --db cohort.sqlite \\
+            --output cohort_summary.tsv \\
+            --parquet cohort_summary.parquet
+    fi
+    """
+}
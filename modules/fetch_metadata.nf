@@ -10,6 +10,7 @@ process FETCH_METADATA {
     output:
     path "metadata.csv", emit: metadata_csv
     path "metadata.json", emit: metadata_json
+    path "metadata.sqlite", emit: metadata_index
 
     shell:
     '''
@@ -18,11 +19,13 @@ process FETCH_METADATA {
     cat << 'EOF' > fetch_metadata.py
 import csv
 import json
-import requests
-import xml.etree.ElementTree as ET
-import time
 import sys
 
+sys.path.insert(0, "!{projectDir}/bin")
+from eutils import EUtilsClient, biosample_accession, split_runinfo
+from metadata_index import MetadataIndex
+from ncbi_cache import ResponseCache
+
 # Read samples from samplesheet
 runs = []
 try:
@@ -42,140 +45,76 @@ if not runs:
         print("run_id,biosample", file=f)
     with open("metadata.json", "w") as f:
         f.write("[]")
+    MetadataIndex("metadata.sqlite").close()
     sys.exit(0)
 
 print(f"Fetching metadata for {len(runs)} runs...")
 
-def chunks(lst, n):
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+# Shared client: NCBI rate limit (NCBI_API_KEY aware), retries, concurrent pages.
+# With --ncbi_cache, runs and BioSamples seen in earlier runs are not re-downloaded.
+cache_path = "!{params.ncbi_cache ?: ''}"
+cache = ResponseCache(cache_path) if cache_path else None
+client = EUtilsClient(cache=cache, offline=cache is not None and "!{params.ncbi_offline}" == "true")
 
-base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+# Both steps EPost the uncached accessions once and page through the single
+# WebEnv with retstart/retmax, several pages in flight at once.
+RUNINFO_PAGE_SIZE = 1000
+BIOSAMPLE_PAGE_SIZE = 500
 
 # Step 1: Get RunInfo to find BioSamples
 print("Step 1: getting BioSample IDs from RunInfo")
 run_to_biosample = {}
 biosample_to_runs = {}
 
-for chunk in chunks(runs, 200):
-    params = {
-        "db": "sra",
-        "id": ",".join(chunk),
-        "rettype": "runinfo",
-        "retmode": "text"
-    }
-    try:
-        resp = requests.post(f"{base_url}efetch.fcgi", data=params)
-        if resp.status_code != 200: continue
-        
-        # Use splitlines() to avoid escaping issues
-        lines = resp.text.strip().splitlines()
-        if len(lines) < 2: continue
-        
-        reader = csv.DictReader(lines)
-        for row in reader:
-            r = row.get("Run")
-            b = row.get("BioSample")
-            if r and b:
-                run_to_biosample[r] = b
-                if b not in biosample_to_runs: biosample_to_runs[b] = []
-                biosample_to_runs[b].append(r)
-    except Exception as e:
-        print(f"Error in Step 1: {e}")
+runinfo = client.cached_records("sra", "runinfo", runs, None, split_runinfo,
+                                batch_size=RUNINFO_PAGE_SIZE, retmode="text")
+for record in runinfo.values():
+    # Each cached record is the RunInfo header line plus one run row
+    reader = csv.DictReader(record.splitlines())
+    for row in reader:
+        r = row.get("Run")
+        b = row.get("BioSample")
+        if r and b:
+            run_to_biosample[r] = b
+            if b not in biosample_to_runs: biosample_to_runs[b] = []
+            biosample_to_runs[b].append(r)
 
 biosamples = list(biosample_to_runs.keys())
 print(f"Found {len(biosamples)} unique BioSamples.")
 
 # Step 2: Get Attributes from BioSample DB
-# We must use ESearch to resolve Accessions (SAMEA...) to UIDs, then EFetch.
+# EPost resolves the accessions (SAMN/SAMEA...) directly, no ESearch needed.
+# Each BioSample is parsed as it streams in and its runs are written out
+# immediately (Step 3), so memory does not grow with the number of samples.
 print("Step 2: getting Attributes from BioSample DB")
-biosample_data = {}
 
-for chunk in chunks(biosamples, 100):
-    # Join with OR to search multiple accessions
-    query = " OR ".join(chunk)
+def parse_biosample(sample):
+    data = {}
     
-    # ESearch with history
-    params = {
-        "db": "biosample",
-        "term": query,
-        "usehistory": "y"
-    }
+    # IDs
+    ids = sample.find("Ids")
+    if ids is not None:
+        for id_node in ids.findall("Id"):
+            if id_node.get("db") == "SRA":
+                data["sra_sample"] = id_node.text
+            if id_node.get("db") == "Sample name":
+                data["sample_name"] = id_node.text
     
-    try:
-        resp = requests.post(f"{base_url}esearch.fcgi", data=params)
-        if resp.status_code != 200:
-            print(f"ESearch failed: {resp.status_code}")
-            continue
-            
-        root = ET.fromstring(resp.content)
-        webenv = root.find("WebEnv")
-        query_key = root.find("QueryKey")
-        
-        if webenv is None or query_key is None:
-            print("No WebEnv found in ESearch response")
-            continue
-            
-        webenv = webenv.text
-        query_key = query_key.text
-        
-        # EFetch using History
-        fetch_params = {
-            "db": "biosample",
-            "query_key": query_key,
-            "WebEnv": webenv,
-            "rettype": "full",
-            "retmode": "xml"
-        }
-        
-        fetch_resp = requests.post(f"{base_url}efetch.fcgi", data=fetch_params)
-        if fetch_resp.status_code != 200:
-            print(f"EFetch failed: {fetch_resp.status_code}")
-            continue
-            
-        fetch_root = ET.fromstring(fetch_resp.content)
-        
-        for sample in fetch_root.findall("BioSample"):
-            acc = sample.get("accession")
-            if not acc: continue
-            
-            data = {}
-            
-            # IDs
-            ids = sample.find("Ids")
-            if ids is not None:
-                for id_node in ids.findall("Id"):
-                    if id_node.get("db") == "SRA":
-                        data["sra_sample"] = id_node.text
-                    if id_node.get("db") == "Sample name":
-                        data["sample_name"] = id_node.text
-            
-            # Attributes
-            attrs = sample.find("Attributes")
-            if attrs is not None:
-                for attr in attrs.findall("Attribute"):
-                    key = attr.get("attribute_name")
-                    val = attr.text
-                    if key and val:
-                        clean_key = attr.get("harmonized_name") or key.lower().replace(" ", "_")
-                        data[clean_key] = val
-            
-            biosample_data[acc] = data
-            
-    except Exception as e:
-        print(f"Error in Step 2 chunk: {e}")
+    # Attributes
+    attrs = sample.find("Attributes")
+    if attrs is not None:
+        for attr in attrs.findall("Attribute"):
+            key = attr.get("attribute_name")
+            val = attr.text
+            if key and val:
+                clean_key = attr.get("harmonized_name") or key.lower().replace(" ", "_")
+                data[clean_key] = val
+    return data
 
 # Step 3: Compile results
-final_json = []
-csv_rows = []
 csv_headers = ["run_id", "biosample", "subject_id", "collection_date", "geo_loc_name", "host", "isolation_source", "resistance_profile"]
 
-for run in runs:
-    bs = run_to_biosample.get(run)
-    if not bs: continue
-    
-    info = biosample_data.get(bs, {})
-    
+def write_run(run, bs, info):
     record = {
         "run_id": run,
         "biosample": bs,
@@ -188,14 +127,18 @@ for run in runs:
     for k in ["collection_date", "geo_loc_name", "host", "isolation_source"]:
         if k in info:
             record[k] = info[k]
-            
-    final_json.append(record)
+    
+    # JSON array written one record at a time
+    json_out.write(",\\n" if write_run.count else "\\n")
+    json_out.write(json.dumps(record, indent=2))
+    index.add(record)
+    write_run.count += 1
     
     # CSV
     res_prof = info.get("antimicrobial_resistance", "") or info.get("genotype", "")
     res_prof = res_prof.replace(",", ";")
     
-    row = {
+    writer.writerow({
         "run_id": run,
         "biosample": bs,
         "subject_id": info.get("subject_id", ""),
@@ -204,18 +147,38 @@ for run in runs:
         "host": info.get("host", ""),
         "isolation_source": info.get("isolation_source", ""),
         "resistance_profile": res_prof
-    }
-    csv_rows.append(row)
+    })
 
-# Write Output
-with open("metadata.json", "w") as f:
-    json.dump(final_json, f, indent=2)
+write_run.count = 0
 
-with open("metadata.csv", "w") as f:
-    writer = csv.DictWriter(f, fieldnames=csv_headers)
+# Write Output (plus a per-run SQLite index so AGGREGATOR reads one record)
+index = MetadataIndex("metadata.sqlite")
+with open("metadata.json", "w") as json_out, open("metadata.csv", "w") as csv_out:
+    writer = csv.DictWriter(csv_out, fieldnames=csv_headers)
     writer.writeheader()
-    for r in csv_rows:
-        writer.writerow(r)
+    json_out.write("[")
+    
+    pending = dict(biosample_to_runs)
+    records = client.iter_xml_records("biosample", "full", biosamples, None,
+                                      "BioSample", biosample_accession,
+                                      batch_size=BIOSAMPLE_PAGE_SIZE)
+    for acc, sample in records:
+        if acc not in pending: continue
+        info = parse_biosample(sample)
+        for run in pending.pop(acc):
+            write_run(run, acc, info)
+    
+    # Runs whose BioSample could not be fetched keep their empty attributes
+    for bs, bs_runs in pending.items():
+        for run in bs_runs:
+            write_run(run, bs, {})
+    
+    json_out.write("\\n]" if write_run.count else "]")
+index.close()
+
+if cache is not None:
+    print(cache.summary())
+    cache.close()
 
 print("Done.")
 EOF
@@ -2,19 +2,40 @@ nextflow.enable.dsl=2
 
 process SEARCH_SRA {
     container 'ncbi/edirect:latest'
-    publishDir '.', mode: 'copy', overwrite: true
+    publishDir '.', mode: 'copy', overwrite: true, pattern: 'samplesheet.csv'
+    publishDir "${params.outdir}", mode: 'copy', overwrite: true, pattern: 'run_ledger.csv'
 
     input:
     val species
     val limit
+    path ledger, stageAs: 'ledger_in/*'
 
     output:
     path "samplesheet.csv", emit: samplesheet
+    path "run_ledger.csv", optional: true, emit: ledger
 
     shell:
     '''
     # Search for paired-end Illumina runs for the species
     query="!{species} AND paired[Layout] AND illumina[Platform]"
+
+    # Run ledger (accession,first_seen,status) shared with search_datasets.py.
+    # The previous ledger is staged in and only read; the updated copy is
+    # written to run_ledger.csv and published. With --since_ledger, NCBI only
+    # returns runs published since the last sweep, and runs already in the
+    # ledger are skipped unless marked failed.
+    previous="!{ledger.name != 'NO_LEDGER' ? ledger : ''}"
+    record="!{params.run_ledger ? 'true' : ''}"
+    : > seen_runs.txt
+    if [ "!{params.since_ledger}" = "true" ] && [ -n "$previous" ] && [ -s "$previous" ]; then
+        tail -n +2 "$previous" | tr -d '\\r' > previous_runs.csv
+        awk -F ',' '$3 != "failed" {print $1}' previous_runs.csv > seen_runs.txt
+        since=$(cut -d ',' -f 2 previous_runs.csv | sort | tail -n 1)
+        if [ -n "$since" ]; then
+            query="$query AND $(echo "$since" | tr '-' '/'):3000[PDAT]"
+            echo "Incremental mode: $(wc -l < seen_runs.txt) runs in ledger, last sweep $since"
+        fi
+    fi
     
     echo "Searching NCBI SRA for: $query"
     
@@ -29,8 +50,8 @@ process SEARCH_SRA {
     fi
 
     # 2. Filter for valid runs and select top N
-    # Extract Run IDs of valid runs (spots > 0)
-    tail -n +2 runinfo.csv | awk -F ',' '$4 > 0 {print $1}' | head -n !{limit} > selected_runs.txt
+    # Extract Run IDs of valid runs (spots > 0), skipping runs already in the ledger
+    tail -n +2 runinfo.csv | awk -F ',' '$4 > 0 {print $1}' | grep -vxF -f seen_runs.txt | head -n !{limit} > selected_runs.txt
     
     count=$(wc -l < selected_runs.txt)
     if [ "$count" -eq 0 ]; then
@@ -46,5 +67,23 @@ process SEARCH_SRA {
     done < selected_runs.txt
 
     echo "Generated samplesheet.csv"
+
+    # 4. Write the updated ledger: the previous runs plus the selected ones,
+    #    new runs and retried failed runs with status 'selected'
+    if [ -n "$record" ]; then
+        echo "accession,first_seen,status" > run_ledger.csv
+        if [ -n "$previous" ] && [ -s "$previous" ]; then
+            tail -n +2 "$previous" | tr -d '\\r' | awk -F ',' -v OFS=',' '{print $1, $2, ($3 == "" ? "selected" : $3)}' >> run_ledger.csv
+        fi
+        today=$(date +%Y-%m-%d)
+        while read run; do
+            if grep -q "^$run," run_ledger.csv; then
+                awk -F ',' -v OFS=',' -v run="$run" '$1 == run && $3 == "failed" {$3 = "selected"} {print}' \\
+                    run_ledger.csv > run_ledger.tmp && mv run_ledger.tmp run_ledger.csv
+            else
+                echo "$run,$today,selected" >> run_ledger.csv
+            fi
+        done < selected_runs.txt
+    fi
     '''
 }
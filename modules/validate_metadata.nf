@@ -13,18 +13,27 @@ process VALIDATE_METADATA {
 
     output:
     path "metadata.json", emit: json
+    path "metadata.sqlite", emit: index
+    path "validation.json", emit: validation
 
     script:
     def abg_flag = antibiogram_csv.name != 'NO_ANTIBIOGRAM' ? "--antibiogram ${antibiogram_csv}" : ''
+    def strict_flag = params.metadata_strict ? '--strict' : ''
     """
+    # Exits 1 on unreadable input and 2 on errors (or any warning with --strict),
+    # failing the task before normalize runs; validation.json holds every issue
     python ${projectDir}/bin/staphit-metadata validate \
         --metadata ${metadata_csv} \
         --samplesheet ${samplesheet} \
-        ${abg_flag}
+        ${abg_flag} \
+        --format json \
+        -o validation.json \
+        ${strict_flag}
 
     python ${projectDir}/bin/staphit-metadata normalize \
         --metadata ${metadata_csv} \
         ${abg_flag} \
-        -o metadata.json
+        -o metadata.json \
+        --index metadata.sqlite
     """
 }
@@ -1,144 +1,133 @@
 import argparse
 import csv
-import requests
 import xml.etree.ElementTree as ET
 import os
 import re
-import time
+import sys
 
-# Base URL for NCBI E-utilities
-EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-NCBI_API_KEY = os.environ.get("NCBI_API_KEY") # Optional: set NCBI_API_KEY environment variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin"))
+from eutils import EUtilsClient, EUtilsError, iter_xml_elements
+from fastq_scan import add_scan_arguments, pair_fastqs, scan_fastqs
+from fastq_validate import add_validate_arguments, validate_samples
+from ncbi_cache import add_cache_arguments, cache_from_args
 
-def esearch_sra(term: str) -> list:
+# UIDs per EFetch request; NCBI accepts up to 10,000 but large SRA XML
+# responses time out well before that.
+EFETCH_BATCH_SIZE = 500
+
+# Shared client: pooled session, NCBI rate limit (NCBI_API_KEY aware) and retries
+CLIENT = EUtilsClient()
+
+def esearch_sra(term: str):
     """
-    Searches the SRA database for a given term (SRR, SRP, SRX) and returns a list of UIDs.
-    If an SRP is given, it will return UIDs for all associated SRR runs.
+    Searches the SRA database for a given term (SRR, SRP, SRX, or any Entrez query).
+    If an SRP is given, it will match UIDs for all associated SRR runs.
+    Returns (total hit count, iterator of UIDs). UIDs are paged lazily from
+    ESearch, so result sets beyond the 10,000-UID cap are neither truncated
+    nor held in memory.
     """
-    params = {
-        "db": "sra",
-        "term": term,
-        "retmode": "json",
-        "retmax": 10000 # Max UIDs
-    }
-    if NCBI_API_KEY:
-        params["api_key"] = NCBI_API_KEY
-
     try:
-        response = requests.get(f"{EUTILS_BASE}esearch.fcgi", params=params)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("esearchresult", {}).get("idlist", [])
-    except requests.exceptions.RequestException as e:
+        count, pages = CLIENT.esearch_pages("sra", term)
+    except EUtilsError as e:
         print(f"Error during ESearch for term '{term}': {e}")
-        return []
+        return 0, iter(())
+    return count, (uid for page in pages for uid in page)
 
-def efetch_sra_xml(uid: str) -> str | None:
+def efetch_sra_packages(uids: list):
     """
-    Fetches detailed SRA metadata in XML format for a given UID.
+    Streams detailed SRA metadata for a list of UIDs, one EXPERIMENT_PACKAGE
+    element at a time. Batches of EFETCH_BATCH_SIZE are fetched concurrently;
+    with a cache attached, only records not seen before are downloaded.
     """
-    params = {
-        "db": "sra",
-        "id": uid,
-        "rettype": "full",
-        "retmode": "xml"
-    }
-    if NCBI_API_KEY:
-        params["api_key"] = NCBI_API_KEY
-
-    try:
-        response = requests.get(f"{EUTILS_BASE}efetch.fcgi", params=params)
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.RequestException as e:
-        print(f"Error during EFetch for UID '{uid}': {e}")
-        return None
+    return CLIENT.iter_sra_packages(uids, batch_size=EFETCH_BATCH_SIZE)
 
-def parse_sra_xml_to_samples(xml_string: str) -> list:
+def parse_sra_xml_to_samples(xml_source):
     """
-    Parses SRA XML string (from EFetch) and extracts metadata for each run.
-    Returns a list of dictionaries, one for each SRR found.
+    Parses SRA XML (a string, bytes or binary file from EFetch) and extracts
+    metadata for each run. Yields one dictionary for each SRR found.
     """
-    samples_data = []
     try:
-        root = ET.fromstring(xml_string)
+        for experiment_package in iter_xml_elements(xml_source, "EXPERIMENT_PACKAGE"):
+            yield from parse_sra_package_to_samples(experiment_package)
+    except ET.ParseError as e:
+        print(f"Error parsing SRA XML: {e}")
 
-        for experiment_package in root.findall(".//EXPERIMENT_PACKAGE"):
-            study_accession = experiment_package.find(".//STUDY_REF").get("accession") if experiment_package.find(".//STUDY_REF") is not None else ""
-            study_title = experiment_package.find(".//STUDY/DESCRIPTOR/STUDY_TITLE").text if experiment_package.find(".//STUDY/DESCRIPTOR/STUDY_TITLE") is not None else ""
+def parse_sra_package_to_samples(experiment_package):
+    """
+    Extracts metadata for each run of a single EXPERIMENT_PACKAGE element.
+    Yields one dictionary for each SRR found.
+    """
+    study_accession = experiment_package.find(".//STUDY_REF").get("accession") if experiment_package.find(".//STUDY_REF") is not None else ""
+    study_title = experiment_package.find(".//STUDY/DESCRIPTOR/STUDY_TITLE").text if experiment_package.find(".//STUDY/DESCRIPTOR/STUDY_TITLE") is not None else ""
 
-            sample_accession = experiment_package.find(".//SAMPLE_REF").get("accession") if experiment_package.find(".//SAMPLE_REF") is not None else ""
-            sample_title = experiment_package.find(".//SAMPLE/TITLE").text if experiment_package.find(".//SAMPLE/TITLE") is not None else ""
-            organism = experiment_package.find(".//SAMPLE/SAMPLE_NAME/TAXON_SCIENTIFIC_NAME").text if experiment_package.find(".//SAMPLE/SAMPLE_NAME/TAXON_SCIENTIFIC_NAME") is not None else ""
-            
-            # Extract attributes like collection_date, geo_loc_name, host, isolation_source
-            collection_date = ""
-            geo_location = ""
-            host = ""
-            isolation_source = ""
-            
-            for attr in experiment_package.findall(".//SAMPLE/SAMPLE_ATTRIBUTES/SAMPLE_ATTRIBUTE"):
-                tag = attr.find("TAG")
-                value = attr.find("VALUE")
-                if tag is not None and value is not None:
-                    if tag.text == "collection_date":
-                        collection_date = value.text
-                    elif tag.text == "geo_loc_name":
-                        geo_location = value.text
-                    elif tag.text == "host":
-                        host = value.text
-                    elif tag.text == "isolation_source":
-                        isolation_source = value.text
-            
-            for run_node in experiment_package.findall(".//RUN"):
-                srr_accession = run_node.get("accession")
-                library_layout_node = run_node.find(".//LIBRARY_LAYOUT")
-                is_paired = library_layout_node.find("PAIRED") is not None if library_layout_node is not None else False
-                total_spots = run_node.find(".//Statistics/Spots").text if run_node.find(".//Statistics/Spots") is not None else ""
+    sample_accession = experiment_package.find(".//SAMPLE_REF").get("accession") if experiment_package.find(".//SAMPLE_REF") is not None else ""
+    sample_title = experiment_package.find(".//SAMPLE/TITLE").text if experiment_package.find(".//SAMPLE/TITLE") is not None else ""
+    organism = experiment_package.find(".//SAMPLE/SAMPLE_NAME/TAXON_SCIENTIFIC_NAME").text if experiment_package.find(".//SAMPLE/SAMPLE_NAME/TAXON_SCIENTIFIC_NAME") is not None else ""
+    
+    # Extract attributes like collection_date, geo_loc_name, host, isolation_source
+    collection_date = ""
+    geo_location = ""
+    host = ""
+    isolation_source = ""
+    
+    for attr in experiment_package.findall(".//SAMPLE/SAMPLE_ATTRIBUTES/SAMPLE_ATTRIBUTE"):
+        tag = attr.find("TAG")
+        value = attr.find("VALUE")
+        if tag is not None and value is not None:
+            if tag.text == "collection_date":
+                collection_date = value.text
+            elif tag.text == "geo_loc_name":
+                geo_location = value.text
+            elif tag.text == "host":
+                host = value.text
+            elif tag.text == "isolation_source":
+                isolation_source = value.text
+    
+    for run_node in experiment_package.findall(".//RUN"):
+        srr_accession = run_node.get("accession")
+        library_layout_node = run_node.find(".//LIBRARY_LAYOUT")
+        is_paired = library_layout_node.find("PAIRED") is not None if library_layout_node is not None else False
+        total_spots = run_node.find(".//Statistics/Spots").text if run_node.find(".//Statistics/Spots") is not None else ""
 
-                samples_data.append({
-                    "sample": srr_accession, # Use SRR as sample name for SRA downloads
-                    "sra": srr_accession,
-                    "fastq_1": "",
-                    "fastq_2": "",
-                    "organism": organism,
-                    "collection_date": collection_date,
-                    "geo_location": geo_location,
-                    "host": host,
-                    "isolation_source": isolation_source,
-                    "study_accession": study_accession,
-                    "study_title": study_title,
-                    "read_count_raw": total_spots,
-                    "library_layout": "PAIRED" if is_paired else "SINGLE"
-                })
-        
-    except ET.ParseError as e:
-        print(f"Error parsing SRA XML: {e}")
-    return samples_data
+        yield {
+            "sample": srr_accession, # Use SRR as sample name for SRA downloads
+            "sra": srr_accession,
+            "fastq_1": "",
+            "fastq_2": "",
+            "organism": organism,
+            "collection_date": collection_date,
+            "geo_location": geo_location,
+            "host": host,
+            "isolation_source": isolation_source,
+            "study_accession": study_accession,
+            "study_title": study_title,
+            "read_count_raw": total_spots,
+            "library_layout": "PAIRED" if is_paired else "SINGLE"
+        }
 
-def process_sra_accession(accession: str) -> list:
+def process_sra_accession(accession: str):
     """
     Fetches and processes metadata for a single SRA accession (SRR, SRP, SRX).
-    Returns a list of sample dictionaries.
+    Yields sample dictionaries as each EXPERIMENT_PACKAGE is parsed.
     """
     print(f"Processing SRA accession: {accession}")
-    uids = esearch_sra(accession)
-    if not uids:
+    count, uids = esearch_sra(accession)
+    if not count:
         print(f"Warning: No SRA UIDs found for '{accession}'. Skipping.")
-        return []
-    
-    all_sra_metadata = []
-    for uid in uids:
-        xml_data = efetch_sra_xml(uid)
-        if xml_data:
-            all_sra_metadata.extend(parse_sra_xml_to_samples(xml_data))
-        else:
-            print(f"Warning: Could not fetch XML for UID '{uid}'. Skipping.")
-        time.sleep(0.1) # Be kind to NCBI servers
+        return
+    print(f"Found {count} SRA UIDs for '{accession}'.")
     
     # Filter to unique SRR accessions
-    unique_srr_samples = {s["sample"]: s for s in all_sra_metadata if s["sra"].startswith("SRR")}.values()
-    return list(unique_srr_samples)
+    seen = set()
+    try:
+        for experiment_package in efetch_sra_packages(uids):
+            for sample in parse_sra_package_to_samples(experiment_package):
+                if sample["sra"].startswith("SRR") and sample["sample"] not in seen:
+                    seen.add(sample["sample"])
+                    yield sample
+    except EUtilsError as e:
+        print(f"Error paging ESearch results for '{accession}': {e}. "
+              f"Samplesheet is incomplete for this accession.")
 
 def process_local_files(r1_path: str, r2_path: str = None) -> dict:
     """
@@ -168,56 +157,14 @@ def process_local_files(r1_path: str, r2_path: str = None) -> dict:
         "library_layout": "PAIRED" if r2_path else "SINGLE"
     }
 
-def find_fastq_pairs(directory: str) -> list:
+def find_fastq_pairs(directory: str, manifest: str = None) -> list:
     """
-    Scans a directory for FastQ files and pairs them based on common suffixes.
+    Scans a directory (recursively) for FastQ files and pairs them based on
+    common suffixes (_R1/_R2, _1/_2, optionally followed by _001).
     Returns a list of (r1, r2) tuples.
     """
-    fastq_files = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if re.search(r'\.(fastq|fq)(\.gz)?$', file, re.IGNORECASE):
-                fastq_files.append(os.path.join(root, file))
-    
-    pairs = {}
-    # Common paired-end suffixes
-    # (suffix_pattern, r1_marker, r2_marker)
-    # We try to match R1 first, then look for R2
-    patterns = [
-        (r'(_R1)(_001)?\.(fastq|fq)(\.gz)?$', '_R1', '_R2'),
-        (r'(_1)(_001)?\.(fastq|fq)(\.gz)?$', '_1', '_2')
-    ]
-
-    processed_files = set()
-
-    for f in sorted(fastq_files):
-        if f in processed_files:
-            continue
-            
-        matched = False
-        for pattern, r1_marker, r2_marker in patterns:
-            match = re.search(pattern, f, re.IGNORECASE)
-            if match:
-                # This is a potential R1 file
-                r1_path = f
-                # Construct expected R2 path
-                r2_path = f.replace(r1_marker, r2_marker)
-                
-                if os.path.exists(r2_path) and r2_path in fastq_files:
-                    pairs[r1_path] = r2_path
-                    processed_files.add(r1_path)
-                    processed_files.add(r2_path)
-                    matched = True
-                    break
-        
-        if not matched:
-            # If it didn't match R1 pattern, check if it's an R2 file that we haven't processed yet
-            # (though sorted order usually handles R1 first).
-            # Or it might be a single-end file (which we currently skip or handle as single?)
-            # For now, we only return pairs as requested.
-            pass
-
-    return list(pairs.items())
+    pairs, _ = pair_fastqs(scan_fastqs(directory, recursive=True, manifest=manifest))
+    return [(p["fastq_1"], p["fastq_2"]) for p in pairs]
 
 def main():
     parser = argparse.ArgumentParser(
@@ -236,54 +183,14 @@ def main():
     parser.add_argument("-d", "--input-dir", 
                         help="Directory to scan for paired FastQ files. "
                              "Automatically pairs files with _R1/_R2 or _1/_2 suffixes.")
+    add_scan_arguments(parser)
+    add_validate_arguments(parser)
+    add_cache_arguments(parser)
     
     args = parser.parse_args()
 
-    all_samples = []
-
-    # Process SRA accessions
-    for sra_accession in args.sra:
-        sra_records = process_sra_accession(sra_accession)
-        all_samples.extend(sra_records)
-
-    # Process local FastQ files from manual list
-    if args.fastq:
-        if len(args.fastq) % 2 != 0:
-            print("Error: Local FastQ files must be provided in R1 R2 pairs.")
-            exit(1)
-        
-        for i in range(0, len(args.fastq), 2):
-            r1 = args.fastq[i]
-            r2 = args.fastq[i+1]
-            try:
-                local_record = process_local_files(r1, r2)
-                all_samples.append(local_record)
-            except FileNotFoundError as e:
-                print(f"Error processing local files: {e}. Skipping.")
-            except Exception as e:
-                print(f"An unexpected error occurred for local files {r1}, {r2}: {e}. Skipping.")
-
-    # Process local FastQ files from directory
-    if args.input_dir:
-        if not os.path.isdir(args.input_dir):
-            print(f"Error: Input directory '{args.input_dir}' does not exist.")
-        else:
-            print(f"Scanning directory '{args.input_dir}' for FastQ pairs...")
-            pairs = find_fastq_pairs(args.input_dir)
-            if not pairs:
-                print("No paired FastQ files found in directory.")
-            
-            for r1, r2 in pairs:
-                try:
-                    local_record = process_local_files(r1, r2)
-                    all_samples.append(local_record)
-                    print(f"Found pair: {os.path.basename(r1)} / {os.path.basename(r2)}")
-                except Exception as e:
-                    print(f"Error processing pair {r1}, {r2}: {e}")
-
-    if not all_samples:
-        print("No samples processed. Samplesheet will not be created.")
-        return
+    global CLIENT
+    CLIENT = EUtilsClient(cache=cache_from_args(args), offline=args.offline)
 
     # Define CSV fieldnames
     fieldnames = [
@@ -292,14 +199,73 @@ def main():
         "study_accession", "study_title", "read_count_raw", "library_layout"
     ]
 
-    # Write samplesheet
+    # Rows are written as soon as they are parsed, so only one SRA
+    # EXPERIMENT_PACKAGE is held in memory at a time.
     with open(args.output, 'w', newline='') as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
-        for sample_data in all_samples:
+        written = 0
+
+        # Process SRA accessions
+        for sra_accession in args.sra:
+            for sample_data in process_sra_accession(sra_accession):
+                writer.writerow(sample_data)
+                written += 1
+
+        if CLIENT.cache is not None:
+            print(CLIENT.cache.summary())
+            CLIENT.cache.close()
+
+        # Local pairs are collected first so that --validate can check them in parallel
+        local_records = []
+
+        # Process local FastQ files from manual list
+        if args.fastq:
+            if len(args.fastq) % 2 != 0:
+                print("Error: Local FastQ files must be provided in R1 R2 pairs.")
+                csvfile.close()
+                os.remove(args.output)
+                exit(1)
+            
+            for i in range(0, len(args.fastq), 2):
+                r1 = args.fastq[i]
+                r2 = args.fastq[i+1]
+                try:
+                    local_records.append(process_local_files(r1, r2))
+                except FileNotFoundError as e:
+                    print(f"Error processing local files: {e}. Skipping.")
+                except Exception as e:
+                    print(f"An unexpected error occurred for local files {r1}, {r2}: {e}. Skipping.")
+
+        # Process local FastQ files from directory
+        if args.input_dir:
+            if not os.path.isdir(args.input_dir):
+                print(f"Error: Input directory '{args.input_dir}' does not exist.")
+            else:
+                print(f"Scanning directory '{args.input_dir}' for FastQ pairs...")
+                pairs = find_fastq_pairs(args.input_dir, args.scan_cache)
+                if not pairs:
+                    print("No paired FastQ files found in directory.")
+                
+                for r1, r2 in pairs:
+                    try:
+                        local_records.append(process_local_files(r1, r2))
+                        print(f"Found pair: {os.path.basename(r1)} / {os.path.basename(r2)}")
+                    except Exception as e:
+                        print(f"Error processing pair {r1}, {r2}: {e}")
+
+        if args.validate and local_records:
+            local_records = validate_samples(local_records, args.threads)
+        for sample_data in local_records:
             writer.writerow(sample_data)
+            written += 1
+
+    if not written:
+        os.remove(args.output)
+        print("No samples processed. Samplesheet will not be created.")
+        return
     
-    print(f"\nSuccessfully created samplesheet: {args.output} with {len(all_samples)} entries.")
+    print(f"\nSuccessfully created samplesheet: {args.output} with {written} entries.")
 
 if __name__ == "__main__":
     main()
@@ -1,189 +1,221 @@
 import argparse
 import csv
-import requests
+import math
 import xml.etree.ElementTree as ET
-import time
 import os
+import sys
 
-# Base URL for NCBI E-utilities
-EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-NCBI_API_KEY = os.environ.get("NCBI_API_KEY")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin"))
+from eutils import ESEARCH_PAGE_SIZE, EUtilsClient, EUtilsError, iter_xml_elements
+from ncbi_cache import add_cache_arguments, cache_from_args
+from run_ledger import RunLedger, pdat_window
 
-def esearch_organism(organism_name: str, max_results: int = 6) -> list:
+# UIDs per EFetch request; batches run concurrently up to the NCBI rate limit
+EFETCH_BATCH_SIZE = 200
+
+# Runs with fewer spots than this are rejected as failed/empty sequencing
+MIN_SPOTS = 10000
+
+# Lower bound on the observed pass rate when sizing the next search batch,
+# so a run of rejections cannot make the next request unbounded
+MIN_PASS_RATE = 0.05
+
+CLIENT = EUtilsClient()
+
+def organism_term(organism_name: str, since=None) -> str:
     """
-    Searches SRA for a specific organism with strict WGS/Illumina/Paired filters.
+    ESearch term for an organism with strict WGS/Illumina/Paired filters, so
+    that NCBI drops non-matching runs before anything is downloaded.
+    With `since` (a date), only runs published on or after it are matched.
+    """
+    term = (f'"{organism_name}"[Organism] AND "paired"[Layout] '
+            f'AND "illumina"[Platform] AND "wgs"[Strategy]')
+    if since is not None:
+        term += f" AND {pdat_window(since)}"
+    return term
+
+def select_candidates(term: str, number: int, exclude=()):
+    """
+    Yields up to `number` candidates that pass every filter, fetching in
+    growing batches and stopping as soon as enough have been found.
+
+    The first batch asks for exactly `number` UIDs; each later batch is sized
+    from the pass rate observed so far. Runs whose accession is in `exclude`
+    count as rejected.
     """
-    # Simplified term to ensure we get hits
-    term = f'"{organism_name}"[Organism] AND "paired"[Layout] AND "illumina"[Platform]'
-    
     print(f"Searching SRA for: {term}")
-    params = {
-        "db": "sra",
-        "term": term,
-        "retmode": "json",
-        "retmax": 100 # Fetch more than needed to filter
-    }
-    if NCBI_API_KEY:
-        params["api_key"] = NCBI_API_KEY
+    selected = examined = retstart = 0
+    batch = number
+    count = None
+    while selected < number and (count is None or retstart < count):
+        try:
+            result = CLIENT.esearch("sra", term, retmax=batch, retstart=retstart)
+        except EUtilsError as e:
+            print(f"Error during search: {e}")
+            return
+        if count is None:
+            count = result["count"]
+            print(f"Found {count} matching runs in SRA.")
+        uids = result.get("idlist", [])
+        if not uids:
+            return
+        retstart += len(uids)
+        examined += len(uids)
 
-    try:
-        response = requests.get(f"{EUTILS_BASE}esearch.fcgi", params=params)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("esearchresult", {}).get("idlist", [])
-    except Exception as e:
-        print(f"Error during search: {e}")
-        return []
-
-def efetch_details(uids: list) -> list:
+        for entry in efetch_details(uids):
+            if entry["sra"] in exclude:
+                continue
+            yield entry
+            selected += 1
+            if selected >= number:
+                return
+
+        pass_rate = max(selected / examined, MIN_PASS_RATE)
+        batch = min(ESEARCH_PAGE_SIZE, math.ceil((number - selected) / pass_rate))
+
+def efetch_details(uids: list):
     """
     Fetches XML details for a list of SRA UIDs.
+    Yields candidate entries as each EXPERIMENT_PACKAGE is parsed.
     """
     if not uids:
-        return []
-        
-    # Batch fetch
-    params = {
-        "db": "sra",
-        "id": ",".join(uids),
-        "rettype": "full",
-        "retmode": "xml"
-    }
-    if NCBI_API_KEY:
-        params["api_key"] = NCBI_API_KEY
-
-    try:
-        response = requests.get(f"{EUTILS_BASE}efetch.fcgi", params=params)
-        response.raise_for_status()
-        # print(f"DEBUG: XML Response Length: {len(response.text)}")
-        if len(response.text) < 500:
-             print(f"DEBUG: Short XML Response: {response.text}")
+        return
         
-        return parse_sra_xml(response.text)
-    except Exception as e:
-        print(f"Error fetching details: {e}")
-        return []
+    # Batch fetch (several batches in flight at once), cached records reused.
+    # Packages are streamed and discarded once their entry has been built.
+    for exp_pkg in CLIENT.iter_sra_packages(uids, batch_size=EFETCH_BATCH_SIZE):
+        entry = parse_sra_package(exp_pkg)
+        if entry:
+            yield entry
 
-def parse_sra_xml(xml_string: str) -> list:
+def parse_sra_xml(xml_source):
     """
-    Parses SRA XML to extract run accessions and comprehensive metadata.
+    Parses SRA XML (text, bytes or a binary file) to extract run accessions
+    and comprehensive metadata. Yields one entry per accepted package; only
+    one EXPERIMENT_PACKAGE is held in memory at a time.
     """
-    results = []
+    found = False
     try:
-        # Debug: print first 500 chars of XML to see structure
-        # print(f"DEBUG XML: {xml_string[:500]}") 
-        
-        root = ET.fromstring(xml_string)
-        # print(f"DEBUG: Root tag is {root.tag}")
-        
-        # Check if we have any packages
-        packages = root.findall(".//EXPERIMENT_PACKAGE")
-        if not packages:
-            print("DEBUG: No EXPERIMENT_PACKAGE found in XML.")
-            return []
-
-        for exp_pkg in packages:
-            # 1. Run Info
-            run_node = exp_pkg.find(".//RUN")
-            if run_node is None: continue
-            
-            srr = run_node.get("accession")
-            if not srr: continue
-
-            # 2. Study Info
-            study_node = exp_pkg.find(".//STUDY")
-            study_acc = study_node.get("accession") if study_node is not None else ""
-            study_title = ""
-            if study_node is not None:
-                desc = study_node.find("DESCRIPTOR")
-                if desc is not None:
-                    title_node = desc.find("STUDY_TITLE")
-                    if title_node is not None:
-                        study_title = title_node.text
-
-            # 3. Sample Info & Attributes
-            sample_node = exp_pkg.find(".//SAMPLE")
-            sample_acc = sample_node.get("accession") if sample_node is not None else ""
-            organism = "Unknown"
-            if sample_node is not None:
-                sample_name = sample_node.find("SAMPLE_NAME")
-                if sample_name is not None:
-                    # Try standard tag
-                    taxon = sample_name.find("TAXON_SCIENTIFIC_NAME")
-                    if taxon is not None:
-                        organism = taxon.text
-                    else:
-                        # Try scientific_name attribute
-                        sci_name = sample_name.find("SCIENTIFIC_NAME")
-                        if sci_name is not None:
-                            organism = sci_name.text
-            
-            # Dynamic Attribute Extraction
-            attributes = {}
-            if sample_node is not None:
-                sample_attrs = sample_node.find("SAMPLE_ATTRIBUTES")
-                if sample_attrs is not None:
-                    for attr in sample_attrs.findall("SAMPLE_ATTRIBUTE"):
-                        tag = attr.find("TAG")
-                        val = attr.find("VALUE")
-                        if tag is not None and val is not None and tag.text:
-                            # print(f"DEBUG: Found attribute {tag.text} = {val.text}")
-                            attributes[tag.text.lower().replace(" ", "_")] = val.text
-
-            # Core metadata fields
-            collection_date = attributes.get("collection_date", "not provided")
-            geo_loc = attributes.get("geo_loc_name", "not provided")
-            host = attributes.get("host", "not provided")
-            isolation_source = attributes.get("isolation_source", "not provided")
-            
-            # 4. Stats (Robust extraction)
-            total_spots = "0"
-            try:
-                # 1. Check Statistics node
-                stats = run_node.find("Statistics")
-                if stats is not None:
-                    spots = stats.get("nspots")
-                    if not spots:
-                        spots_node = stats.find("Spots")
-                        if spots_node is not None:
-                            spots = spots_node.text
-                    if spots:
-                        total_spots = spots
-                
-                # 2. Check RUN attributes
-                if total_spots == "0":
-                    total_spots = run_node.get("total_spots", "0")
-                    
-            except:
-                pass 
-            
-            # Filtering
-            if total_spots and total_spots.isdigit() and 0 < int(total_spots) < 10000:
-                # print(f"DEBUG: Skipping {srr} due to low read count: {total_spots}")
-                continue 
-
-            entry = {
-                "sample": srr,
-                "sra": srr,
-                "fastq_1": "",
-                "fastq_2": "",
-                "organism": organism,
-                "collection_date": collection_date,
-                "geo_location": geo_loc,
-                "host": host,
-                "isolation_source": isolation_source,
-                "study_accession": study_acc,
-                "study_title": study_title,
-                "read_count": total_spots,
-                "library_layout": "PAIRED", 
-                "platform": "ILLUMINA"
-            }
-            results.append(entry)
-            
+        for exp_pkg in iter_xml_elements(xml_source, "EXPERIMENT_PACKAGE"):
+            found = True
+            entry = parse_sra_package(exp_pkg)
+            if entry:
+                yield entry
     except ET.ParseError as e:
         print(f"XML Parse Error: {e}")
-        
-    return results
+        return
+
+    # Check if we had any packages
+    if not found:
+        print("DEBUG: No EXPERIMENT_PACKAGE found in XML.")
+
+def parse_sra_package(exp_pkg):
+    """
+    Extracts run accession and metadata from one EXPERIMENT_PACKAGE element.
+    Returns None for packages without a run or with too few reads.
+    """
+    # 1. Layout and platform (the ESearch term already asks for these, but
+    # SRA indexing is not always consistent with the package contents)
+    if exp_pkg.find(".//LIBRARY_LAYOUT/PAIRED") is None: return None
+    platform = exp_pkg.find(".//EXPERIMENT/PLATFORM")
+    if platform is None or platform.find("ILLUMINA") is None: return None
+
+    # 2. Run Info
+    run_node = exp_pkg.find(".//RUN")
+    if run_node is None: return None
+
+    srr = run_node.get("accession")
+    if not srr: return None
+
+    # 3. Study Info
+    study_node = exp_pkg.find(".//STUDY")
+    study_acc = study_node.get("accession") if study_node is not None else ""
+    study_title = ""
+    if study_node is not None:
+        desc = study_node.find("DESCRIPTOR")
+        if desc is not None:
+            title_node = desc.find("STUDY_TITLE")
+            if title_node is not None:
+                study_title = title_node.text
+
+    # 4. Sample Info & Attributes
+    sample_node = exp_pkg.find(".//SAMPLE")
+    sample_acc = sample_node.get("accession") if sample_node is not None else ""
+    organism = "Unknown"
+    if sample_node is not None:
+        sample_name = sample_node.find("SAMPLE_NAME")
+        if sample_name is not None:
+            # Try standard tag
+            taxon = sample_name.find("TAXON_SCIENTIFIC_NAME")
+            if taxon is not None:
+                organism = taxon.text
+            else:
+                # Try scientific_name attribute
+                sci_name = sample_name.find("SCIENTIFIC_NAME")
+                if sci_name is not None:
+                    organism = sci_name.text
+
+    # Dynamic Attribute Extraction
+    attributes = {}
+    if sample_node is not None:
+        sample_attrs = sample_node.find("SAMPLE_ATTRIBUTES")
+        if sample_attrs is not None:
+            for attr in sample_attrs.findall("SAMPLE_ATTRIBUTE"):
+                tag = attr.find("TAG")
+                val = attr.find("VALUE")
+                if tag is not None and val is not None and tag.text:
+                    # print(f"DEBUG: Found attribute {tag.text} = {val.text}")
+                    attributes[tag.text.lower().replace(" ", "_")] = val.text
+
+    # Core metadata fields
+    collection_date = attributes.get("collection_date", "not provided")
+    geo_loc = attributes.get("geo_loc_name", "not provided")
+    host = attributes.get("host", "not provided")
+    isolation_source = attributes.get("isolation_source", "not provided")
+
+    # 5. Stats (Robust extraction)
+    total_spots = "0"
+    try:
+        # 1. Check Statistics node
+        stats = run_node.find("Statistics")
+        if stats is not None:
+            spots = stats.get("nspots")
+            if not spots:
+                spots_node = stats.find("Spots")
+                if spots_node is not None:
+                    spots = spots_node.text
+            if spots:
+                total_spots = spots
+
+        # 2. Check RUN attributes
+        if total_spots == "0":
+            total_spots = run_node.get("total_spots", "0")
+
+    except:
+        pass 
+
+    # Filtering
+    if total_spots and total_spots.isdigit() and 0 < int(total_spots) < MIN_SPOTS:
+        # print(f"DEBUG: Skipping {srr} due to low read count: {total_spots}")
+        return None
+
+    entry = {
+        "sample": srr,
+        "sra": srr,
+        "fastq_1": "",
+        "fastq_2": "",
+        "organism": organism,
+        "collection_date": collection_date,
+        "geo_location": geo_loc,
+        "host": host,
+        "isolation_source": isolation_source,
+        "study_accession": study_acc,
+        "study_title": study_title,
+        "read_count": total_spots,
+        "library_layout": "PAIRED", 
+        "platform": "ILLUMINA"
+    }
+    return entry
 
 def main():
     parser = argparse.ArgumentParser(description="Search SRA and generate pipeline inputs.")
@@ -191,39 +223,57 @@ def main():
     parser.add_argument("-n", "--number", type=int, default=6, help="Number of samples to fetch")
     parser.add_argument("--samplesheet", default="samplesheet.csv", help="Output samplesheet file")
     parser.add_argument("--metadata", default="metadata.csv", help="Output metadata file")
+    parser.add_argument("--ledger", help="Run ledger CSV; selected runs are recorded in it")
+    parser.add_argument("--since-ledger", action="store_true",
+                        help="Only select runs not already in --ledger, published since its last sweep")
+    add_cache_arguments(parser)
     
     args = parser.parse_args()
+    if args.since_ledger and not args.ledger:
+        parser.error("--since-ledger requires --ledger")
+    ledger = RunLedger(args.ledger) if args.ledger else None
+    since = ledger.last_seen() if args.since_ledger else None
+    if since is not None:
+        print(f"Incremental mode: {len(ledger)} runs in ledger, searching runs published since {since}")
 
-    # 1. Search
-    uids = esearch_organism(args.taxid, max_results=args.number * 3) # Fetch extras to filter
-    print(f"Found {len(uids)} potential datasets.")
-    
-    # 2. Fetch Details & Filter
-    candidates = efetch_details(uids)
-    print(f"Parsed {len(candidates)} valid candidates.")
-    
-    # 3. Select Top N
-    selected = candidates[:args.number]
-    print(f"Selected {len(selected)} samples for analysis.")
+    global CLIENT
+    CLIENT = EUtilsClient(cache=cache_from_args(args), offline=args.offline)
 
-    # 4. Write Samplesheet (for Nextflow)
+    # 1-5. Search, fetch details, filter and write both files as candidates
+    # are parsed; searching and fetching stop once N have been written.
+    candidates = select_candidates(organism_term(args.taxid, since), args.number,
+                                   exclude=ledger.excluded() if args.since_ledger else ())
     ss_fields = ["sample", "sra", "fastq_1", "fastq_2"]
-    with open(args.samplesheet, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=ss_fields)
-        writer.writeheader()
-        for s in selected:
-            writer.writerow({k: s[k] for k in ss_fields})
-    print(f"Written {args.samplesheet}")
-
-    # 5. Write Metadata (Full details)
-    if selected:
-        md_fields = list(selected[0].keys())
-        with open(args.metadata, "w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=md_fields)
+    selected = 0
+    md_file = None
+    try:
+        with open(args.samplesheet, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=ss_fields)
             writer.writeheader()
-            for s in selected:
-                writer.writerow(s)
+            for s in candidates:
+                writer.writerow({k: s[k] for k in ss_fields})
+                if md_file is None:
+                    md_file = open(args.metadata, "w", newline="")
+                    md_writer = csv.DictWriter(md_file, fieldnames=list(s.keys()))
+                    md_writer.writeheader()
+                md_writer.writerow(s)
+                if ledger is not None:
+                    ledger.add(s["sra"])
+                selected += 1
+    finally:
+        if md_file is not None:
+            md_file.close()
+    print(f"Selected {selected} samples for analysis.")
+    print(f"Written {args.samplesheet}")
+    if md_file is not None:
         print(f"Written {args.metadata}")
+    if ledger is not None:
+        ledger.save()
+        print(f"Updated run ledger {args.ledger} ({len(ledger)} runs)")
+
+    if CLIENT.cache is not None:
+        print(CLIENT.cache.summary())
+        CLIENT.cache.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,48 @@
+"""Fixtures for the benchmark suite: a shared scratch directory and a stage recorder."""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+import harness
+
+_RESULTS = {}
+
+
+@pytest.fixture(scope='session')
+def bench_dir():
+    d = tempfile.mkdtemp(prefix='staphit-bench-')
+    yield d
+    shutil.rmtree(d, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def baselines():
+    return harness.load_baselines()
+
+
+@pytest.fixture
+def record(baselines):
+    """Measure a stage command, keep the result for the summary and fail on regressions."""
+    def _record(stage, cmd, items, cwd=None):
+        result = harness.measure(cmd, items, cwd=cwd)
+        _RESULTS[stage] = result
+        problems = harness.regressions(stage, result, baselines)
+        assert not problems, '; '.join(problems)
+        return result
+    return _record
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _RESULTS:
+        return
+    terminalreporter.section('staphit benchmarks')
+    terminalreporter.write_line(f"{'stage':<28}{'items':>10}{'wall s':>10}{'cpu s':>10}"
+                                f"{'items/s':>12}{'peak MB':>10}")
+    for stage, r in sorted(_RESULTS.items()):
+        terminalreporter.write_line(f"{stage:<28}{r['items']:>10}{r['wall']:>10.2f}{r['cpu']:>10.2f}"
+                                    f"{r['throughput']:>12.1f}{r['peak_rss_mb']:>10.1f}")
+    if os.environ.get('STAPHIT_BENCH_SAVE'):
+        harness.save_baselines(_RESULTS)
+        terminalreporter.write_line(f'baselines written to {harness.BASELINES}')
@@ -0,0 +1,94 @@
+"""Measure pipeline stages and compare them with stored baselines.
+
+Each stage runs as its own process so peak RSS is the stage's alone; wall
+time, CPU time and max RSS come from the child's rusage via os.wait4.
+Throughput is items (rows, samples, packages) per wall-clock second.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# A stage regresses when its throughput falls below baseline / THROUGHPUT_TOLERANCE
+# or its peak RSS grows past baseline * MEMORY_TOLERANCE (+ MEMORY_SLACK_MB, so small
+# stages are not flagged for interpreter noise). Baselines are machine-specific;
+# override the tolerances when comparing against numbers from another box.
+THROUGHPUT_TOLERANCE = float(os.environ.get('STAPHIT_BENCH_THROUGHPUT_TOLERANCE', 2.0))
+MEMORY_TOLERANCE = float(os.environ.get('STAPHIT_BENCH_MEMORY_TOLERANCE', 1.5))
+MEMORY_SLACK_MB = 16
+
+
+def scale():
+    return float(os.environ.get('STAPHIT_BENCH_SCALE', 1.0))
+
+
+def scaled(n):
+    return max(1, int(n * scale()))
+
+
+def measure(cmd, items, cwd=None):
+    """Run cmd to completion; returns wall/cpu seconds, peak RSS (MB) and items per second."""
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=stderr)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise AssertionError(f'{cmd!r} exited {proc.returncode}:\n'
+                                 f'{stderr.read().decode(errors="replace")}')
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    rss_kb = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return {
+        'items': items,
+        'wall': round(wall, 3),
+        'cpu': round(usage.ru_utime + usage.ru_stime, 3),
+        'peak_rss_mb': round(rss_kb / 1024, 1),
+        'throughput': round(items / wall, 1) if wall > 0 else float('inf'),
+    }
+
+
+def python_snippet(code):
+    """Command running `code` in a fresh interpreter with bin/ and the repo root importable."""
+    repo = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    preamble = (f'import sys; sys.path[:0] = [{os.path.join(repo, "bin")!r}, {repo!r}]\n')
+    return [sys.executable, '-c', preamble + code]
+
+
+def load_baselines(path=BASELINES):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(results, path=BASELINES):
+    """Merge results ({stage: measurement}) into the baseline file."""
+    baselines = load_baselines(path)
+    for stage, result in results.items():
+        baselines[stage] = dict(result, scale=scale())
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def regressions(stage, result, baselines):
+    """Human-readable regressions of result against the stored baseline for stage."""
+    baseline = baselines.get(stage)
+    if not baseline:
+        return []
+    problems = []
+    if result['throughput'] < baseline['throughput'] / THROUGHPUT_TOLERANCE:
+        problems.append(f"{stage}: throughput {result['throughput']}/s vs baseline "
+                        f"{baseline['throughput']}/s")
+    # Peak memory grows with input size, so only compare runs at the same scale
+    limit = baseline['peak_rss_mb'] * MEMORY_TOLERANCE + MEMORY_SLACK_MB
+    if baseline.get('scale') == scale() and result['peak_rss_mb'] > limit:
+        problems.append(f"{stage}: peak RSS {result['peak_rss_mb']} MB vs baseline "
+                        f"{baseline['peak_rss_mb']} MB")
+    return problems
@@ -0,0 +1,242 @@
+"""Deterministic synthetic inputs for the benchmark suite.
+
+Every generator takes an explicit seed and writes the same bytes for the
+same arguments, so throughput numbers are comparable between runs and
+machines. The formats follow what the pipeline reads: staphit-metadata
+CSVs, Vitek wide TSVs, SRA EXPERIMENT_PACKAGE and BioSample XML, and the
+per-sample tool outputs consumed by staphit_aggregate.py.
+"""
+import csv
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'bin'))
+from staphit_aggregate import SUMMARY_HEADERS  # noqa: E402
+
+METADATA_HEADER = [
+    'sample_id', 'organism', 'collection_date', 'geo_loc_country', 'geo_loc_region',
+    'host', 'isolation_source', 'host_age', 'host_sex', 'mrsa_status', 'sequencing_platform',
+]
+ANTIBIOGRAM_HEADER = [
+    'sample_id', 'antibiotic', 'resistance_phenotype', 'measurement', 'measurement_sign',
+    'measurement_units', 'laboratory_typing_method', 'testing_standard',
+    'testing_standard_version', 'platform',
+]
+
+ANTIBIOTICS = [
+    'Benzylpenicillin', 'Oxacillin', 'Cefoxitin', 'Gentamicin', 'Ciprofloxacin',
+    'Levofloxacin', 'Moxifloxacin', 'Erythromycin', 'Clindamycin', 'Linezolid',
+    'Daptomycin', 'Teicoplanin', 'Vancomycin', 'Tetracycline', 'Tigecycline',
+    'Fusidic acid', 'Rifampicin', 'Trimethoprim/Sulfamethoxazole', 'Mupirocin', 'Nitrofurantoin',
+]
+REGIONS = ['Riyadh', 'Jeddah', 'Dammam', 'Makkah', 'Madinah', 'Abha', 'Tabuk', 'Hail']
+SOURCES = ['blood', 'wound', 'sputum', 'urine', 'nasal swab', 'tissue', 'pus']
+MIC_VALUES = ['0.25', '0.5', '1', '2', '4', '8', '16', '32', '64']
+SIGNS = ['', '', '<=', '>=']
+STS = ['5', '8', '22', '30', '80', '88', '239', '398']
+SPA_TYPES = ['t008', 't002', 't032', 't044', 't019', 't037', 't223']
+SCCMEC_TYPES = ['IVa', 'IVc', 'V', 'II', 'III', '-']
+RESFINDER = ['mecA', 'blaZ', 'ermC', 'tetK', 'aac(6\')-aph(2\'\')', 'dfrG', 'fusC', 'ermA']
+VFDB = ['lukF-PV', 'lukS-PV', 'hlgA', 'sak', 'scn', 'chp', 'tst', 'sea', 'seb']
+
+
+def sample_ids(n):
+    return [f'S{i:07d}' for i in range(1, n + 1)]
+
+
+def _date(rng):
+    return f'20{rng.randint(15, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+
+
+def write_metadata_csv(path, n, seed=1):
+    """Metadata CSV with n samples that passes `staphit-metadata validate`."""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(METADATA_HEADER)
+        for sid in sample_ids(n):
+            writer.writerow([
+                sid, 'Staphylococcus aureus', _date(rng), 'Saudi Arabia', rng.choice(REGIONS),
+                'Homo sapiens', rng.choice(SOURCES), rng.randint(1, 90),
+                rng.choice(['male', 'female']), rng.choice(['MRSA', 'MSSA']), 'Illumina MiSeq',
+            ])
+    return path
+
+
+def write_antibiogram_csv(path, n_rows, n_samples, seed=2):
+    """Long-format antibiogram with n_rows rows spread over n_samples samples."""
+    rng = random.Random(seed)
+    ids = sample_ids(n_samples)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ANTIBIOGRAM_HEADER)
+        for i in range(n_rows):
+            writer.writerow([
+                ids[(i // len(ANTIBIOTICS)) % n_samples], ANTIBIOTICS[i % len(ANTIBIOTICS)],
+                rng.choice('RIS'), rng.choice(MIC_VALUES), rng.choice(SIGNS), 'mg/L', 'MIC',
+                'CLSI', '2023', 'Vitek 2',
+            ])
+    return path
+
+
+def write_vitek_tsv(path, n_samples, seed=3):
+    """Wide Vitek 2 TSV: one UID row per sample, one SIR:MIC column per antibiotic."""
+    rng = random.Random(seed)
+    columns = ANTIBIOTICS + ['Cefoxitin Screen']
+    with open(path, 'w') as f:
+        f.write('\t'.join(['UID'] + columns) + '\n')
+        for sid in sample_ids(n_samples):
+            cells = []
+            for _ in ANTIBIOTICS:
+                roll = rng.random()
+                if roll < 0.05:
+                    cells.append('')
+                else:
+                    sign = rng.choice(['', '<= ', '>= '])
+                    star = '*' if roll > 0.97 else ''
+                    cells.append(f'{rng.choice("RIS")}:{sign}{rng.choice(MIC_VALUES)}{star}')
+            cells.append(rng.choice(['POS', 'NEG']))
+            f.write('\t'.join([sid] + cells) + '\n')
+    return path
+
+
+def write_sra_xml(path, n_packages, seed=4):
+    """EFetch-style EXPERIMENT_PACKAGE_SET that parse_sra_xml accepts package by package."""
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" ?>\n<EXPERIMENT_PACKAGE_SET>\n')
+        for i in range(1, n_packages + 1):
+            spots = rng.randint(200000, 3000000)
+            f.write(
+                '<EXPERIMENT_PACKAGE>\n'
+                f'  <EXPERIMENT accession="SRX{i:07d}"><TITLE>MRSA isolate {i}</TITLE>\n'
+                f'    <STUDY_REF accession="SRP{i % 50:06d}"/>\n'
+                f'    <DESIGN><SAMPLE_DESCRIPTOR accession="SRS{i:07d}"/><LIBRARY_DESCRIPTOR>'
+                '<LIBRARY_STRATEGY>WGS</LIBRARY_STRATEGY><LIBRARY_SOURCE>GENOMIC</LIBRARY_SOURCE>'
+                '<LIBRARY_LAYOUT><PAIRED/></LIBRARY_LAYOUT></LIBRARY_DESCRIPTOR></DESIGN>\n'
+                '    <PLATFORM><ILLUMINA><INSTRUMENT_MODEL>Illumina MiSeq</INSTRUMENT_MODEL>'
+                '</ILLUMINA></PLATFORM>\n'
+                '  </EXPERIMENT>\n'
+                f'  <STUDY accession="SRP{i % 50:06d}"><DESCRIPTOR>'
+                '<STUDY_TITLE>MRSA surveillance</STUDY_TITLE></DESCRIPTOR></STUDY>\n'
+                f'  <SAMPLE accession="SRS{i:07d}"><TITLE>MRSA isolate {i}</TITLE>\n'
+                '    <SAMPLE_NAME><TAXON_ID>1280</TAXON_ID>'
+                '<SCIENTIFIC_NAME>Staphylococcus aureus</SCIENTIFIC_NAME></SAMPLE_NAME>\n'
+                '    <SAMPLE_ATTRIBUTES>'
+                f'<SAMPLE_ATTRIBUTE><TAG>collection_date</TAG><VALUE>{_date(rng)}</VALUE></SAMPLE_ATTRIBUTE>'
+                '<SAMPLE_ATTRIBUTE><TAG>geo_loc_name</TAG>'
+                f'<VALUE>Saudi Arabia: {rng.choice(REGIONS)}</VALUE></SAMPLE_ATTRIBUTE>'
+                '<SAMPLE_ATTRIBUTE><TAG>host</TAG><VALUE>Homo sapiens</VALUE></SAMPLE_ATTRIBUTE>'
+                f'<SAMPLE_ATTRIBUTE><TAG>isolation_source</TAG><VALUE>{rng.choice(SOURCES)}</VALUE>'
+                '</SAMPLE_ATTRIBUTE></SAMPLE_ATTRIBUTES>\n'
+                '  </SAMPLE>\n'
+                f'  <RUN_SET><RUN accession="SRR{i:07d}" total_spots="{spots}">'
+                f'<Statistics nreads="2" nspots="{spots}"/></RUN></RUN_SET>\n'
+                '</EXPERIMENT_PACKAGE>\n'
+            )
+        f.write('</EXPERIMENT_PACKAGE_SET>\n')
+    return path
+
+
+def write_biosample_xml(path, n_samples, seed=5):
+    """BioSampleSet document with SRA cross-references and harmonized attributes."""
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" ?>\n<BioSampleSet>\n')
+        for i in range(1, n_samples + 1):
+            attributes = [
+                ('strain', 'strain', f'MRSA-{i}'),
+                ('collection date', 'collection_date', _date(rng)),
+                ('geographic location', 'geo_loc_name', f'Saudi Arabia: {rng.choice(REGIONS)}'),
+                ('host', 'host', 'Homo sapiens'),
+                ('isolation source', 'isolation_source', rng.choice(SOURCES)),
+            ]
+            f.write(
+                f'<BioSample accession="SAMN{i:08d}" id="{i}">'
+                f'<Ids><Id db="BioSample" is_primary="1">SAMN{i:08d}</Id><Id db="SRA">SRS{i:07d}</Id></Ids>'
+                '<Organism taxonomy_id="1280" taxonomy_name="Staphylococcus aureus"/><Attributes>'
+                + ''.join(f'<Attribute attribute_name="{name}" harmonized_name="{harmonized}">{value}'
+                          '</Attribute>' for name, harmonized, value in attributes)
+                + '</Attributes></BioSample>\n'
+            )
+        f.write('</BioSampleSet>\n')
+    return path
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def write_sample_outputs(root, n_samples, seed=6):
+    """Per-sample tool outputs for n_samples samples; returns the aggregator manifest path."""
+    rng = random.Random(seed)
+    manifest = os.path.join(root, 'manifest.jsonl')
+    with open(manifest, 'w') as out:
+        for sid in sample_ids(n_samples):
+            d = os.path.join(root, sid)
+            quast_dir = os.path.join(d, 'quast')
+            os.makedirs(quast_dir)
+            _write(os.path.join(quast_dir, 'transposed_report.tsv'),
+                   'Assembly\t# contigs\tTotal length\tN50\tGC (%)\n'
+                   f'{sid}\t{rng.randint(20, 300)}\t{rng.randint(2700000, 2950000)}\t'
+                   f'{rng.randint(20000, 400000)}\t{rng.uniform(32.5, 33.1):.2f}\n')
+            raw = rng.randint(300000, 2000000)
+            kept = int(raw * rng.uniform(0.8, 0.99))
+            resfinder = rng.sample(RESFINDER, rng.randint(1, 5))
+            vfdb = rng.sample(VFDB, rng.randint(1, 5))
+            record = {
+                'sample_id': sid,
+                'trim_log': _write(os.path.join(d, 'trim.log'),
+                                   f'Input Read Pairs: {raw} Both Surviving: {kept} '
+                                   f'({100 * kept / raw:.2f}%) Dropped: {raw - kept}\n'),
+                'quast_dir': quast_dir,
+                'mlst': _write(os.path.join(d, 'mlst.tsv'),
+                               f'{sid}.fasta\tsaureus\t{rng.choice(STS)}\tarcC(3)\taroE(3)\tglpF(1)\n'),
+                'spa': _write(os.path.join(d, 'spa.tsv'), 'Sequence name\tRepeats\tType\n'
+                                                          f'contig1\t11-19-12\t{rng.choice(SPA_TYPES)}\n'),
+                'sccmec': _write(os.path.join(d, 'sccmec.tsv'),
+                                 f'sample\tSCCmec_Type\n{sid}\t{rng.choice(SCCMEC_TYPES)}\n'),
+                'agr': _write(os.path.join(d, 'agr.json'),
+                              json.dumps({'agr_group': rng.choice('I II III IV'.split()),
+                                          'confidence': round(rng.random(), 2)})),
+                'amrfinder': _write(os.path.join(d, 'amrfinder.tsv'),
+                                    'Gene symbol\t% Coverage\t% Identity\tClass\n'
+                                    + ''.join(f'{g}\t100.0\t99.9\tBETA-LACTAM\n' for g in resfinder)),
+                'kma': _write(os.path.join(d, 'kma.res'),
+                              '#Template\tScore\tExpected\tLen\tIdentity\n'
+                              + ''.join(f'{g}_1\t1000\t2\t2007\t100.00\n' for g in resfinder)),
+                'abricate': [
+                    _write(os.path.join(d, f'{sid}_abricate_resfinder.tab'),
+                           'GENE\t%COVERAGE\t%IDENTITY\n' + ''.join(f'{g}\t100\t100\n' for g in resfinder)),
+                    _write(os.path.join(d, f'{sid}_abricate_vfdb.tab'),
+                           'GENE\t%COVERAGE\t%IDENTITY\n' + ''.join(f'{g}\t100\t99\n' for g in vfdb)),
+                ],
+            }
+            out.write(json.dumps(record) + '\n')
+    return manifest
+
+
+def write_summary_tsv(path, n_samples, seed=7):
+    """Merged cohort summary (SUMMARY_HEADERS columns) as SUMMARY_MERGER writes it."""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(SUMMARY_HEADERS)
+        for sid in sample_ids(n_samples):
+            raw = rng.randint(300000, 2000000)
+            kept = int(raw * rng.uniform(0.8, 0.99))
+            resfinder = ';'.join(sorted(rng.sample(RESFINDER, rng.randint(1, 5))))
+            writer.writerow([
+                sid, raw, kept, f'{100 * kept / raw:.2f}', f'{rng.uniform(80, 95):.2f}',
+                f'{rng.uniform(32, 37):.2f}', rng.randint(2700000, 2950000), rng.randint(20, 300),
+                rng.randint(20000, 400000), f'{rng.uniform(32.5, 33.1):.2f}', 'saureus',
+                rng.choice(STS), rng.choice(SPA_TYPES), rng.choice(SCCMEC_TYPES),
+                rng.choice('I II III IV'.split()), resfinder, resfinder, resfinder,
+                ';'.join(sorted(rng.sample(VFDB, rng.randint(1, 5)))), '',
+                rng.choice(['community', 'hospital', '']), '',
+            ])
+    return path
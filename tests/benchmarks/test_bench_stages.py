@@ -0,0 +1,129 @@
+"""Throughput and peak-memory benchmarks for the Python stages.
+
+Skipped unless STAPHIT_BENCH=1. STAPHIT_BENCH_SCALE shrinks or grows every
+input (1.0 = 100k metadata rows, 1M antibiogram rows, ...), and
+STAPHIT_BENCH_SAVE=1 stores the run as the new baselines.
+"""
+import os
+import sys
+
+import pytest
+
+import harness
+import synthetic
+from harness import python_snippet, scaled
+
+pytestmark = pytest.mark.skipif(not os.environ.get('STAPHIT_BENCH'),
+                                reason='set STAPHIT_BENCH=1 to run the benchmark suite')
+
+BIN_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'bin'))
+METADATA_TOOL = os.path.join(BIN_DIR, 'staphit-metadata')
+
+METADATA_ROWS = 100_000
+ANTIBIOGRAM_ROWS = 1_000_000
+VITEK_SAMPLES = 20_000
+SRA_PACKAGES = 50_000
+BIOSAMPLES = 100_000
+AGGREGATE_SAMPLES = 2_000
+COHORT_ROWS = 100_000
+
+
+@pytest.fixture(scope='session')
+def metadata_inputs(bench_dir):
+    n = scaled(METADATA_ROWS)
+    rows = scaled(ANTIBIOGRAM_ROWS)
+    metadata = synthetic.write_metadata_csv(os.path.join(bench_dir, 'metadata.csv'), n)
+    antibiogram = synthetic.write_antibiogram_csv(os.path.join(bench_dir, 'antibiogram.csv'),
+                                                  rows, n_samples=n)
+    return metadata, antibiogram, n + rows
+
+
+@pytest.fixture(scope='session')
+def sample_outputs(bench_dir):
+    n = scaled(AGGREGATE_SAMPLES)
+    root = os.path.join(bench_dir, 'samples')
+    os.makedirs(root)
+    return synthetic.write_sample_outputs(root, n), n
+
+
+@pytest.fixture(scope='session')
+def summaries(bench_dir, sample_outputs):
+    """Per-sample summary files for the merger, produced by the aggregator itself."""
+    from staphit_aggregate import aggregate_batch, read_manifest
+    manifest, n = sample_outputs
+    outdir = os.path.join(bench_dir, 'aggregated')
+    aggregate_batch(read_manifest(manifest), outdir)
+    listing = os.path.join(bench_dir, 'summaries.txt')
+    with open(listing, 'w') as f:
+        for name in sorted(os.listdir(outdir)):
+            if name.endswith('_summary.csv'):
+                f.write(os.path.join(outdir, name) + '\n')
+    return listing, n
+
+
+class TestMetadataStages:
+    def test_validate(self, record, metadata_inputs):
+        metadata, antibiogram, items = metadata_inputs
+        record('metadata.validate', [sys.executable, METADATA_TOOL, 'validate',
+                                     '--metadata', metadata, '--antibiogram', antibiogram], items)
+
+    def test_normalize(self, record, metadata_inputs, bench_dir):
+        metadata, antibiogram, items = metadata_inputs
+        record('metadata.normalize', [sys.executable, METADATA_TOOL, 'normalize',
+                                      '--metadata', metadata, '--antibiogram', antibiogram,
+                                      '-o', os.path.join(bench_dir, 'metadata.json')], items)
+
+    def test_convert_vitek(self, record, bench_dir):
+        n = scaled(VITEK_SAMPLES)
+        vitek = synthetic.write_vitek_tsv(os.path.join(bench_dir, 'vitek.tsv'), n)
+        record('metadata.convert_vitek', [sys.executable, METADATA_TOOL, 'convert',
+                                          '--from-vitek-csv', vitek,
+                                          '-o', os.path.join(bench_dir, 'vitek_antibiogram.csv')], n)
+
+
+class TestXmlParsing:
+    def test_sra_packages(self, record, bench_dir):
+        pytest.importorskip('requests')
+        n = scaled(SRA_PACKAGES)
+        xml = synthetic.write_sra_xml(os.path.join(bench_dir, 'sra.xml'), n)
+        record('sra.parse_xml', python_snippet(
+            'import search_datasets\n'
+            f'with open({xml!r}, "rb") as f:\n'
+            '    count = sum(1 for _ in search_datasets.parse_sra_xml(f))\n'
+            f'assert count == {n}, count\n'), n)
+
+    def test_biosamples(self, record, bench_dir):
+        pytest.importorskip('requests')
+        n = scaled(BIOSAMPLES)
+        xml = synthetic.write_biosample_xml(os.path.join(bench_dir, 'biosample.xml'), n)
+        record('biosample.iter_xml', python_snippet(
+            'import eutils\n'
+            f'with open({xml!r}, "rb") as f:\n'
+            '    count = sum(1 for s in eutils.iter_xml_elements(f, "BioSample")\n'
+            '                if eutils.biosample_accession(s))\n'
+            f'assert count == {n}, count\n'), n)
+
+
+class TestSummaryStages:
+    def test_aggregate(self, record, sample_outputs, bench_dir):
+        manifest, n = sample_outputs
+        # One worker: os.wait4 only reports the measured process, not pool children
+        record('aggregate.batch', [sys.executable, os.path.join(BIN_DIR, 'staphit_aggregate.py'),
+                                   '--manifest', manifest, '--workers', '1',
+                                   '--outdir', os.path.join(bench_dir, 'aggregate_run')], n)
+
+    def test_summary_merge(self, record, summaries, bench_dir):
+        pytest.importorskip('pyarrow')
+        listing, n = summaries
+        record('summary.merge', [sys.executable, os.path.join(BIN_DIR, 'staphit_summary.py'),
+                                 '--manifest', listing,
+                                 '--output', os.path.join(bench_dir, 'final_summary.tsv'),
+                                 '--parquet', os.path.join(bench_dir, 'final_summary.parquet')], n)
+
+    def test_visualize(self, record, bench_dir):
+        pytest.importorskip('pandas')
+        pytest.importorskip('seaborn')
+        n = scaled(COHORT_ROWS)
+        cohort = synthetic.write_summary_tsv(os.path.join(bench_dir, 'cohort_summary.tsv'), n)
+        record('visualize.cohort', [sys.executable, os.path.join(BIN_DIR, 'visualize_results.py'),
+                                    cohort, os.path.join(bench_dir, 'figures')], n)
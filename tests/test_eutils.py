@@ -0,0 +1,208 @@
+"""Tests for the shared NCBI E-utilities client (no network access)."""
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('requests')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bin'))
+from eutils import EUtilsClient, EUtilsError, TokenBucket  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, text='', headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload) if payload is not None else text
+        self.content = text.encode()
+        self.headers = headers or {}
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        import requests
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error")
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        self.calls.append(('GET', url, params))
+        return self.responses.pop(0)
+
+    def post(self, url, data=None, timeout=None, stream=False):
+        self.calls.append(('POST', url, data))
+        return self.responses.pop(0)
+
+
+class TestTokenBucket:
+    def test_burst_then_throttle(self):
+        """Capacity tokens are free; the next one waits 1/rate seconds."""
+        clock = FakeClock()
+        bucket = TokenBucket(3, capacity=3, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            bucket.acquire()
+        assert clock.sleeps == []
+        bucket.acquire()
+        assert clock.sleeps == [pytest.approx(1 / 3)]
+
+    def test_no_burst_by_default(self):
+        """N + 1 back-to-back calls take at least N / rate seconds, fresh or idle."""
+        clock = FakeClock()
+        bucket = TokenBucket(3, clock=clock, sleep=clock.sleep)
+        for idle in (0, 60):
+            clock.now += idle
+            start = clock.now
+            for _ in range(4):
+                bucket.acquire()
+            assert clock.now - start >= 3 / 3 - 1e-9
+
+    def test_rate_follows_api_key(self):
+        assert EUtilsClient(api_key='', session=FakeSession([])).limiter.rate == 3
+        assert EUtilsClient(api_key='secret', session=FakeSession([])).limiter.rate == 10
+
+
+class TestRetries:
+    def test_retries_429_then_succeeds(self):
+        clock = FakeClock()
+        session = FakeSession([
+            FakeResponse(429),
+            FakeResponse(503),
+            FakeResponse(200, {'esearchresult': {'count': '2', 'idlist': ['1', '2']}}),
+        ])
+        client = EUtilsClient(api_key='', session=session, sleep=clock.sleep)
+        result = client.esearch('sra', 'SRP000001')
+        assert result['count'] == 2
+        assert result['idlist'] == ['1', '2']
+        assert len(session.calls) == 3
+
+    def test_gives_up_after_max_retries(self):
+        clock = FakeClock()
+        session = FakeSession([FakeResponse(500)] * 3)
+        client = EUtilsClient(api_key='', session=session, max_retries=2, sleep=clock.sleep)
+        with pytest.raises(EUtilsError):
+            client.efetch('sra', ids=['1'])
+        assert len(session.calls) == 3
+
+    def test_client_error_is_not_retried(self):
+        session = FakeSession([FakeResponse(400)])
+        client = EUtilsClient(api_key='', session=session)
+        with pytest.raises(EUtilsError):
+            client.efetch('sra', ids=['1'])
+        assert len(session.calls) == 1
+
+    def test_api_key_and_long_id_lists_are_posted(self):
+        session = FakeSession([FakeResponse(200, text='<xml/>')])
+        client = EUtilsClient(api_key='secret', session=session)
+        client.efetch('sra', ids=[str(i) for i in range(500)])
+        method, _, params = session.calls[0]
+        assert method == 'POST'
+        assert params['api_key'] == 'secret'
+
+
+class TestPaging:
+    @staticmethod
+    def page(count, ids):
+        return FakeResponse(200, {'esearchresult': {'count': str(count), 'idlist': ids}})
+
+    def test_pages_past_first_request_lazily(self):
+        session = FakeSession([self.page(5, ['1', '2']), self.page(5, ['3', '4']),
+                               self.page(5, ['5'])])
+        client = EUtilsClient(api_key='', session=session)
+        count, pages = client.esearch_pages('sra', 'Staphylococcus aureus', page_size=2)
+        assert count == 5
+        assert len(session.calls) == 1
+        assert next(pages) == ['1', '2']
+        assert len(session.calls) == 1
+        assert list(pages) == [['3', '4'], ['5']]
+        assert [call[2]['retstart'] for call in session.calls] == [0, 2, 4]
+
+    def test_limit_caps_uids_and_requests(self):
+        session = FakeSession([self.page(50, ['1', '2', '3']), self.page(50, ['4'])])
+        client = EUtilsClient(api_key='', session=session)
+        count, pages = client.esearch_pages('sra', 'MRSA', page_size=3, limit=4)
+        assert count == 50
+        assert [uid for page in pages for uid in page] == ['1', '2', '3', '4']
+        assert session.calls[1][2]['retmax'] == 1
+
+
+def test_epost_returns_history_handle():
+    body = '<ePostResult><QueryKey>1</QueryKey><WebEnv>MCID_1</WebEnv></ePostResult>'
+    session = FakeSession([FakeResponse(200, text=body)])
+    client = EUtilsClient(api_key='', session=session)
+    assert client.epost('sra', ['1', '2']) == ('MCID_1', '1')
+    assert session.calls[0][0] == 'POST'
+
+
+def test_history_fetch_posts_once_and_pages():
+    from eutils import split_runinfo
+    epost = '<ePostResult><QueryKey>1</QueryKey><WebEnv>MCID_1</WebEnv></ePostResult>'
+    session = FakeSession([
+        FakeResponse(200, text=epost),
+        FakeResponse(200, text='Run,BioSample\nSRR1,SAMN1\nSRR2,SAMN2\n'),
+        FakeResponse(200, text='Run,BioSample\nSRR3,SAMN3\n'),
+    ])
+    client = EUtilsClient(api_key='', session=session, max_workers=1)
+    records = client.cached_records('sra', 'runinfo', ['SRR1', 'SRR2', 'SRR3'], None,
+                                    split_runinfo, batch_size=2, retmode='text')
+    assert list(records) == ['SRR1', 'SRR2', 'SRR3']
+    assert [call[0] for call in session.calls] == ['POST', 'GET', 'GET']
+    pages = [(call[2]['WebEnv'], call[2]['retstart'], call[2]['retmax']) for call in session.calls[1:]]
+    assert pages == [('MCID_1', 0, 2), ('MCID_1', 2, 2)]
+
+
+def test_map_preserves_order():
+    client = EUtilsClient(api_key='secret', session=FakeSession([]))
+    assert client.map(lambda x: x * 2, range(20)) == [x * 2 for x in range(20)]
+
+
+class TestStreamingParse:
+    FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'ncbi', 'sra_full.xml')
+
+    def test_iter_xml_elements_clears_finished_records(self):
+        from eutils import iter_xml_elements
+        seen = []
+        with open(self.FIXTURE, 'rb') as f:
+            for pkg in iter_xml_elements(f, 'EXPERIMENT_PACKAGE'):
+                seen.append(pkg)
+                assert pkg.find('EXPERIMENT') is not None
+        assert len(seen) == 3
+        assert all(len(pkg) == 0 for pkg in seen)
+
+    def test_streamed_efetch_is_parsed_incrementally(self):
+        with open(self.FIXTURE, 'rb') as f:
+            body = f.read()
+
+        class StreamedResponse(FakeResponse):
+            def iter_content(self, chunk_size):
+                for i in range(0, len(body), 100):
+                    yield body[i:i + 100]
+
+            def close(self):
+                pass
+
+        session = FakeSession([StreamedResponse(200)])
+        client = EUtilsClient(api_key='', session=session)
+        accessions = [pkg.find('EXPERIMENT').get('accession')
+                      for pkg in client.iter_sra_packages(['11', '12', '13'])]
+        assert accessions == ['SRX100001', 'SRX100002', 'SRX100003']
@@ -0,0 +1,126 @@
+"""Tests for the shared FASTQ directory scanner."""
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+sys.path.insert(0, BIN_DIR)
+import fastq_scan  # noqa: E402
+from fastq_scan import classify, pair_fastqs, scan_fastqs  # noqa: E402
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def touch(*parts, size=0):
+    path = os.path.join(*parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'@' * size)
+    return path
+
+
+class TestClassify:
+    @pytest.mark.parametrize('name,expected', [
+        ('S1_S1_L001_R1_001.fastq.gz', ('S1_S1_L001', '1')),
+        ('S1_R2.fq', ('S1', '2')),
+        ('SRR123_1.fastq.gz', ('SRR123', '1')),
+        ('SRR123_2_001.fq.gz', ('SRR123', '2')),
+        ('sample_r1.FASTQ.GZ', ('sample', '1')),
+        ('single.fastq.gz', ('single', None)),
+        ('notes.txt', None),
+        ('reads.fastq.gz.md5', None),
+    ])
+    def test_names(self, name, expected):
+        assert classify(name) == expected
+
+
+class TestScan:
+    def test_recursive_pairs_and_incomplete(self, tmpdir):
+        touch(tmpdir, 'run1', 'A_R1_001.fastq.gz')
+        touch(tmpdir, 'run1', 'A_R2_001.fastq.gz')
+        touch(tmpdir, 'run2', 'deep', 'B_1.fq.gz')
+        touch(tmpdir, 'run2', 'deep', 'B_2.fq.gz')
+        touch(tmpdir, 'C_R1.fastq.gz')
+        pairs, incomplete = pair_fastqs(scan_fastqs(tmpdir))
+        assert [p['sample'] for p in pairs] == ['A', 'B']
+        assert pairs[1]['fastq_2'] == os.path.join(tmpdir, 'run2', 'deep', 'B_2.fq.gz')
+        assert incomplete == [('C', os.path.join(tmpdir, 'C_R1.fastq.gz'))]
+
+        top_level, _ = pair_fastqs(scan_fastqs(tmpdir, recursive=False))
+        assert top_level == []
+
+    def test_same_sample_in_sibling_directories(self, tmpdir):
+        for run in ('run1', 'run2'):
+            touch(tmpdir, run, 'sampleA_R1.fastq.gz')
+            touch(tmpdir, run, 'sampleA_R2.fastq.gz')
+        touch(tmpdir, 'run3', 'sampleB_R1.fastq.gz')
+        touch(tmpdir, 'run4', 'sampleB_R2.fastq.gz')
+        pairs, incomplete = pair_fastqs(scan_fastqs(tmpdir))
+        assert [(p['fastq_1'], p['fastq_2']) for p in pairs] == [
+            (os.path.join(tmpdir, run, 'sampleA_R1.fastq.gz'), os.path.join(tmpdir, run, 'sampleA_R2.fastq.gz'))
+            for run in ('run1', 'run2')]
+        assert incomplete == [('sampleB', os.path.join(tmpdir, 'run3', 'sampleB_R1.fastq.gz')),
+                              ('sampleB', os.path.join(tmpdir, 'run4', 'sampleB_R2.fastq.gz'))]
+
+    def test_pattern_filters_names(self, tmpdir):
+        touch(tmpdir, 'A_R1.fastq.gz')
+        touch(tmpdir, 'A_R2.fastq.gz')
+        touch(tmpdir, 'B_R1.fq')
+        assert [f.sample for f in scan_fastqs(tmpdir, pattern='*.fastq.gz')] == ['A', 'A']
+
+
+class TestManifest:
+    def test_unchanged_directories_are_not_relisted(self, tmpdir, monkeypatch):
+        data = os.path.join(tmpdir, 'data')
+        touch(data, 'x', 'A_R1.fastq.gz')
+        touch(data, 'x', 'A_R2.fastq.gz')
+        touch(data, 'y', 'B_R1.fastq.gz')
+        manifest = os.path.join(tmpdir, 'manifest.json')
+        scan_fastqs(data, manifest=manifest)
+
+        listed = []
+        real_scandir = os.scandir
+
+        def counting_scandir(path):
+            listed.append(path)
+            return real_scandir(path)
+
+        monkeypatch.setattr(fastq_scan.os, 'scandir', counting_scandir)
+        assert len(scan_fastqs(data, manifest=manifest)) == 3
+        assert listed == []
+
+        # A new file changes only its own directory's mtime
+        touch(data, 'y', 'B_R2.fastq.gz', size=10)
+        os.utime(os.path.join(data, 'y'), ns=(1, 1))
+        files = scan_fastqs(data, manifest=manifest)
+        assert listed == [os.path.join(data, 'y')]
+        assert [f.size for f in files if f.sample == 'B'] == [0, 10]
+
+    def test_size_change_in_unchanged_directory_is_picked_up(self, tmpdir):
+        path = touch(tmpdir, 'data', 'A_R1.fastq.gz', size=5)
+        manifest = os.path.join(tmpdir, 'manifest.json')
+        scan_fastqs(os.path.join(tmpdir, 'data'), manifest=manifest)
+        with open(path, 'ab') as f:
+            f.write(b'@' * 5)
+        assert scan_fastqs(os.path.join(tmpdir, 'data'), manifest=manifest)[0].size == 10
+
+
+def test_mrsa_prepare_writes_samplesheet(tmpdir):
+    touch(tmpdir, 'reads', 'A_R1_001.fastq.gz')
+    touch(tmpdir, 'reads', 'A_R2_001.fastq.gz')
+    out = os.path.join(tmpdir, 'samplesheet.csv')
+    result = subprocess.run(
+        [sys.executable, os.path.join(BIN_DIR, 'mrsa-prepare'), '-p', os.path.join(tmpdir, 'reads'),
+         '-o', out], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    with open(out) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == 'sample,sra,fastq_1,fastq_2'
+    assert lines[1].startswith('A,,')
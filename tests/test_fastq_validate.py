@@ -0,0 +1,95 @@
+"""Tests for parallel FASTQ pre-flight validation."""
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+sys.path.insert(0, BIN_DIR)
+from fastq_validate import validate_pair, validate_pairs  # noqa: E402
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def write_fastq(path, names, mate):
+    text = ''.join(f'@{name}/{mate} extra\nACGT\n+\nIIII\n' for name in names)
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt') as f:
+        f.write(text)
+    return path
+
+
+def make_pair(tmpdir, sample, names1, names2=None):
+    r1 = write_fastq(os.path.join(tmpdir, f'{sample}_R1.fastq.gz'), names1, 1)
+    r2 = write_fastq(os.path.join(tmpdir, f'{sample}_R2.fastq.gz'), names2 or names1, 2)
+    return r1, r2
+
+
+class TestValidatePair:
+    def test_valid_pair_counts_reads(self, tmpdir):
+        result = validate_pair(make_pair(tmpdir, 'A', ['r1', 'r2', 'r3']))
+        assert result['error'] is None
+        assert result['reads'] == 3
+
+    def test_plain_text_fastq(self, tmpdir):
+        r1 = write_fastq(os.path.join(tmpdir, 'A_1.fq'), ['r1'], 1)
+        r2 = write_fastq(os.path.join(tmpdir, 'A_2.fq'), ['r1'], 2)
+        assert validate_pair((r1, r2))['reads'] == 1
+
+    def test_truncated_gzip(self, tmpdir):
+        r1, r2 = make_pair(tmpdir, 'A', [f'r{i}' for i in range(2000)])
+        with open(r2, 'rb') as f:
+            data = f.read()
+        with open(r2, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        assert validate_pair((r1, r2))['error'].startswith('unreadable')
+
+    def test_read_count_mismatch(self, tmpdir):
+        result = validate_pair(make_pair(tmpdir, 'A', ['r1', 'r2'], ['r1']))
+        assert 'fewer reads' in result['error']
+
+    def test_desynchronised_names(self, tmpdir):
+        result = validate_pair(make_pair(tmpdir, 'A', ['r1', 'r2'], ['r1', 'r9']))
+        assert 'names differ' in result['error']
+
+    def test_truncated_record(self, tmpdir):
+        r1, r2 = make_pair(tmpdir, 'A', ['r1'])
+        with gzip.open(r2, 'wt') as f:
+            f.write('@r1/2\nACGT\n')
+        assert '+' in validate_pair((r1, r2))['error']
+
+    @pytest.mark.parametrize('header', ['@', '@ ', '@\t '])
+    def test_empty_read_name(self, tmpdir, header):
+        r1, r2 = make_pair(tmpdir, 'A', ['r1', 'r2'])
+        with gzip.open(r2, 'wt') as f:
+            f.write(f'@r1/2\nACGT\n+\nIIII\n{header}\nACGT\n+\nIIII\n')
+        result = validate_pair((r1, r2))
+        assert result['error'] == 'empty read name'
+        assert result['reads'] == 1
+
+
+def test_pool_preserves_order(tmpdir):
+    pairs = [make_pair(tmpdir, f'S{i}', [f'r{j}' for j in range(i + 1)]) for i in range(4)]
+    assert [r['reads'] for r in validate_pairs(pairs, workers=2)] == [1, 2, 3, 4]
+
+
+def test_mrsa_prepare_validate_fills_read_count(tmpdir):
+    make_pair(tmpdir, 'good', ['r1', 'r2'])
+    make_pair(tmpdir, 'bad', ['r1', 'r2'], ['r1'])
+    out = os.path.join(tmpdir, 'samplesheet.csv')
+    result = subprocess.run(
+        [sys.executable, os.path.join(BIN_DIR, 'mrsa-prepare'), '-p', tmpdir, '-o', out,
+         '--validate', '--threads', '2'], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "Sample 'bad' failed validation" in result.stderr
+    with open(out) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == 'sample,sra,fastq_1,fastq_2,read_count_raw'
+    assert len(lines) == 2 and lines[1].startswith('good,') and lines[1].endswith(',2')
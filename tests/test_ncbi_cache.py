@@ -0,0 +1,96 @@
+"""Tests for the persistent NCBI record cache and offline replay."""
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..')
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'ncbi')
+sys.path.insert(0, os.path.join(REPO_DIR, 'bin'))
+from ncbi_cache import ResponseCache  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+class TestResponseCache:
+    def test_roundtrip_and_counters(self, tmpdir):
+        cache = ResponseCache(os.path.join(tmpdir, 'ncbi.sqlite'))
+        assert cache.get('sra', 'SRX1', 'full') is None
+        cache.put('sra', 'SRX1', 'full', '<EXPERIMENT_PACKAGE/>')
+        assert cache.get('sra', 'SRX1', 'full') == '<EXPERIMENT_PACKAGE/>'
+        assert cache.get('sra', 'SRX1', 'runinfo') is None
+        assert cache.stats['hits'] == 1
+        assert cache.stats['misses'] == 2
+
+    def test_ttl_expiry(self, tmpdir):
+        clock = FakeClock()
+        cache = ResponseCache(os.path.join(tmpdir, 'ncbi.sqlite'), clock=clock)
+        cache.put('biosample', 'SAMN1', 'full', 'record', ttl=60)
+        clock.now += 30
+        assert cache.get('biosample', 'SAMN1', 'full') == 'record'
+        clock.now += 60
+        assert cache.get('biosample', 'SAMN1', 'full') is None
+        assert cache.stats['expired'] == 1
+
+    def test_lru_eviction_respects_size_bound(self, tmpdir):
+        clock = FakeClock()
+        cache = ResponseCache(os.path.join(tmpdir, 'ncbi.sqlite'), max_bytes=100, clock=clock)
+        payload = os.urandom(60).hex()  # ~70 bytes once compressed
+        cache.put('sra', 'old', 'full', payload)
+        clock.now += 1
+        cache.put('sra', 'new', 'full', payload)
+        assert cache.get('sra', 'old', 'full') is None
+        assert cache.get('sra', 'new', 'full') == payload
+        assert cache.stats['evictions'] == 1
+
+    def test_counters_persist_across_processes(self, tmpdir):
+        path = os.path.join(tmpdir, 'ncbi.sqlite')
+        cache = ResponseCache(path)
+        cache.put('sra', 'SRX1', 'full', 'x')
+        cache.get('sra', 'SRX1', 'full')
+        cache.close()
+        reopened = ResponseCache(path)
+        assert reopened.get('sra', 'SRX1', 'full') == 'x'
+        assert reopened.cumulative_stats()['hits'] == 2
+
+
+def test_offline_replay_from_recorded_store(tmpdir):
+    """A recorded store lets the SRA parsers run end-to-end with no network."""
+    pytest.importorskip('requests')
+    from eutils import EUtilsClient, split_sra_packages
+    sys.path.insert(0, REPO_DIR)
+    import search_datasets
+
+    with open(os.path.join(FIXTURES, 'sra_full.xml')) as f:
+        packages = list(split_sra_packages(f.read()))
+    uids = ['11', '12', '13']
+
+    cache = ResponseCache(os.path.join(tmpdir, 'ncbi.sqlite'))
+    cache.put_many('sra', 'full', packages)
+    cache.put_many('sra', 'experiment_acc', zip(uids, [acc for acc, _ in packages]))
+    search = {'esearchresult': {'count': '3', 'idlist': uids}}
+    cache.put('sra', 'retmax=100|retmode=json|retstart=0|term=MRSA', 'esearch', json.dumps(search))
+
+    client = EUtilsClient(api_key='', cache=cache, offline=True)
+    result = client.esearch('sra', 'MRSA', retmax=100)
+    packages = client.iter_sra_packages(result['idlist'])
+    candidates = [c for c in map(search_datasets.parse_sra_package, packages) if c]
+
+    # SRR300002 has too few spots; SRR300003 is single-end Ion Torrent
+    assert [c['sra'] for c in candidates] == ['SRR300001']
+    assert candidates[0]['collection_date'] == '2023-05-01'
+    assert cache.stats['misses'] == 0
@@ -0,0 +1,92 @@
+"""Tests for the surveillance run ledger."""
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+SCRIPT = os.path.join(BIN_DIR, 'run_ledger.py')
+sys.path.insert(0, BIN_DIR)
+from run_ledger import RunLedger, pdat_window  # noqa: E402
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+class TestRunLedger:
+    def test_roundtrip_keeps_first_seen(self, tmpdir):
+        path = os.path.join(tmpdir, 'ledger.csv')
+        ledger = RunLedger(path)
+        assert ledger.last_seen() is None
+        assert ledger.add('SRR1', today=datetime.date(2024, 5, 1))
+        ledger.save()
+
+        reopened = RunLedger(path)
+        assert 'SRR1' in reopened
+        assert not reopened.add('SRR1', today=datetime.date(2024, 6, 1))
+        reopened.add('SRR2', today=datetime.date(2024, 6, 1))
+        reopened.mark('SRR1', 'processed')
+        reopened.save()
+
+        rows = RunLedger(path).runs
+        assert rows['SRR1'] == {'accession': 'SRR1', 'first_seen': '2024-05-01', 'status': 'processed'}
+        assert rows['SRR2']['status'] == 'selected'
+        assert RunLedger(path).last_seen() == datetime.date(2024, 6, 1)
+
+    def test_shell_format_is_plain_csv(self, tmpdir):
+        """SEARCH_SRA appends rows with echo; the Python side must read them."""
+        path = os.path.join(tmpdir, 'ledger.csv')
+        with open(path, 'w') as f:
+            f.write('accession,first_seen,status\nSRR9,2024-01-02,selected\n')
+        assert RunLedger(path).last_seen() == datetime.date(2024, 1, 2)
+
+    def test_missing_status_reads_as_selected(self, tmpdir):
+        path = os.path.join(tmpdir, 'ledger.csv')
+        with open(path, 'w') as f:
+            f.write('accession,first_seen\nSRR9,2024-01-02\n')
+        ledger = RunLedger(path)
+        ledger.add('SRR10', today=datetime.date(2024, 2, 1))
+        ledger.save()
+        with open(path, newline='') as f:
+            assert f.read() == 'accession,first_seen,status\nSRR9,2024-01-02,selected\nSRR10,2024-02-01,selected\n'
+
+    def test_failed_runs_are_selected_again(self, tmpdir):
+        ledger = RunLedger(os.path.join(tmpdir, 'ledger.csv'))
+        for acc in ('SRR1', 'SRR2', 'SRR3'):
+            ledger.add(acc, today=datetime.date(2024, 5, 1))
+        ledger.mark('SRR1', 'processed')
+        ledger.mark('SRR2', 'failed')
+        assert ledger.excluded() == {'SRR1', 'SRR3'}
+        assert ledger.add('SRR2', today=datetime.date(2024, 6, 1))
+        assert ledger.runs['SRR2'] == {'accession': 'SRR2', 'first_seen': '2024-05-01', 'status': 'selected'}
+        with pytest.raises(ValueError):
+            ledger.mark('SRR3', 'assembled')
+
+    def test_mark_cli(self, tmpdir):
+        path = os.path.join(tmpdir, 'ledger.csv')
+        ledger = RunLedger(path)
+        ledger.add('SRR1')
+        ledger.add('SRR2')
+        ledger.save()
+        accessions = os.path.join(tmpdir, 'failed.txt')
+        with open(accessions, 'w') as f:
+            f.write('SRR2\n')
+        result = subprocess.run([sys.executable, SCRIPT, path, '--status', 'failed', '-f', accessions],
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert RunLedger(path).runs['SRR2']['status'] == 'failed'
+
+        result = subprocess.run([sys.executable, SCRIPT, path, '--status', 'processed', 'SRR9'],
+                                capture_output=True, text=True)
+        assert result.returncode == 1
+        assert 'SRR9' in result.stderr
+
+
+def test_pdat_window():
+    assert pdat_window(datetime.date(2024, 3, 7)) == '2024/03/07:3000[PDAT]'
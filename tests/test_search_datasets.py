@@ -0,0 +1,69 @@
+"""Tests for adaptive candidate selection in search_datasets.py (no network access)."""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('requests')
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, REPO_DIR)
+import search_datasets  # noqa: E402
+
+
+class FakeSearchClient:
+    """Serves ESearch pages from a fixed UID list and records each request."""
+
+    def __init__(self, total):
+        self.uids = [str(i) for i in range(total)]
+        self.calls = []
+
+    def esearch(self, db, term, retmax=20, retstart=0):
+        self.calls.append((retmax, retstart))
+        return {'count': len(self.uids), 'idlist': self.uids[retstart:retstart + retmax]}
+
+
+@pytest.fixture
+def every_other_passes(monkeypatch):
+    client = FakeSearchClient(1000)
+    fetched = []
+
+    def efetch_details(uids):
+        fetched.extend(uids)
+        for uid in uids:
+            if int(uid) % 2 == 0:
+                yield {'sra': f'SRR{uid}'}
+
+    monkeypatch.setattr(search_datasets, 'CLIENT', client)
+    monkeypatch.setattr(search_datasets, 'efetch_details', efetch_details)
+    return client, fetched
+
+
+class TestSelectCandidates:
+    def test_stops_once_enough_pass(self, every_other_passes):
+        client, fetched = every_other_passes
+        picked = list(search_datasets.select_candidates('term', 10))
+        assert len(picked) == 10
+        # 10 UIDs, half pass, so the second batch is sized for the 5 still needed
+        assert client.calls == [(10, 0), (10, 10)]
+        assert len(fetched) == 20
+
+    def test_excluded_runs_count_as_rejected(self, every_other_passes):
+        client, _ = every_other_passes
+        exclude = {'SRR0', 'SRR2', 'SRR4', 'SRR6'}
+        picked = [c['sra'] for c in search_datasets.select_candidates('term', 4, exclude=exclude)]
+        assert picked == ['SRR8', 'SRR10', 'SRR12', 'SRR14']
+        assert client.calls[1] == (80, 4)  # nothing passed yet: MIN_PASS_RATE bound
+
+    def test_exhausted_search_returns_what_passed(self, monkeypatch):
+        client = FakeSearchClient(3)
+        monkeypatch.setattr(search_datasets, 'CLIENT', client)
+        monkeypatch.setattr(search_datasets, 'efetch_details',
+                            lambda uids: ({'sra': f'SRR{u}'} for u in uids))
+        assert len(list(search_datasets.select_candidates('term', 10))) == 3
+
+
+def test_organism_term_pushes_filters_to_esearch():
+    term = search_datasets.organism_term('Staphylococcus aureus')
+    assert '"paired"[Layout]' in term and '"illumina"[Platform]' in term
+    assert '"wgs"[Strategy]' in term
@@ -0,0 +1,149 @@
+"""Tests for the batch per-sample aggregator."""
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+sys.path.insert(0, BIN_DIR)
+from metadata_index import build_index  # noqa: E402
+from staphit_aggregate import (  # noqa: E402
+    SUMMARY_HEADERS, aggregate_batch, aggregate_sample, parse_kma, parse_mlst,
+    parse_spatyper, parse_trimmomatic_log,
+)
+
+SCRIPT = os.path.join(BIN_DIR, 'staphit_aggregate.py')
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def make_sample(root, sample_id):
+    """Write one sample's tool outputs under root/sample_id; returns the manifest record."""
+    d = os.path.join(root, sample_id)
+    quast_dir = os.path.join(d, 'quast')
+    write(os.path.join(quast_dir, 'transposed_report.tsv'),
+          'Assembly\t# contigs\tTotal length\tN50\tGC (%)\n'
+          f'{sample_id}\t42\t2800000\t150000\t32.80\n')
+    return {
+        'sample_id': sample_id,
+        'trim_log': write(os.path.join(d, 'trim.log'),
+                          'Input Read Pairs: 200 Both Surviving: 150 (75.00%) Dropped: 50\n'),
+        'quast_dir': quast_dir,
+        'mlst': write(os.path.join(d, 'mlst.tsv'), f'{sample_id}.fasta\tsaureus\t8\tarcC(3)\n'),
+        'spa': write(os.path.join(d, 'spa.tsv'), 'Sequence name\tRepeats\tType\ncontig1\t11-19-12\tt008\n'),
+        'sccmec': write(os.path.join(d, 'sccmec.tsv'), 'sample\tSCCmec_Type\nx\tIVa\n'),
+        'agr': write(os.path.join(d, 'agr.json'), json.dumps({'agr_group': 'I', 'confidence': 0.9})),
+        'amrfinder': write(os.path.join(d, 'amrfinder.tsv'),
+                           'Gene symbol\t% Coverage\t% Identity\tClass\n'
+                           'mecA\t100.0\t99.9\tBETA-LACTAM\nblaZ\t100.0\t100.0\tBETA-LACTAM\n'),
+        'kma': write(os.path.join(d, 'kma.res'), '#Template\tScore\tExpected\tLen\tIdentity\n'
+                                                  'mecA_1\t1000\t2\t2007\t100.00\n'),
+        'abricate': [
+            write(os.path.join(d, f'{sample_id}_abricate_resfinder.tab'),
+                  'GENE\t%COVERAGE\t%IDENTITY\nmecA\t100\t100\n'),
+            write(os.path.join(d, f'{sample_id}_abricate_vfdb.tab'),
+                  'GENE\t%COVERAGE\t%IDENTITY\nlukF-PV\t100\t99\n'),
+        ],
+    }
+
+
+def read_summary(path):
+    with open(path) as f:
+        return list(csv.reader(f, delimiter='\t'))
+
+
+class TestParsers:
+    def test_trimmomatic_log(self, tmpdir):
+        path = write(os.path.join(tmpdir, 'trim.log'), 'Input Read Pairs: 200 Both Surviving: 150 (75%)')
+        assert parse_trimmomatic_log(path) == {
+            'raw_reads': 200, 'trimmed_reads': 150, 'survival_rate': 75.0}
+
+    def test_mlst_comma_separated(self, tmpdir):
+        path = write(os.path.join(tmpdir, 'mlst.csv'), 'a.fasta,saureus,5,arcC(1)\n')
+        assert parse_mlst(path) == {'scheme': 'saureus', 'st': '5', 'alleles': ['arcC(1)']}
+
+    def test_spatyper_without_header(self, tmpdir):
+        path = write(os.path.join(tmpdir, 'spa.tsv'), 'contig1\t26-23-17\tt002\n')
+        assert parse_spatyper(path) == {'type': 't002', 'repeats': '26-23-17'}
+
+    def test_kma_skips_comment_header(self, tmpdir):
+        path = write(os.path.join(tmpdir, 'kma.res'), '#Template\tScore\tE\tL\tId\nblaZ\t9\t1\t8\t99.5\n')
+        assert parse_kma(path) == [{'gene': 'blaZ', 'score': '9', 'identity': '99.5'}]
+
+
+class TestAggregateSample:
+    def test_collects_all_sections(self, tmpdir):
+        data = aggregate_sample(make_sample(tmpdir, 'S1'))
+        assert data['assembly'] == {'n50': 150000, 'contigs': 42, 'length': 2800000, 'gc': 32.8}
+        assert data['typing']['spa']['type'] == 't008'
+        assert data['typing']['sccmec']['type'] == 'IVa'
+        assert data['typing']['agr']['group'] == 'I'
+        assert [h['gene'] for h in data['resistance']['abricate']] == ['mecA']
+        assert [h['gene'] for h in data['virulence']] == ['lukF-PV']
+        assert [h['gene'] for h in data['resistance']['kma']] == ['mecA_1']
+
+    def test_broken_output_leaves_section_empty(self, tmpdir):
+        inputs = make_sample(tmpdir, 'S1')
+        write(inputs['agr'], 'not json')
+        inputs['mlst'] = os.path.join(tmpdir, 'missing.tsv')
+        data = aggregate_sample(inputs)
+        assert data['typing']['agr'] == {}
+        assert data['typing']['mlst'] == {}
+        assert data['typing']['spa']['type'] == 't008'
+
+    def test_metadata_from_index(self, tmpdir):
+        index = os.path.join(tmpdir, 'metadata.sqlite')
+        build_index([{'run_id': 'S1', 'infection_origin': 'HA',
+                      'antibiogram': [{'antibiotic': 'oxacillin', 'sir': 'R'}]}], index)
+        inputs = make_sample(tmpdir, 'S1')
+        inputs['metadata'] = index
+        aggregate_batch([inputs], tmpdir, workers=1)
+        rows = read_summary(os.path.join(tmpdir, 'S1_summary.csv'))
+        row = dict(zip(rows[0], rows[1]))
+        assert row['infection_origin'] == 'HA'
+        assert row['ast_profile'] == 'OXA:R'
+
+
+class TestBatch:
+    def test_cli_aggregates_manifest_in_parallel(self, tmpdir):
+        manifest = os.path.join(tmpdir, 'manifest.jsonl')
+        with open(manifest, 'w') as f:
+            for sample_id in ('S1', 'S2', 'S3'):
+                f.write(json.dumps(make_sample(tmpdir, sample_id)) + '\n')
+        outdir = os.path.join(tmpdir, 'out')
+        result = subprocess.run(
+            [sys.executable, SCRIPT, '--manifest', manifest, '--outdir', outdir, '--workers', '2'],
+            capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert 'Aggregation complete for 3 samples' in result.stdout
+        for sample_id in ('S1', 'S2', 'S3'):
+            rows = read_summary(os.path.join(outdir, f'{sample_id}_summary.csv'))
+            assert rows[0] == SUMMARY_HEADERS
+            row = dict(zip(rows[0], rows[1]))
+            assert row['sample_id'] == sample_id
+            assert row['survival_rate'] == '75.00'
+            assert row['amrfinder_genes'] == 'blaZ;mecA'
+            with open(os.path.join(outdir, f'{sample_id}_report.json')) as f:
+                assert json.load(f)['typing']['mlst']['st'] == '8'
+
+    def test_cli_rejects_missing_manifest(self, tmpdir):
+        result = subprocess.run(
+            [sys.executable, SCRIPT, '--manifest', os.path.join(tmpdir, 'nope.jsonl')],
+            capture_output=True, text=True)
+        assert result.returncode == 1
+        assert 'ERROR' in result.stderr
@@ -0,0 +1,117 @@
+"""Tests for timing spans and the staphit-bench trace report."""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+TOOL = os.path.join(BIN_DIR, 'staphit-bench')
+sys.path.insert(0, BIN_DIR)
+import staphit_trace  # noqa: E402
+
+TRACE_HEADER = ['task_id', 'name', 'process', 'tag', 'status', 'submit', 'start', 'complete',
+                'realtime', '%cpu', 'peak_rss', 'cpus', 'memory', 'time']
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def write_trace(path, tasks):
+    """Raw-unit trace: tasks are (name, tag, submit_s, start_s, complete_s, cpu%, rss_gb, cpus, mem_gb)."""
+    with open(path, 'w') as f:
+        f.write('\t'.join(TRACE_HEADER) + '\n')
+        for i, (name, tag, submit, start, complete, cpu, rss, cpus, mem) in enumerate(tasks, 1):
+            process = name.split(' (')[0]
+            f.write('\t'.join(str(x) for x in [
+                i, name, process, tag or '-', 'COMPLETED', submit * 1000, start * 1000, complete * 1000,
+                (complete - start) * 1000, f'{cpu}%', int(rss * GB), cpus, int(mem * GB), 3600000,
+            ]) + '\n')
+    return path
+
+
+def run(*args):
+    return subprocess.run([sys.executable, TOOL, *args], capture_output=True, text=True)
+
+
+class TestSpans:
+    def test_disabled_is_shared_noop(self, monkeypatch):
+        monkeypatch.delenv('STAPHIT_TRACE', raising=False)
+        assert staphit_trace.span('a') is staphit_trace.span('b')
+
+    def test_enabled_appends_json_lines(self, tmpdir, monkeypatch):
+        path = os.path.join(tmpdir, 'staphit_spans.jsonl')
+        monkeypatch.setenv('STAPHIT_TRACE', path)
+        with staphit_trace.span('stage', samples=3):
+            sum(range(1000))
+        with staphit_trace.span('stage'):
+            pass
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        assert [r['name'] for r in records] == ['stage', 'stage']
+        assert records[0]['attrs'] == {'samples': 3}
+        assert records[0]['wall'] >= 0 and records[0]['peak_rss_kb'] > 0
+
+
+class TestBenchReport:
+    def test_report_flags_provisioning_and_critical_path(self, tmpdir):
+        trace = write_trace(os.path.join(tmpdir, 'trace.txt'), [
+            ('TRIMMOMATIC (S1)', 'S1', 0, 5, 65, 390.0, 1.0, 4, 16),
+            ('TRIMMOMATIC (S2)', 'S2', 0, 10, 40, 100.0, 1.0, 4, 16),
+            ('SPADES (S1)', 'S1', 65, 70, 370, 780.0, 60.0, 8, 64),
+            ('SPADES (S2)', 'S2', 40, 40, 200, 780.0, 30.0, 8, 64),
+            ('SUMMARY_MERGER', None, 370, 380, 390, 90.0, 0.1, 4, 16),
+        ])
+        spans = os.path.join(tmpdir, 'work', 'ab', 'cdef')
+        os.makedirs(spans)
+        with open(os.path.join(spans, 'staphit_spans.jsonl'), 'w') as f:
+            f.write(json.dumps({'name': 'summary.merge', 'start': 0, 'wall': 2.0, 'cpu': 1.5,
+                                'peak_rss_kb': 2048, 'pid': 1, 'attrs': {}}) + '\n')
+        out = os.path.join(tmpdir, 'bench.json')
+
+        result = run(trace, '--spans', os.path.join(tmpdir, 'work'), '--json', out)
+        assert result.returncode == 0, result.stderr
+        assert 'summary.merge' in result.stdout
+        with open(out) as f:
+            report = json.load(f)
+
+        assert report['processes']['SPADES']['tasks'] == 2
+        assert report['processes']['SPADES']['realtime']['max'] == 300
+        assert report['processes']['TRIMMOMATIC']['queue_wait']['max'] == 10
+        assert [t['name'] for t in report['critical_path']] == [
+            'TRIMMOMATIC (S1)', 'SPADES (S1)', 'SUMMARY_MERGER']
+        assert report['critical_path_wall'] == 390
+        assert any('memory near limit' in label for label in report['provisioning']['SPADES'])
+        assert any('cpus over-provisioned' in label
+                   for label in report['provisioning']['SUMMARY_MERGER'])
+        assert any('memory over-provisioned' in label
+                   for label in report['provisioning']['SUMMARY_MERGER'])
+        assert report['spans']['summary.merge']['count'] == 1
+
+    def test_human_readable_units(self, tmpdir):
+        trace = os.path.join(tmpdir, 'trace.txt')
+        with open(trace, 'w') as f:
+            f.write('\t'.join(TRACE_HEADER) + '\n')
+            f.write('\t'.join(['1', 'QUAST (S1)', 'QUAST', 'S1', 'COMPLETED',
+                               '2026-01-01 10:00:00.000', '2026-01-01 10:00:30.000',
+                               '2026-01-01 10:02:00.000', '1m 30s', '95.5%', '512 MB', '4',
+                               '16 GB', '4h']) + '\n')
+        out = os.path.join(tmpdir, 'bench.json')
+        result = run(trace, '--json', out)
+        assert result.returncode == 0, result.stderr
+        with open(out) as f:
+            quast = json.load(f)['processes']['QUAST']
+        assert quast['realtime']['p50'] == 90
+        assert quast['queue_wait']['p50'] == 30
+        assert quast['peak_rss']['max'] == 512 * 1024 ** 2
+
+    def test_missing_trace(self, tmpdir):
+        result = run(os.path.join(tmpdir, 'none.txt'))
+        assert result.returncode == 1
+        assert 'ERROR' in result.stderr
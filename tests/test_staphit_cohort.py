@@ -0,0 +1,172 @@
+"""Tests for the incremental cohort summary store."""
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+sys.path.insert(0, BIN_DIR)
+from staphit_aggregate import SUMMARY_HEADERS  # noqa: E402
+from staphit_cohort import CohortStore  # noqa: E402
+
+SCRIPT = os.path.join(BIN_DIR, 'staphit_cohort.py')
+DAY1 = datetime.date(2026, 1, 1)
+DAY2 = datetime.date(2026, 1, 2)
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def write_sample(directory, sample_id, st):
+    """Write <sample>_report.json and <sample>_summary.csv; returns the report path."""
+    os.makedirs(directory, exist_ok=True)
+    report = os.path.join(directory, f'{sample_id}_report.json')
+    with open(report, 'w') as f:
+        json.dump({'sample_id': sample_id, 'typing': {'mlst': {'st': st}}}, f)
+    with open(os.path.join(directory, f'{sample_id}_summary.csv'), 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(['sample_id', 'mlst_st'])
+        writer.writerow([sample_id, st])
+    return report
+
+
+class TestCohortStore:
+    def test_upserts_by_report_hash(self, tmpdir):
+        db = os.path.join(tmpdir, 'store', 'cohort.sqlite')
+        run1 = [write_sample(os.path.join(tmpdir, 'run1'), s, '8') for s in ('A', 'B')]
+        store = CohortStore(db)
+        assert store.ingest(run1, today=DAY1) == {
+            'added': 2, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        store.close()
+
+        run2 = [write_sample(os.path.join(tmpdir, 'run2'), 'A', '8'),
+                write_sample(os.path.join(tmpdir, 'run2'), 'B', '5'),
+                write_sample(os.path.join(tmpdir, 'run2'), 'C', '22')]
+        store = CohortStore(db)
+        assert store.ingest(run2, today=DAY2) == {
+            'added': 1, 'updated': 1, 'unchanged': 1, 'skipped': 0}
+        latest = {r['sample_id']: r for r in store.latest()}
+        store.close()
+
+        assert len(latest) == 3
+        assert latest['A']['updated'] == '2026-01-01'
+        assert latest['B']['mlst_st'] == '5'
+        assert (latest['B']['first_seen'], latest['B']['updated']) == ('2026-01-01', '2026-01-02')
+
+    def test_columns_kept_on_upsert(self, tmpdir):
+        db = os.path.join(tmpdir, 'cohort.sqlite')
+        report = write_sample(tmpdir, 'A', '8')
+        with open(os.path.join(tmpdir, 'A_summary.csv'), 'w', newline='') as f:
+            f.write('sample_id\tmlst_st\tlab_note\nA\t8\tx\n')
+        store = CohortStore(db)
+        store.ingest([report], today=DAY1)
+        store.close()
+
+        store = CohortStore(db)
+        assert store.columns()[len(SUMMARY_HEADERS):] == ['lab_note', 'report_hash', 'first_seen', 'updated']
+        store.close()
+
+    def test_columns_backfilled_for_older_store(self, tmpdir):
+        db = os.path.join(tmpdir, 'cohort.sqlite')
+        with sqlite3.connect(db) as conn:
+            conn.execute("CREATE TABLE samples (sample_id TEXT PRIMARY KEY, report_hash TEXT NOT NULL,"
+                         " first_seen TEXT NOT NULL, updated TEXT NOT NULL, summary TEXT NOT NULL)")
+            conn.execute("INSERT INTO samples VALUES ('A', 'h', '2026-01-01', '2026-01-01', ?)",
+                         (json.dumps({'sample_id': 'A', 'lab_note': 'x'}),))
+        conn.close()
+
+        store = CohortStore(db)
+        assert 'lab_note' in store.columns()
+        store.close()
+
+    def test_reopen_does_not_scan_summaries(self, tmpdir, monkeypatch):
+        import staphit_cohort
+        db = os.path.join(tmpdir, 'cohort.sqlite')
+        store = CohortStore(db)
+        store.ingest([write_sample(tmpdir, s, '8') for s in ('A', 'B', 'C')], today=DAY1)
+        store.close()
+
+        decoded = []
+        loads = json.loads
+        monkeypatch.setattr(staphit_cohort.json, 'loads', lambda text: decoded.append(text) or loads(text))
+        store = CohortStore(db)
+        assert store.columns() == SUMMARY_HEADERS + ['report_hash', 'first_seen', 'updated']
+        store.close()
+        assert decoded == []
+
+    def test_export_only_changed_samples(self, tmpdir):
+        db = os.path.join(tmpdir, 'cohort.sqlite')
+        store = CohortStore(db)
+        store.ingest([write_sample(os.path.join(tmpdir, 'run1'), s, '8') for s in ('A', 'B', 'C')], today=DAY1)
+        changed = []
+        counts = store.ingest([write_sample(os.path.join(tmpdir, 'run2'), 'A', '8'),
+                               write_sample(os.path.join(tmpdir, 'run2'), 'C', '5'),
+                               write_sample(os.path.join(tmpdir, 'run2'), 'D', '22')],
+                              today=DAY2, changed=changed)
+        assert counts['unchanged'] == 1
+        assert sorted(changed) == ['C', 'D']
+        out = os.path.join(tmpdir, 'changes.tsv')
+        assert store.export(out, samples=changed) == 2
+        store.close()
+        with open(out, newline='') as f:
+            rows = list(csv.DictReader(f, delimiter='\t'))
+        assert [(r['sample_id'], r['mlst_st']) for r in rows] == [('C', '5'), ('D', '22')]
+
+    def test_report_without_summary_is_skipped(self, tmpdir):
+        report = write_sample(tmpdir, 'A', '8')
+        os.remove(os.path.join(tmpdir, 'A_summary.csv'))
+        store = CohortStore(os.path.join(tmpdir, 'cohort.sqlite'))
+        assert store.ingest([report])['skipped'] == 1
+        assert len(store) == 0
+        store.close()
+
+
+class TestCli:
+    def run(self, *args):
+        return subprocess.run([sys.executable, SCRIPT, *args], capture_output=True, text=True)
+
+    def test_ingest_then_export(self, tmpdir):
+        db = os.path.join(tmpdir, 'cohort.sqlite')
+        manifest = os.path.join(tmpdir, 'reports.txt')
+        with open(manifest, 'w') as f:
+            f.write(write_sample(tmpdir, 'A', '8') + '\n')
+        result = self.run('ingest', '--db', db, '--manifest', manifest)
+        assert result.returncode == 0, result.stderr
+        assert '1 added' in result.stdout
+
+        out = os.path.join(tmpdir, 'cohort_summary.tsv')
+        result = self.run('export', '--db', db, '--output', out)
+        assert result.returncode == 0, result.stderr
+        with open(out, newline='') as f:
+            rows = list(csv.DictReader(f, delimiter='\t'))
+        assert list(rows[0])[:len(SUMMARY_HEADERS)] == SUMMARY_HEADERS
+        assert rows[0]['sample_id'] == 'A'
+        assert rows[0]['mlst_st'] == '8'
+        assert len(rows[0]['report_hash']) == 64
+
+    def test_ingest_writes_changes(self, tmpdir):
+        db = os.path.join(tmpdir, 'cohort.sqlite')
+        manifest = os.path.join(tmpdir, 'reports.txt')
+        changes = os.path.join(tmpdir, 'cohort_changes.tsv')
+        with open(manifest, 'w') as f:
+            f.write(write_sample(tmpdir, 'A', '8') + '\n')
+        assert self.run('ingest', '--db', db, '--manifest', manifest, '--changes', changes).returncode == 0
+        result = self.run('ingest', '--db', db, '--manifest', manifest, '--changes', changes)
+        assert result.returncode == 0, result.stderr
+        assert 'Wrote 0 added or updated samples' in result.stdout
+        with open(changes, newline='') as f:
+            assert list(csv.DictReader(f, delimiter='\t')) == []
+
+    def test_export_missing_store(self, tmpdir):
+        result = self.run('export', '--db', os.path.join(tmpdir, 'none.sqlite'))
+        assert result.returncode == 1
+        assert 'ERROR' in result.stderr
@@ -0,0 +1,75 @@
+"""Tests for the sparse gene presence/absence matrices."""
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+sys.path.insert(0, BIN_DIR)
+from staphit_genes import append_summary, load_coo, read_index  # noqa: E402
+
+SCRIPT = os.path.join(BIN_DIR, 'staphit_genes.py')
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def write_summary(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(['sample_id', 'amrfinder_genes', 'plasmids'])
+        writer.writerows(rows)
+    return path
+
+
+def entries(matrix_dir, family):
+    samples, genes, rows, cols = load_coo(matrix_dir, family)
+    return sorted((samples[r], genes[c]) for r, c in zip(rows, cols))
+
+
+class TestAppendSummary:
+    def test_builds_indexes_and_coo_entries(self, tmpdir):
+        summary = write_summary(os.path.join(tmpdir, 's.tsv'), [
+            ['A', 'blaZ;mecA', ''], ['B', 'mecA', 'rep7']])
+        out = os.path.join(tmpdir, 'gene_matrix')
+        assert append_summary(summary, out) == (2, 0)
+        assert read_index(os.path.join(out, 'samples.tsv')) == ['A', 'B']
+        assert read_index(os.path.join(out, 'amrfinder_genes', 'genes.tsv')) == ['blaZ', 'mecA']
+        assert entries(out, 'amrfinder_genes') == [('A', 'blaZ'), ('A', 'mecA'), ('B', 'mecA')]
+        assert entries(out, 'plasmids') == [('B', 'rep7')]
+
+    def test_append_keeps_existing_numbering(self, tmpdir):
+        out = os.path.join(tmpdir, 'gene_matrix')
+        append_summary(write_summary(os.path.join(tmpdir, 'run1.tsv'), [['A', 'mecA', '']]), out)
+        added = append_summary(write_summary(os.path.join(tmpdir, 'run2.tsv'), [
+            ['A', 'mecA;blaZ', ''], ['C', 'blaZ;tetK', '']]), out, batch_rows=1)
+        assert added == (1, 1)
+        assert read_index(os.path.join(out, 'samples.tsv')) == ['A', 'C']
+        assert read_index(os.path.join(out, 'amrfinder_genes', 'genes.tsv')) == ['mecA', 'blaZ', 'tetK']
+        assert entries(out, 'amrfinder_genes') == [('A', 'mecA'), ('C', 'blaZ'), ('C', 'tetK')]
+
+    def test_load_matrix_is_csr(self, tmpdir):
+        pytest.importorskip('scipy')
+        from staphit_genes import load_matrix
+        out = os.path.join(tmpdir, 'gene_matrix')
+        append_summary(write_summary(os.path.join(tmpdir, 's.tsv'), [
+            ['A', 'mecA', ''], ['B', 'mecA;blaZ', ''], ['C', '', '']]), out)
+        samples, genes, matrix = load_matrix(out, 'amrfinder_genes')
+        assert matrix.shape == (3, 2)
+        assert matrix.sum(axis=0).tolist() == [[2, 1]]
+
+
+class TestCli:
+    def test_missing_summary(self, tmpdir):
+        result = subprocess.run([sys.executable, SCRIPT, '--summary', os.path.join(tmpdir, 'no.tsv')],
+                                capture_output=True, text=True)
+        assert result.returncode == 1
+        assert 'ERROR' in result.stderr
@@ -3,10 +3,13 @@ import subprocess
 import csv
 import json
 import os
+import sys
 import tempfile
 import pytest
 
 TOOL = os.path.join(os.path.dirname(__file__), '..', 'bin', 'staphit-metadata')
+sys.path.insert(0, os.path.dirname(TOOL))
+from metadata_index import lookup  # noqa: E402
 
 @pytest.fixture
 def tmpdir():
@@ -158,6 +161,98 @@ class TestValidate:
         assert result.returncode == 1
 
 
+class TestValidateStructured:
+    META = {'sample_id': 'ID00001', 'organism': 'Staphylococcus aureus', 'collection_date': '2024-03-15', 'geo_loc_country': 'Saudi Arabia', 'geo_loc_region': 'Riyadh', 'host': 'Homo sapiens', 'isolation_source': 'blood'}
+    ABG = {'sample_id': 'ID00001', 'antibiotic': 'oxacillin', 'resistance_phenotype': 'R', 'measurement': '4', 'measurement_sign': '=', 'measurement_units': 'mg/L', 'laboratory_typing_method': 'MIC', 'testing_standard': 'CLSI'}
+
+    def _write(self, path, rows):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def _validate(self, *args):
+        return subprocess.run(['python', TOOL, 'validate', *args], capture_output=True, text=True)
+
+    def test_ndjson_issues_and_summary(self, tmpdir):
+        meta = self._write(os.path.join(tmpdir, 'm.csv'), [dict(self.META, collection_date='15/03/2024')])
+        abg = self._write(os.path.join(tmpdir, 'a.csv'), [dict(self.ABG, sample_id='ID00099', resistance_phenotype='X')])
+        result = self._validate('--metadata', meta, '--antibiogram', abg, '--format', 'ndjson')
+        assert result.returncode == 0
+        lines = [json.loads(line) for line in result.stdout.splitlines()]
+        assert [(i['file'], i['row'], i['rule']) for i in lines[:-1]] == [
+            ('metadata', 2, 'date_format'), ('antibiogram', 2, 'resistance_phenotype'),
+            ('antibiogram', 2, 'orphan_sample')]
+        assert lines[1]['sample'] == 'ID00099' and lines[1]['value'] == 'X'
+        assert lines[-1]['summary'] == {'errors': 0, 'warnings': 3, 'fatal': False,
+                                        'truncated': False, 'exit_code': 0}
+
+    def test_strict_and_missing_column_exit_codes(self, tmpdir):
+        meta = self._write(os.path.join(tmpdir, 'm.csv'), [dict(self.META, host_sex='M')])
+        assert self._validate('--metadata', meta).returncode == 0
+        assert self._validate('--metadata', meta, '--strict').returncode == 2
+
+        no_host = {k: v for k, v in self.META.items() if k != 'host'}
+        meta = self._write(os.path.join(tmpdir, 'm2.csv'), [no_host])
+        out = os.path.join(tmpdir, 'validation.json')
+        # A missing column stays a warning, as before exit codes followed severity
+        result = self._validate('--metadata', meta, '--format', 'json', '-o', out)
+        assert result.returncode == 0
+        with open(out) as f:
+            report = json.load(f)
+        assert report['issues'][0]['rule'] == 'missing_column'
+        assert report['issues'][0]['severity'] == 'warning'
+        assert report['summary']['warnings'] == 1
+        assert self._validate('--metadata', meta, '--strict').returncode == 2
+
+    def test_max_errors_stops_early(self, tmpdir):
+        meta = self._write(os.path.join(tmpdir, 'm.csv'),
+                           [dict(self.META, sample_id=f'ID{i:05d}', collection_date='bad') for i in range(50)])
+        result = self._validate('--metadata', meta, '--format', 'ndjson', '--max-errors', '5')
+        lines = [json.loads(line) for line in result.stdout.splitlines()]
+        assert len(lines) == 6
+        assert lines[-1]['summary']['truncated'] is True
+
+    def test_null_byte_is_fatal_record(self, tmpdir):
+        path = os.path.join(tmpdir, 'm.csv')
+        with open(path, 'w') as f:
+            f.write('sample_id,organism\nID1,x\x00y\n')
+        result = self._validate('--metadata', path, '--format', 'ndjson')
+        assert result.returncode == 1
+        *_, issue, summary = [json.loads(line) for line in result.stdout.splitlines()]
+        assert (issue['rule'], issue['severity']) == ('null_byte', 'fatal')
+        assert summary['summary']['fatal'] is True
+
+    def test_chunks_keep_row_numbers(self, tmpdir):
+        from metadata_validate import validate
+        rows = [dict(self.META, sample_id=f'ID{i:05d}', collection_date='bad' if i % 7 == 0 else '2024')
+                for i in range(200)]
+        rows[50]['isolation_source'] = 'line one\nline two'
+        meta = self._write(os.path.join(tmpdir, 'm.csv'), rows)
+        abg = self._write(os.path.join(tmpdir, 'a.csv'),
+                          [dict(self.ABG, sample_id=f'ID{i:05d}') for i in range(190, 230)])
+        serial = list(validate(meta, abg))
+        assert list(validate(meta, abg, chunk_rows=16)) == serial
+        assert [i['row'] for i in serial if i['rule'] == 'date_format'][:3] == [2, 9, 16]
+        assert len([i for i in serial if i['rule'] == 'orphan_sample']) == 30
+
+    def test_stray_quote_keeps_record_boundaries(self, tmpdir):
+        from metadata_validate import validate
+        path = os.path.join(tmpdir, 'm.csv')
+        with open(path, 'w') as f:
+            f.write(','.join(self.META) + '\n')
+            for i in range(8):
+                meta = dict(self.META, sample_id=f'ID{i:05d}', collection_date='bad' if i % 3 == 0 else '2024')
+                if i == 1:
+                    meta['geo_loc_region'] = '5"x'
+                    meta['isolation_source'] = '"line one\nline two"'
+                f.write(','.join(meta.values()) + '\n')
+        serial = list(validate(path))
+        assert [i['row'] for i in serial if i['rule'] == 'date_format'] == [2, 5, 8]
+        assert list(validate(path, chunk_rows=2)) == serial
+
+
 class TestNormalize:
     def _write_metadata(self, tmpdir, rows):
         path = os.path.join(tmpdir, 'metadata.csv')
@@ -212,3 +307,234 @@ class TestNormalize:
         with open(out) as f:
             data = json.load(f)
         assert data[0]['run_id'] == 'ID00001'
+
+    def test_normalize_writes_index(self, tmpdir):
+        meta = self._write_metadata(tmpdir, [
+            {'sample_id': 'ID00001', 'organism': 'Staphylococcus aureus', 'host': 'Homo sapiens'},
+            {'sample_id': 'ID00002', 'organism': 'Staphylococcus aureus', 'host': ''},
+        ])
+        out = os.path.join(tmpdir, 'metadata.json')
+        index = os.path.join(tmpdir, 'metadata.sqlite')
+        result = subprocess.run(['python', TOOL, 'normalize', '--metadata', meta, '-o', out, '--index', index],
+                                capture_output=True, text=True)
+        assert result.returncode == 0
+        assert lookup(index, 'ID00001')['host'] == 'Homo sapiens'
+        assert lookup(index, 'ID00002')['run_id'] == 'ID00002'
+        assert lookup(index, 'ID99999') == {}
+
+    def test_index_from_fetched_json(self, tmpdir):
+        src = os.path.join(tmpdir, 'metadata.json')
+        with open(src, 'w') as f:
+            json.dump([{'run_id': 'SRR1', 'biosample': 'SAMN1'}, {'run_id': 'SRR1', 'biosample': 'dup'}], f)
+        index = os.path.join(tmpdir, 'metadata.sqlite')
+        result = subprocess.run(['python', TOOL, 'index', '-i', src, '-o', index], capture_output=True, text=True)
+        assert result.returncode == 0
+        # First record wins, as with the linear scan it replaces
+        assert lookup(index, 'SRR1')['biosample'] == 'SAMN1'
+
+
+class TestNormalizeStreaming:
+    ABG = {'antibiotic': 'oxacillin', 'resistance_phenotype': 'R', 'measurement': '4', 'measurement_sign': '=', 'measurement_units': 'mg/L', 'laboratory_typing_method': 'MIC', 'testing_standard': 'CLSI'}
+
+    def _write(self, path, rows):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def _inputs(self, tmpdir):
+        meta = self._write(os.path.join(tmpdir, 'm.csv'), [
+            {'sample_id': sid, 'host': 'Homo sapiens'} for sid in ['ID3', 'ID1', 'ID2', 'ID1']])
+        abg = self._write(os.path.join(tmpdir, 'a.csv'), [
+            dict(self.ABG, sample_id=sid, antibiotic=drug)
+            for sid, drug in [('ID2', 'a'), ('ID9', 'x'), ('ID1', 'b'), ('ID2', 'c'), ('', 'y'), ('ID1', 'd')]])
+        return meta, abg
+
+    def test_unsorted_inputs_are_sorted_on_disk(self, tmpdir):
+        from metadata_normalize import iter_sorted, join_records
+        meta, abg = self._inputs(tmpdir)
+        records = list(join_records(iter_sorted(meta, chunk_rows=2), iter_sorted(abg, chunk_rows=2)))
+        assert [r['run_id'] for r in records] == ['ID1', 'ID1', 'ID2', 'ID3']
+        assert [e['antibiotic'] for e in records[0]['antibiogram']] == ['b', 'd']
+        assert records[1]['antibiogram'] == records[0]['antibiogram']
+        assert [e['antibiotic'] for e in records[2]['antibiogram']] == ['a', 'c']
+        assert records[3]['antibiogram'] == []
+
+    def test_sorted_flag_rejects_unsorted_input(self, tmpdir):
+        meta, abg = self._inputs(tmpdir)
+        result = subprocess.run(['python', TOOL, 'normalize', '--metadata', meta, '--sorted',
+                                 '-o', os.path.join(tmpdir, 'out.json')], capture_output=True, text=True)
+        assert result.returncode == 1
+        assert 'not sorted' in result.stderr
+
+    def test_json_list_layout_matches_json_dump(self, tmpdir):
+        meta, abg = self._inputs(tmpdir)
+        out = os.path.join(tmpdir, 'metadata.json')
+        result = subprocess.run(['python', TOOL, 'normalize', '--metadata', meta, '--antibiogram', abg, '-o', out],
+                                capture_output=True, text=True)
+        assert result.returncode == 0
+        with open(out) as f:
+            text = f.read()
+        assert text == json.dumps(json.loads(text), indent=2)
+
+    def test_gzipped_ndjson_and_shards(self, tmpdir):
+        import gzip
+        meta, abg = self._inputs(tmpdir)
+        out = os.path.join(tmpdir, 'metadata.ndjson.gz')
+        shards = os.path.join(tmpdir, 'shards')
+        index = os.path.join(tmpdir, 'metadata.sqlite')
+        result = subprocess.run(['python', TOOL, 'normalize', '--metadata', meta, '--antibiogram', abg,
+                                 '--format', 'ndjson', '-o', out, '--shard-dir', shards, '--index', index],
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        with gzip.open(out, 'rt') as f:
+            assert [json.loads(line)['run_id'] for line in f] == ['ID1', 'ID1', 'ID2', 'ID3']
+        with open(os.path.join(shards, 'manifest.tsv')) as f:
+            manifest = list(csv.reader(f, delimiter='\t'))
+        assert manifest[1:] == [['ID1', 'ID1.json', '2'], ['ID1', 'ID1.28c5c77b.json', '2'],
+                                ['ID2', 'ID2.json', '2'], ['ID3', 'ID3.json', '0']]
+        with open(os.path.join(shards, 'ID2.json')) as f:
+            assert json.load(f)['antibiogram'][1]['antibiotic'] == 'c'
+        assert len(lookup(index, 'ID2')['antibiogram']) == 2
+
+        rebuilt = os.path.join(tmpdir, 'rebuilt.sqlite')
+        result = subprocess.run(['python', TOOL, 'index', '-i', out, '-o', rebuilt], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert lookup(rebuilt, 'ID3')['host'] == 'Homo sapiens'
+
+    def test_shard_names_never_collide(self, tmpdir):
+        from metadata_normalize import ShardSink
+        shards = os.path.join(tmpdir, 'shards')
+        sink = ShardSink(shards)
+        for sid in ['A/B', 'A_B', 'x', 'x', 'x', 'x.2']:
+            sink.add({'run_id': sid, 'antibiogram': []})
+        sink.close()
+        with open(os.path.join(shards, 'manifest.tsv')) as f:
+            manifest = list(csv.reader(f, delimiter='\t'))[1:]
+        paths = [path for _, path, _ in manifest]
+        assert len(set(paths)) == len(paths) == 6
+        assert paths[0] == 'A_B.json' and paths[2] == 'x.json' and paths[5] == 'x.2.json'
+        for sid, path, _ in manifest:
+            with open(os.path.join(shards, path)) as f:
+                assert json.load(f)['run_id'] == sid
+
+
+class TestConvertKaimrc:
+    def _inputs(self, tmpdir):
+        openpyxl = pytest.importorskip('openpyxl')
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = 'KAIMRC'
+        ws.append(['Sample info', None, None, None, None, None, None, None, None])
+        ws.append(['UID', 'gender', 'age', 'isolation site', 'in-patient/out-patient', 'diagnosis',
+                   'VAN', 'MUP', 'FLU'])
+        ws.append(['ID1', 'M', '45y', 'Blood', 'In', 'Sepsis', 'S', 'r', 'S'])
+        ws.append(['ID2', 'female', None, 'NA', 'outpatient', '=FALSE()', 'R', None, None])
+        ws.append(['ID9', 'M', '30', 'Wound', 'In', 'Abscess', 'S', 'S', 'R'])
+        ws.append(['ID1', 'F', '50', None, None, None, 'R', 'S', None])
+        xlsx = os.path.join(tmpdir, 'kaimrc.xlsx')
+        wb.save(xlsx)
+        meta = os.path.join(tmpdir, 'sample_metadata.csv')
+        with open(meta, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['sample_id', 'host_sex', 'host_age', 'host_body_site', 'patient_status', 'host_disease'])
+            writer.writerow(['ID1', '', '', '', '', ''])
+            writer.writerow(['ID2', '', '', '', 'hospitalized', ''])
+            writer.writerow(['ID3', '', '', '', '', ''])
+        abg = os.path.join(tmpdir, 'antibiogram.csv')
+        with open(abg, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['sample_id', 'antibiotic'])
+            writer.writerow(['ID2', 'Vancomycin'])
+        return xlsx, meta, abg
+
+    def test_enriches_metadata_and_extracts_drugs(self, tmpdir):
+        xlsx, meta, abg = self._inputs(tmpdir)
+        out = os.path.join(tmpdir, 'supplement.csv')
+        result = subprocess.run(['python', TOOL, 'convert', '--from-kaimrc-xlsx', xlsx, '--metadata', meta,
+                                 '--existing-antibiogram', abg, '-o', out], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert 'Enriched 2 samples' in result.stderr
+        assert 'Extracted 2 supplementary drug rows from 1 samples' in result.stderr
+        assert 'FLU (2 values' in result.stderr
+        with open(meta, newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert [r['sample_id'] for r in rows] == ['ID1', 'ID2', 'ID3']
+        assert rows[0] == {'sample_id': 'ID1', 'host_sex': 'male', 'host_age': '45', 'host_body_site': 'blood',
+                           'patient_status': 'hospitalized', 'host_disease': 'Sepsis'}
+        assert rows[1]['host_sex'] == 'female' and rows[1]['patient_status'] == 'hospitalized'
+        with open(out, newline='') as f:
+            drugs = [(r['sample_id'], r['antibiotic'], r['resistance_phenotype']) for r in csv.DictReader(f)]
+        assert drugs == [('ID1', 'Vancomycin', 'S'), ('ID1', 'Mupirocin', 'R')]
+        assert sorted(os.listdir(tmpdir)) == ['antibiogram.csv', 'kaimrc.xlsx', 'sample_metadata.csv',
+                                              'supplement.csv']
+
+    def test_failed_run_leaves_metadata_untouched(self, tmpdir):
+        xlsx, meta, abg = self._inputs(tmpdir)
+        with open(meta) as f:
+            before = f.read()
+        out = os.path.join(tmpdir, 'missing', 'supplement.csv')
+        result = subprocess.run(['python', TOOL, 'convert', '--from-kaimrc-xlsx', xlsx, '--metadata', meta,
+                                 '-o', out], capture_output=True, text=True)
+        assert result.returncode != 0
+        with open(meta) as f:
+            assert f.read() == before
+        assert sorted(os.listdir(tmpdir)) == ['antibiogram.csv', 'kaimrc.xlsx', 'sample_metadata.csv']
+
+
+class TestConvertVitekCsv:
+    CELLS = [
+        ['UID', 'Cefoxitin', 'Vancomycin', 'Oxacillin', 'Odd, name'],
+        ['ID1', 'R:POS', 'S:<= 0.5', 'R:>= 4*', 'I:64'],
+        ['', 'R:POS', 'S:1', 'S:1', 'S:1'],
+        [' ID2 ', 'S:NEG*', '', 'X:4', ' R:<1 '],
+        ['ID3', 'POS', 'R:\u00b54', 'S:"2"', 'R:\n8'],
+    ]
+
+    def _tsv(self, tmpdir, rows=CELLS, name='vitek.tsv'):
+        path = os.path.join(tmpdir, name)
+        with open(path, 'w', newline='') as f:
+            csv.writer(f, delimiter='\t').writerows(rows)
+        return path
+
+    def _convert(self, tmpdir, tsv, out, block_pandas=False):
+        prelude = "import sys, runpy; sys.modules['pandas'] = None; " if block_pandas else "import sys, runpy; "
+        argv = ['staphit-metadata', 'convert', '--from-vitek-csv', tsv, '-o', out]
+        result = subprocess.run(['python', '-c', prelude + f"sys.argv = {argv!r}; "
+                                 f"runpy.run_path({TOOL!r}, run_name='__main__')"],
+                                capture_output=True, text=True, cwd=os.path.dirname(TOOL))
+        assert result.returncode == 0, result.stderr
+        with open(out, 'rb') as f:
+            return result.stderr, f.read()
+
+    def test_long_format_rows_in_input_order(self, tmpdir):
+        tsv = self._tsv(tmpdir)
+        out = os.path.join(tmpdir, 'antibiogram.csv')
+        stderr, _ = self._convert(tmpdir, tsv, out)
+        assert 'Converted 3 samples, 9 rows' in stderr
+        with open(out, newline='') as f:
+            rows = [(r['sample_id'], r['antibiotic'], r['resistance_phenotype'], r['measurement_sign'],
+                     r['measurement'], r['laboratory_typing_method'], r['aes_modified']) for r in csv.DictReader(f)]
+        assert rows == [
+            ('ID1', 'Cefoxitin', 'R', '=', 'POS', 'Screen', ''),
+            ('ID1', 'Vancomycin', 'S', '<=', '0.5', 'MIC', ''),
+            ('ID1', 'Oxacillin', 'R', '>=', '4', 'MIC', 'true'),
+            ('ID1', 'Odd, name', 'I', '=', '64', 'MIC', ''),
+            ('ID2', 'Cefoxitin', 'S', '=', 'NEG', 'Screen', 'true'),
+            ('ID2', 'Odd, name', 'R', '<', '1', 'MIC', ''),
+            ('ID3', 'Vancomycin', 'R', '=', '\u00b54', 'MIC', ''),
+            ('ID3', 'Oxacillin', 'S', '=', '"2"', 'MIC', ''),
+            ('ID3', 'Odd, name', 'R', '=', '8', 'MIC', ''),
+        ]
+
+    def test_columnar_and_stdlib_paths_match(self, tmpdir):
+        pytest.importorskip('pandas')
+        pytest.importorskip('pyarrow')
+        # Chunks with non-ASCII cells are parsed cell by cell even on the columnar path
+        ascii_only = self.CELLS[:-1] + [['ID3', 'POS', 'R:4', 'S:"2"', 'R:\n8']]
+        for tsv in [self._tsv(tmpdir), self._tsv(tmpdir, ascii_only, 'ascii.tsv')]:
+            columnar = self._convert(tmpdir, tsv, os.path.join(tmpdir, 'a.csv'))
+            stdlib = self._convert(tmpdir, tsv, os.path.join(tmpdir, 'b.csv'), block_pandas=True)
+            assert columnar[1] == stdlib[1]
+            assert columnar[0].replace('a.csv', 'b.csv') == stdlib[0]
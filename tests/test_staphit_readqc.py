@@ -0,0 +1,101 @@
+"""Tests for read-quality metrics from FASTQ files and FastQC zips."""
+import gzip
+import os
+import sys
+import tempfile
+import zipfile
+
+import pytest
+
+pytest.importorskip('numpy')
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+sys.path.insert(0, BIN_DIR)
+from staphit_aggregate import aggregate_sample, summary_row, SUMMARY_HEADERS  # noqa: E402
+from staphit_readqc import fastq_stats, parse_fastqc_zip  # noqa: E402
+
+FASTQC_DATA = """##FastQC\t0.12.1
+>>Basic Statistics\tpass
+#Measure\tValue
+Filename\tS1_1.trimmed.fastq.gz
+Total Sequences\t100
+Sequence length\t36-151
+%GC\t33
+>>END_MODULE
+>>Per sequence quality scores\tpass
+#Quality\tCount
+20\t25.0
+35\t75.0
+>>END_MODULE
+>>Sequence Length Distribution\tpass
+#Length\tCount
+36-39\t50.0
+151\t50.0
+>>END_MODULE
+"""
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def write_fastq(path, records, newline_at_end=True):
+    text = ''.join(f'@r{i}\n{seq}\n+\n{qual}\n' for i, (seq, qual) in enumerate(records))
+    if not newline_at_end:
+        text = text.rstrip('\n')
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt') as f:
+        f.write(text)
+    return path
+
+
+def write_fastqc_zip(path):
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('S1_1.trimmed_fastqc/fastqc_data.txt', FASTQC_DATA)
+    return path
+
+
+class TestFastqStats:
+    def test_counts_q30_bases_across_chunks(self, tmpdir):
+        # 'I' is Q40, '5' is Q20
+        r1 = write_fastq(os.path.join(tmpdir, 'S1_1.fastq.gz'), [('ACGT', 'IIII'), ('GG', '55')])
+        r2 = write_fastq(os.path.join(tmpdir, 'S1_2.fastq'), [('ACGTN', 'II555')],
+                         newline_at_end=False)
+        stats = fastq_stats([r1, r2], chunk_records=1)
+        assert stats['reads'] == 3
+        assert stats['bases'] == 11
+        assert stats['q30_rate'] == pytest.approx(100 * 6 / 11)
+        assert stats['mean_quality'] == pytest.approx((6 * 40 + 5 * 20) / 11)
+        assert stats['length_distribution'] == {2: 1, 4: 1, 5: 1}
+        assert (stats['min_length'], stats['max_length']) == (2, 5)
+        assert stats['composition']['G'] == pytest.approx(100 * 4 / 11)
+        assert stats['gc_percent'] == pytest.approx(100 * 6 / 11)
+
+
+class TestFastqcZip:
+    def test_reads_metrics_in_memory(self, tmpdir):
+        metrics = parse_fastqc_zip(write_fastqc_zip(os.path.join(tmpdir, 'S1_1_fastqc.zip')))
+        assert metrics['total_sequences'] == 100
+        assert metrics['gc_percent'] == 33.0
+        assert metrics['mean_quality'] == pytest.approx(31.25)
+        assert metrics['q30_read_rate'] == 75.0
+        assert metrics['mean_length'] == pytest.approx((37.5 + 151) / 2)
+
+
+class TestAggregatorQc:
+    def row(self, inputs):
+        return dict(zip(SUMMARY_HEADERS, summary_row(aggregate_sample(inputs))))
+
+    def test_q30_from_reads(self, tmpdir):
+        reads = write_fastq(os.path.join(tmpdir, 'S1_1.fastq.gz'), [('ACGT', 'II55')])
+        row = self.row({'sample_id': 'S1', 'reads': [reads]})
+        assert row['q30_rate'] == '50.00'
+        assert row['mean_quality'] == '30.00'
+
+    def test_mean_quality_falls_back_to_fastqc(self, tmpdir):
+        zip_path = write_fastqc_zip(os.path.join(tmpdir, 'S1_1_fastqc.zip'))
+        row = self.row({'sample_id': 'S1', 'fastqc': [zip_path]})
+        assert row['q30_rate'] == '0.00'
+        assert row['mean_quality'] == '31.25'
@@ -0,0 +1,81 @@
+"""Tests for the streaming summary merger."""
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+sys.path.insert(0, BIN_DIR)
+from staphit_summary import merge_summaries, union_header  # noqa: E402
+
+SCRIPT = os.path.join(BIN_DIR, 'staphit_summary.py')
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def write_summary(tmpdir, name, header, *rows):
+    path = os.path.join(tmpdir, f'{name}_summary.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(header)
+        writer.writerows(rows)
+    return path
+
+
+def read_tsv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f, delimiter='\t'))
+
+
+class TestMergeSummaries:
+    def test_union_keeps_rows_with_different_headers(self, tmpdir):
+        old = write_summary(tmpdir, 'A', ['sample_id', 'n50'], ['A', '100'])
+        new = write_summary(tmpdir, 'B', ['sample_id', 'n50', 'spa_type'], ['B', '200', 't008'])
+        assert union_header([old, new]) == ['sample_id', 'n50', 'spa_type']
+
+        out = os.path.join(tmpdir, 'final_summary.tsv')
+        assert merge_summaries([old, new], out) == 2
+        rows = read_tsv(out)
+        assert rows[0] == {'sample_id': 'A', 'n50': '100', 'spa_type': ''}
+        assert rows[1] == {'sample_id': 'B', 'n50': '200', 'spa_type': 't008'}
+
+    def test_empty_file_is_skipped(self, tmpdir):
+        empty = os.path.join(tmpdir, 'E_summary.csv')
+        open(empty, 'w').close()
+        good = write_summary(tmpdir, 'A', ['sample_id'], ['A'])
+        out = os.path.join(tmpdir, 'final_summary.tsv')
+        assert merge_summaries([empty, good], out) == 1
+
+    def test_parquet_is_typed(self, tmpdir):
+        pq = pytest.importorskip('pyarrow.parquet')
+        header = ['sample_id', 'n50', 'gc_percent', 'amrfinder_genes']
+        paths = [write_summary(tmpdir, f'S{i}', header, [f'S{i}', str(i), '32.5', 'mecA'])
+                 for i in range(5)]
+        out = os.path.join(tmpdir, 'final_summary.tsv')
+        parquet = os.path.join(tmpdir, 'final_summary.parquet')
+        merge_summaries(paths, out, parquet, batch_rows=2)
+
+        table = pq.read_table(parquet, columns=['n50', 'amrfinder_genes'])
+        assert table.column('n50').to_pylist() == [0, 1, 2, 3, 4]
+        assert str(table.schema.field('amrfinder_genes').type).startswith('dictionary')
+        assert pq.ParquetFile(parquet).metadata.num_row_groups == 3
+
+
+class TestCli:
+    def test_reads_files_from_manifest(self, tmpdir):
+        paths = [write_summary(tmpdir, s, ['sample_id'], [s]) for s in ('A', 'B')]
+        manifest = os.path.join(tmpdir, 'summaries.txt')
+        with open(manifest, 'w') as f:
+            f.write('\n'.join(paths) + '\n')
+        out = os.path.join(tmpdir, 'final_summary.tsv')
+        result = subprocess.run([sys.executable, SCRIPT, '--manifest', manifest, '--output', out],
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert [r['sample_id'] for r in read_tsv(out)] == ['A', 'B']
@@ -0,0 +1,58 @@
+"""Tests for the cohort summary plots."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('seaborn')
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+sys.path.insert(0, BIN_DIR)
+from visualize_results import (  # noqa: E402
+    generate_visualizations, group_prevalence, load_summary, presence_matrix,
+)
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def cohort():
+    return pd.DataFrame({
+        'sample_id': ['A', 'B', 'C', 'D'],
+        'mlst_st': ['8', '8', '5', None],
+        'amrfinder_genes': ['mecA;blaZ', 'mecA', None, 'blaZ'],
+    })
+
+
+class TestMatrices:
+    def test_presence_matrix(self):
+        matrix = presence_matrix(cohort(), 'amrfinder_genes')
+        assert list(matrix.index) == ['A', 'B', 'C', 'D']
+        assert matrix['mecA'].tolist() == [1, 1, 0, 0]
+        assert matrix['blaZ'].tolist() == [1, 0, 0, 1]
+
+    def test_group_prevalence(self):
+        df = cohort()
+        prevalence = group_prevalence(presence_matrix(df, 'amrfinder_genes'), df['mlst_st'])
+        assert list(prevalence.index) == ['8 (n=2)', '5 (n=1)', '- (n=1)']
+        assert prevalence.loc['8 (n=2)', 'mecA'] == 1.0
+        assert prevalence.loc['8 (n=2)', 'blaZ'] == 0.5
+
+
+class TestGenerate:
+    def test_loads_only_plotted_columns(self, tmpdir):
+        path = os.path.join(tmpdir, 'final_summary.tsv')
+        cohort().assign(n50=1).to_csv(path, sep='\t', index=False)
+        assert 'n50' not in load_summary(path).columns
+
+    def test_large_cohort_uses_grouped_mode(self, tmpdir):
+        path = os.path.join(tmpdir, 'final_summary.tsv')
+        pd.concat([cohort()] * 5).to_csv(path, sep='\t', index=False)
+        generate_visualizations(path, os.path.join(tmpdir, 'plots'), max_rows=10)
+        assert sorted(os.listdir(os.path.join(tmpdir, 'plots'))) == [
+            'amr_heatmap.png', 'mlst_distribution.png']
@@ -0,0 +1,235 @@
+"""Tests for Vitek 2 PDF report parsing and the parallel cached directory conversion."""
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+pytest.importorskip('pdfplumber')
+
+BIN_DIR = os.path.join(os.path.dirname(__file__), '..', 'bin')
+TOOL = os.path.join(BIN_DIR, 'staphit-metadata')
+sys.path.insert(0, BIN_DIR)
+import vitek_pdf  # noqa: E402
+
+AST_HEADER = 'Antimicrobial MIC Interpretation Antimicrobial MIC Interpretation'
+FOOTER = '+= Deduced drug *= AES modified **= User modified'
+
+
+@pytest.fixture
+def tmpdir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def write_pdf(path, *pages):
+    """Minimal PDF with one page per list of lines, each line shown in Helvetica."""
+    def esc(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    n = len(pages)
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [' + ' '.join(f'{4 + 2 * i} 0 R' for i in range(n)) + f'] /Count {n} >>',
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for i, lines in enumerate(pages):
+        content = 'BT /F1 10 Tf 14 TL 40 800 Td ' + ' '.join(f'({esc(line)}) Tj T*' for line in lines) + ' ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {5 + 2 * i} 0 R '
+                       '/Resources << /Font << /F1 3 0 R >> >> >>')
+        objects.append(f'<< /Length {len(content)} >>\nstream\n{content}\nendstream')
+    out = '%PDF-1.4\n'
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{i} 0 obj\n{obj}\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'
+    out += ''.join(f'{o:010d} 00000 n \n' for o in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'
+    with open(path, 'w', encoding='latin-1') as f:
+        f.write(out)
+    return path
+
+
+def report(isolate, ast_lines):
+    return [f'Isolate: {isolate}', 'Organism: Staphylococcus aureus', AST_HEADER, *ast_lines, FOOTER]
+
+
+REPORT_A = report('ID2-1', [
+    'CefoxitinScreen POS + Moxifloxacin <= 0.25 S',
+    'Benzylpenicillin >= 0.5 R Erythromycin >= 8 R',
+    'Oxacillin >= 4 R Inducible Clindamycin NEG -',
+    'Gentamicin <= 0.5 S Resistance',
+    'Levofloxacin 4 *R Clindamycin <= 0.25 S',
+    'Linezolid 2 S Trimethoprim/Sulfamethoxaz <= 10 S',
+    'Vancomycin 1 S ole',
+])
+REPORT_B = report('ID1-2', [
+    'Oxacillin 0.5 S Tetracycline 16 R',
+    'Vancomycin <= 0.5 S Rifampicin <= 0.5 S',
+])
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+class TestAstTable:
+    def test_two_column_layout_with_wrapped_names(self):
+        ast = '\n'.join([AST_HEADER, *REPORT_A[3:-1]])
+        assert vitek_pdf.parse_ast_table(ast) == [
+            ('Cefoxitin', 'POS', '+'),
+            ('Benzylpenicillin', '>= 0.5', 'R'),
+            ('Oxacillin', '>= 4', 'R'),
+            ('Gentamicin', '<= 0.5', 'S'),
+            ('Levofloxacin', '4', '*R'),
+            ('Moxifloxacin', '<= 0.25', 'S'),
+            ('Erythromycin', '>= 8', 'R'),
+            ('Linezolid', '2', 'S'),
+            ('Vancomycin', '1', 'S'),
+            ('Inducible Clindamycin Resistance', 'NEG', '-'),
+            ('Clindamycin', '<= 0.25', 'S'),
+            ('Trimethoprim/Sulfamethoxazole', '<= 10', 'S'),
+        ]
+
+    def test_values_on_the_line_after_the_name(self):
+        ast = 'Trimethoprim/Sulfamethoxazole\n<= 10 S\nFusidicAcid\n<= 0.5 S'
+        assert vitek_pdf.parse_ast_table(ast) == [
+            ('Fusidic Acid', '<= 0.5', 'S'),
+            ('Trimethoprim/Sulfamethoxazole', '<= 10', 'S'),
+        ]
+
+    def test_right_column_beside_clindamycin_is_trimethoprim(self):
+        ast = 'Inducible Clindamycin POS + <= 1 S\nClindamycin >= 4 R <= 10 S\nTrimethoprim/\nSulfamethoxazole'
+        assert vitek_pdf.parse_ast_table(ast) == [
+            ('Inducible Clindamycin Resistance', 'POS', '+'),
+            ('Clindamycin', '>= 4', 'R'),
+            ('Trimethoprim/Sulfamethoxazole', '<= 10', 'S'),
+        ]
+
+    def test_first_result_wins(self):
+        ast = 'Oxacillin\nVancomycin 2 S Oxacillin 0.5 S\nVancomycin 8 R'
+        assert vitek_pdf.parse_ast_table(ast) == [('Oxacillin', '0.5', 'S'), ('Vancomycin', '2', 'S')]
+
+
+class TestParsePdf:
+    def test_table_spanning_pages(self, tmpdir):
+        path = write_pdf(os.path.join(tmpdir, 'Isolate_ID7-1.pdf'),
+                         report('ID7-1', ['Oxacillin >= 4 R'])[:-1],
+                         ['Vancomycin 1 S', FOOTER])
+        sample_id, rows = vitek_pdf.parse_vitek_pdf(path)
+        assert sample_id == 'ID00007'
+        assert [(r['antibiotic'], r['measurement_sign'], r['measurement'], r['resistance_phenotype'])
+                for r in rows] == [('Oxacillin', '>=', '4', 'R'), ('Vancomycin', '=', '1', 'S')]
+
+    def test_stops_reading_pages_after_footer(self):
+        class Page:
+            def __init__(self, lines):
+                self.text = '\n'.join(lines)
+                self.read = False
+
+            def extract_text(self):
+                self.read = True
+                return self.text
+
+        class Pdf:
+            pages = [Page(REPORT_A), Page(['Comments', 'Vancomycin 8 R'])]
+
+        text = vitek_pdf._report_text(Pdf)
+        assert 'Vancomycin 1 S' in text
+        assert not Pdf.pages[1].read
+
+    def test_unreadable_pdf(self, tmpdir):
+        path = os.path.join(tmpdir, 'Isolate_ID1-1.pdf')
+        with open(path, 'w') as f:
+            f.write('not a pdf')
+        assert vitek_pdf.parse_vitek_pdf(path) == (None, [])
+
+
+class TestDirectoryConversion:
+    def make_reports(self, d):
+        write_pdf(os.path.join(d, 'Isolate_ID1-1.pdf'), ['Isolate: ID1-1', 'No AST card'])
+        write_pdf(os.path.join(d, 'Isolate_ID1-2.pdf'), REPORT_B)
+        write_pdf(os.path.join(d, 'Isolate_ID2-1.pdf'), REPORT_A)
+        write_pdf(os.path.join(d, 'Isolate_ID2-1-kw24533.pdf'), REPORT_B)
+        with open(os.path.join(d, 'Isolate_ID3-1.pdf'), 'w') as f:
+            f.write('not a pdf')
+
+    def test_index_ranks_cultures_and_skips_duplicates(self, tmpdir):
+        self.make_reports(tmpdir)
+        n_pdfs, candidates = vitek_pdf.index_directory(tmpdir)
+        assert n_pdfs == 5
+        assert {sid: [os.path.basename(p) for p in pdfs] for sid, pdfs in candidates.items()} == {
+            'ID00001': ['Isolate_ID1-1.pdf', 'Isolate_ID1-2.pdf'],
+            'ID00002': ['Isolate_ID2-1.pdf'],
+            'ID00003': ['Isolate_ID3-1.pdf'],
+        }
+
+    def test_falls_back_to_next_culture(self, tmpdir):
+        self.make_reports(tmpdir)
+        rows, samples, failed = vitek_pdf.convert_directory(tmpdir, workers=1)
+        assert samples == 3
+        assert failed == ['Isolate_ID3-1.pdf']
+        assert [r['sample_id'] for r in rows][:4] == ['ID00001'] * 4
+        assert {r['antibiotic'] for r in rows if r['sample_id'] == 'ID00002'} >= {
+            'Cefoxitin', 'Inducible Clindamycin Resistance', 'Clindamycin',
+            'Trimethoprim/Sulfamethoxazole'}
+
+    def test_cache_only_parses_new_or_modified(self, tmpdir, monkeypatch):
+        self.make_reports(tmpdir)
+        cache = os.path.join(tmpdir, 'cache.sqlite')
+        first = vitek_pdf.convert_directory(tmpdir, cache, workers=1)
+
+        calls = []
+        read = vitek_pdf.read_report
+        monkeypatch.setattr(vitek_pdf, 'read_report', lambda p: calls.append(p) or read(p))
+        assert vitek_pdf.convert_directory(tmpdir, cache, workers=1) == first
+        assert calls == []
+
+        write_pdf(os.path.join(tmpdir, 'Isolate_ID2-1.pdf'), report('ID2-1', ['Oxacillin >= 4 R']))
+        rows, _, _ = vitek_pdf.convert_directory(tmpdir, cache, workers=1)
+        assert [os.path.basename(p) for p in calls] == ['Isolate_ID2-1.pdf']
+        assert [r['antibiotic'] for r in rows if r['sample_id'] == 'ID00002'] == ['Oxacillin']
+
+    def test_cache_hit_keeps_file_name_sample_id(self, tmpdir, monkeypatch):
+        # No isolate line, so the sample ID can only come from the file name
+        lines = report('ID0-0', ['Oxacillin >= 4 R'])[1:]
+        write_pdf(os.path.join(tmpdir, 'Isolate_ID4-1.pdf'), lines)
+        cache = os.path.join(tmpdir, 'cache.sqlite')
+        rows, _, _ = vitek_pdf.convert_directory(tmpdir, cache, workers=1)
+        assert [r['sample_id'] for r in rows] == ['ID00004']
+
+        calls = []
+        read = vitek_pdf.read_report
+        monkeypatch.setattr(vitek_pdf, 'read_report', lambda p: calls.append(p) or read(p))
+        os.rename(os.path.join(tmpdir, 'Isolate_ID4-1.pdf'), os.path.join(tmpdir, 'Isolate_ID5-1.pdf'))
+        write_pdf(os.path.join(tmpdir, 'Isolate_ID6-1.pdf'), lines)
+        rows, _, _ = vitek_pdf.convert_directory(tmpdir, cache, workers=1)
+        assert calls == []
+        assert [r['sample_id'] for r in rows] == ['ID00005', 'ID00006']
+
+    def test_cli_output_identical_with_pool_and_cache(self, tmpdir):
+        pdfs = os.path.join(tmpdir, 'pdfs')
+        os.makedirs(pdfs)
+        self.make_reports(pdfs)
+        outputs = []
+        for i, extra in enumerate([['--pdf-cache', '', '--workers', '1'], ['--workers', '2'], ['--workers', '2']]):
+            out = os.path.join(tmpdir, f'out{i}.csv')
+            result = subprocess.run(['python', TOOL, 'convert', '--from-vitek-pdf', pdfs, '-o', out, *extra],
+                                    capture_output=True, text=True)
+            assert result.returncode == 0, result.stderr
+            assert 'Isolate_ID3-1.pdf' in result.stderr
+            with open(out, 'rb') as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1] == outputs[2]
+        assert os.path.exists(os.path.join(tmpdir, vitek_pdf.CACHE_NAME))
+        assert not os.path.exists(os.path.join(pdfs, vitek_pdf.CACHE_NAME))
+
+    def test_empty_directory(self, tmpdir):
+        result = subprocess.run(['python', TOOL, 'convert', '--from-vitek-pdf', tmpdir],
+                                capture_output=True, text=True)
+        assert result.returncode == 1
+        assert 'No PDF files found' in result.stderr